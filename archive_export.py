@@ -0,0 +1,197 @@
+# archive_export.py
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from image_ops import FORMAT_EXTENSIONS
+from utils import humanize_size, parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram Bot API на размер документа
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+# Часть для Telegram держится в памяти до этого размера, дальше - во временном файле
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
+# Служебные записи ZIP: локальный заголовок, дескриптор данных и запись центрального каталога
+ZIP_LOCAL_HEADER_SIZE = 30 + 24
+ZIP_CENTRAL_HEADER_SIZE = 46 + 28
+ZIP_END_RECORD_SIZE = 22 + 76
+
+class ArchiveExporter:
+    """Потоковая выгрузка кадров из архива в ZIP с разбиением на части"""
+
+    def __init__(self, storage, part_limit=TELEGRAM_DOCUMENT_LIMIT):
+        self.storage = storage
+        # Небольшой запас на случай расхождения оценки служебных данных
+        self.part_limit = part_limit - 64 * 1024
+        # Отправка части читает ее в память целиком, поэтому части разных выгрузок отправляются по одной
+        self.upload_lock = threading.Lock()
+
+    def _entry_name(self, frame):
+        """Имя файла кадра внутри архива"""
+        extension = FORMAT_EXTENSIONS.get(frame['format'], '.jpg')
+        stamp = frame['timestamp'].strftime('%Y%m%d_%H%M%S')
+        return f"camera_{frame['camera_id']}/{stamp}_{frame['frame_id']}{extension}"
+
+    def _write_frame(self, archive, frame, name):
+        """Запись кадра в архив без промежуточной копии"""
+        info = zipfile.ZipInfo(name, date_time=frame['timestamp'].timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED  # JPEG/WebP уже сжаты
+        info.file_size = frame['size']
+
+        # Источник открывается до создания записи, чтобы отсутствующий кадр не оставил пустую запись
+        if frame['tier'] == 'cold':
+            view = self.storage.read_frame_view(frame)
+            try:
+                with archive.open(info, 'w') as dst:
+                    dst.write(view)
+            finally:
+                view.release()
+        else:
+            with open(frame['file_path'], 'rb') as src, archive.open(info, 'w') as dst:
+                shutil.copyfileobj(src, dst, 256 * 1024)
+
+    def export(self, camera_id, start, end, open_part, close_part):
+        """
+        Выгрузка кадров за период
+
+        Args:
+            camera_id: ID камеры или None для всех камер
+            open_part: open_part(номер) -> файловый объект для записи части
+            close_part: close_part(номер, файловый объект, размер) - вызывается,
+                как только часть готова (например, для отправки в Telegram)
+
+        Returns:
+            dict: статистика выгрузки
+        """
+        started = time.monotonic()
+        stats = {'frames': 0, 'bytes': 0, 'parts': 0, 'skipped': 0}
+
+        part_number = 0
+        part_file = None
+        archive = None
+        part_size = 0
+        central_size = 0
+
+        def finish_part():
+            archive.close()
+            size = part_file.tell()
+            stats['parts'] += 1
+            stats['bytes'] += size
+            close_part(part_number, part_file, size)
+
+        for frame in self.storage.iter_range(camera_id, start, end):
+            name = self._entry_name(frame)
+            name_size = len(name.encode('utf-8'))
+            entry_size = ZIP_LOCAL_HEADER_SIZE + name_size + frame['size']
+            entry_central = ZIP_CENTRAL_HEADER_SIZE + name_size
+
+            if archive is not None and part_size + entry_size + central_size + entry_central + ZIP_END_RECORD_SIZE > self.part_limit:
+                finish_part()
+                archive = None
+
+            if archive is None:
+                part_number += 1
+                part_file = open_part(part_number)
+                archive = zipfile.ZipFile(part_file, 'w', zipfile.ZIP_STORED, allowZip64=True)
+                part_size = 0
+                central_size = 0
+
+            try:
+                self._write_frame(archive, frame, name)
+            except (FileNotFoundError, ValueError) as e:
+                logger.warning(f"Кадр {frame['frame_id']} пропущен при выгрузке: {e}")
+                stats['skipped'] += 1
+                continue
+
+            part_size += entry_size
+            central_size += entry_central
+            stats['frames'] += 1
+
+        if archive is not None:
+            finish_part()
+
+        stats['elapsed'] = time.monotonic() - started
+        stats['rate'] = stats['bytes'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        logger.info(
+            f"Выгрузка завершена: {stats['frames']} кадров, {stats['parts']} частей, "
+            f"{humanize_size(stats['bytes'])} за {stats['elapsed']:.1f} сек ({humanize_size(stats['rate'])}/с)"
+        )
+        return stats
+
+    def export_to_telegram(self, bot, chat_id, camera_id, start, end, filename_prefix):
+        """
+        Выгрузка с отправкой каждой части в чат сразу после ее формирования
+
+        Часть собирается во временном файле (в памяти - только первые
+        EXPORT_SPOOL_SIZE байт) и удаляется после отправки.
+        """
+        def open_part(number):
+            return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE, prefix='export_', suffix='.zip')
+
+        def close_part(number, part_file, size):
+            try:
+                part_file.seek(0)
+                with self.upload_lock:
+                    bot.send_document(
+                        chat_id=chat_id,
+                        document=part_file,
+                        filename=f"{filename_prefix}_part{number}.zip",
+                        caption=f"📦 Часть {number} ({humanize_size(size)})",
+                        timeout=300
+                    )
+            finally:
+                part_file.close()
+
+        return self.export(camera_id, start, end, open_part, close_part)
+
+    def export_to_directory(self, out_dir, camera_id, start, end, filename_prefix):
+        """Выгрузка частей архива в каталог"""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        def open_part(number):
+            return open(out_dir / f"{filename_prefix}_part{number}.zip", 'wb')
+
+        def close_part(number, part_file, size):
+            part_file.close()
+            print(f"  {part_file.name}: {humanize_size(size)}")
+
+        return self.export(camera_id, start, end, open_part, close_part)
+
+def main():
+    """Выгрузка архива из командной строки"""
+    from config import load_config
+    from frame_storage import FrameStorage
+
+    parser = argparse.ArgumentParser(description="Выгрузка кадров из архива в ZIP")
+    parser.add_argument('--camera', default='all', help="ID камеры или all")
+    parser.add_argument('--from', dest='start', required=True, help="Начало периода (ГГГГ-ММ-ДД_ЧЧ:ММ)")
+    parser.add_argument('--to', dest='end', required=True, help="Конец периода (ГГГГ-ММ-ДД_ЧЧ:ММ)")
+    parser.add_argument('--out', default='export', help="Каталог для архивов")
+    parser.add_argument('--part-size', type=int, default=0, help="Размер части в МБ (0 - лимит Telegram)")
+    args = parser.parse_args()
+
+    config = load_config()
+    logging.basicConfig(level=config['log_level'])
+
+    camera_id = None if args.camera == 'all' else int(args.camera)
+    start, end = sorted([parse_datetime(args.start), parse_datetime(args.end)])
+    part_limit = args.part_size * 1024 * 1024 if args.part_size else TELEGRAM_DOCUMENT_LIMIT
+
+    exporter = ArchiveExporter(FrameStorage(config), part_limit)
+    prefix = f"export_{args.camera}_{start.strftime('%Y%m%d_%H%M')}_{end.strftime('%Y%m%d_%H%M')}"
+    stats = exporter.export_to_directory(args.out, camera_id, start, end, prefix)
+
+    print(
+        f"Кадров: {stats['frames']}, частей: {stats['parts']}, "
+        f"объем: {humanize_size(stats['bytes'])}, скорость: {humanize_size(stats['rate'])}/с"
+    )
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,9 @@ def setup_bot_commands(bot, scheduler=None):
             BotCommand("capture", "Сделать снимок"),
             BotCommand("stats", "Статистика работы"),
             BotCommand("chat_id", "Получить ID чата"),
+            BotCommand("history", "Кадры из архива"),
+            BotCommand("export", "Выгрузить архив в ZIP"),
+            BotCommand("burst", "Серия кадров анимацией"),
         ]
         
         # Добавляем команды планировщика если он есть
@@ -23,6 +26,7 @@ def setup_bot_commands(bot, scheduler=None):
                 BotCommand("schedule_start", "Запустить автосбор"),
                 BotCommand("schedule_stop", "Остановить автосбор"),
                 BotCommand("schedule_status", "Статус расписания"),
+                BotCommand("schedule_history", "Журнал запусков"),
                 BotCommand("schedule_set", "Установить расписание"),
                 BotCommand("schedule_cron", "Установить cron-расписание"),
                 BotCommand("schedule_times", "Установить время"),
@@ -50,11 +54,15 @@ def update_commands_description():
 /capture - Сделать снимок с выбранной камеры
 /stats - Статистика работы и хранилища
 /chat_id - Получить ID текущего чата
+/history - Кадры из архива по времени или за период
+/export - Выгрузить архив за период в ZIP (частями по лимиту Telegram)
+/burst - Серия кадров одной анимацией с отчетом о FPS
 
 **Команды расписания (если включено):**
 /schedule_start - Запустить автоматический сбор
 /schedule_stop - Остановить автоматический сбор
 /schedule_status - Показать статус расписания
+/schedule_history - Последние запуски и перцентили длительности этапов
 /schedule_set - Установить расписание (интервал, cron или время)
 /schedule_cron - Установить cron-расписание
 /schedule_times - Установить конкретное время
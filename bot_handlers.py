@@ -2,22 +2,47 @@
 import logging
 import time
 import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-from utils import escape_html, format_timestamp, humanize_size
+from utils import escape_html, format_timestamp, humanize_size, parse_datetime_args
+from archive_export import ArchiveExporter
+from image_ops import FORMAT_EXTENSIONS, make_preview, build_animation
+from quality import describe_reasons
 
 logger = logging.getLogger(__name__)
 
+# Количество кадров на странице /history
+HISTORY_PAGE_SIZE = 10
+
 class BotHandlers:
     """Класс с обработчиками команд бота"""
     
-    def __init__(self, camera_manager, config, scheduler=None):
+    def __init__(self, camera_manager, config, scheduler=None, upload_transformer=None):
         self.camera_manager = camera_manager
         self.scheduler = scheduler
+        # Уменьшение кадров перед отправкой (UploadTransformer или None)
+        self.upload_transformer = upload_transformer
         self.bot_password = config.get('bot_password')
         self.allowed_group_id = config.get('allowed_group_id')
         self.authorized_users = set()  # Для хранения авторизованных пользователей
+        self.exporter = ArchiveExporter(camera_manager.storage)
+        # Предпросмотр для /capture: сначала уменьшенный кадр, оригинал - по кнопке
+        self.preview_max_edge = config.get('capture_preview_max_edge', 0)
+        # Оригиналы последних кадров для кнопки "Полное разрешение" (frame_id -> bytes)
+        self.frame_cache = OrderedDict()
+        self.frame_cache_size = config.get('frame_cache_size', 20)
+        self.frame_cache_lock = threading.Lock()
+        # Серии кадров (/burst)
+        self.burst_format = config.get('burst_format', 'gif')
+        if self.burst_format not in ('gif', 'webp'):
+            logger.warning(f"Неизвестный формат серии '{self.burst_format}', используется gif")
+            self.burst_format = 'gif'
+        self.burst_max_frames = config.get('burst_max_frames', 50)
+        self.burst_max_edge = config.get('burst_max_edge', 640)
         
         # Если пароль не установлен, добавляем всех пользователей
         if not self.bot_password:
@@ -38,6 +63,17 @@ class BotHandlers:
             return True  # Если группа не указана, все чаты разрешены
         return str(chat_id) == str(self.allowed_group_id)
     
+    def check_schedule_leader(self, update: Update):
+        """Изменение расписания не там, где работает лидер (резервный экземпляр отвечает, где его менять)"""
+        holder = self.scheduler.get_other_leader()
+        if not holder:
+            return True
+        update.message.reply_text(
+            f"⚠️ Этот экземпляр резервный, расписание меняется на лидере: <code>{escape_html(holder)}</code>",
+            parse_mode='HTML'
+        )
+        return False
+    
     def check_auth_and_reply(self, update: Update):
         """Проверка авторизации и отправка сообщения, если не авторизован"""
         if update.message:
@@ -191,6 +227,9 @@ class BotHandlers:
 /capture - Выбрать камеру для снимка
 /stats - Статистика работы
 /chat_id - Получить ID текущего чата
+/history - Кадры из архива (камера, время или период)
+/export - Выгрузить архив за период в ZIP
+/burst - Серия кадров анимацией (камера, кадров, интервал)
 """
         if self.scheduler:
             help_text += """
@@ -198,6 +237,7 @@ class BotHandlers:
 /schedule_start - Запустить автосбор
 /schedule_stop - Остановить автосбор
 /schedule_status - Статус расписания
+/schedule_history - Последние запуски и длительность этапов
 /schedule_set - Установить расписание (интервал, cron или время)
 /schedule_cron - Установить cron-расписание
 /schedule_times - Установить конкретное время
@@ -256,9 +296,18 @@ class BotHandlers:
         
         camera_list = "<b>📹 Настроенные камеры:</b>\n\n"
         for cam_id, camera in cameras.items():
-            status = "🟢" if camera['url'] else "🔴"
+            health = self.camera_manager.get_health(cam_id)
+            if not camera['url'] or (health and health['status'] == 'error'):
+                status = "🔴"
+            elif health and health['status'] == 'suspect':
+                status = "🟡"
+            else:
+                status = "🟢"
             camera_list += f"{status} <b>Камера {cam_id}:</b> {escape_html(camera['name'])}\n"
             camera_list += f"   Тип: {camera['type'].upper()}\n"
+            if health and health['status'] != 'ok':
+                reasons = describe_reasons(health['reasons']) if health['status'] == 'suspect' else health['reasons'][0]
+                camera_list += f"   Состояние: {reasons} (с {health['since'].strftime('%d.%m %H:%M')})\n"
             if camera['url']:
                 camera_list += f"   URL: <code>{escape_html(camera['url'][:50])}...</code>\n\n"
             else:
@@ -316,6 +365,8 @@ class BotHandlers:
         
         if query.data == 'capture_all':
             self.capture_all_cameras(query, context)
+        elif query.data.startswith('capture_full_'):
+            self.send_full_frame(query, context, int(query.data.split('_')[2]))
         else:
             camera_id = int(query.data.split('_')[1])
             self.capture_single_camera(query, context, camera_id)
@@ -367,12 +418,34 @@ class BotHandlers:
                 f"✅ Успешно захвачено"
             )
             
+            # Сначала отправляется уменьшенный кадр, оригинал - по кнопке без повторного запроса к камере
+            photo = image_data
+            reply_markup = None
+            preview = None
+            frame_id = result.get('frame_id')
+            if self.preview_max_edge and frame_id:
+                try:
+                    preview = make_preview(image_data.getvalue(), self.preview_max_edge)
+                except Exception as e:
+                    logger.warning(f"Не удалось уменьшить кадр: {e}")
+            if not preview:
+                # Без предпросмотра кадр все равно уменьшается до UPLOAD_MAX_EDGE
+                preview = self._prepare_upload(image_data.getvalue())
+            if preview:
+                if frame_id:
+                    self._cache_frame(frame_id, image_data.getvalue())
+                    reply_markup = InlineKeyboardMarkup([[
+                        InlineKeyboardButton("🔍 Полное разрешение", callback_data=f"capture_full_{frame_id}")
+                    ]])
+                photo = BytesIO(preview)
+            
             try:
                 context.bot.send_photo(
                     chat_id=query.message.chat_id,
-                    photo=image_data,
+                    photo=photo,
                     caption=caption,
-                    parse_mode='HTML'
+                    parse_mode='HTML',
+                    reply_markup=reply_markup
                 )
                 query.edit_message_text(f"✅ Изображение с камеры {camera_id} отправлено", parse_mode='HTML')
             except Exception as e:
@@ -387,6 +460,66 @@ class BotHandlers:
                 parse_mode='HTML'
             )
     
+    def _prepare_upload(self, content):
+        """Уменьшенный для отправки кадр (None, если подготовка отключена или не уменьшила кадр)"""
+        if not self.upload_transformer or not self.upload_transformer.enabled:
+            return None
+        prepared = self.upload_transformer.transform(content)
+        return prepared if prepared is not content else None
+
+    def _cache_frame(self, frame_id, content):
+        """Сохранение оригинала кадра в кэше последних кадров"""
+        with self.frame_cache_lock:
+            self.frame_cache[frame_id] = content
+            self.frame_cache.move_to_end(frame_id)
+            while len(self.frame_cache) > self.frame_cache_size:
+                self.frame_cache.popitem(last=False)
+    
+    def send_full_frame(self, query, context, frame_id):
+        """Отправка оригинала кадра (из кэша или хранилища, без запроса к камере)"""
+        with self.frame_cache_lock:
+            content = self.frame_cache.get(frame_id)
+        
+        # В кэше оригинал (JPEG), в хранилище кадр мог быть перекодирован
+        image_format = 'jpeg'
+        if content is not None:
+            image_data = BytesIO(content)
+        else:
+            image_data = self.camera_manager.read_frame(frame_id)
+        
+        if image_data is None:
+            context.bot.send_message(
+                chat_id=query.message.chat_id,
+                text="❌ Кадр не найден в хранилище",
+                parse_mode='HTML'
+            )
+            return
+        
+        frame = self.camera_manager.storage.get_frame(frame_id)
+        if frame and content is None:
+            image_format = frame['format']
+        extension = FORMAT_EXTENSIONS.get(image_format, '.jpg')
+        filename = f"frame_{frame_id}{extension}"
+        if frame:
+            filename = f"camera{frame['camera_id']}_{frame['timestamp'].strftime('%Y%m%d_%H%M%S')}{extension}"
+        
+        try:
+            # Документом, чтобы Telegram не пережимал кадр
+            context.bot.send_document(
+                chat_id=query.message.chat_id,
+                document=image_data,
+                filename=filename,
+                reply_to_message_id=query.message.message_id
+            )
+            query.edit_message_reply_markup(reply_markup=None)
+        except Exception as e:
+            logger.error(f"Ошибка отправки оригинала кадра: {e}")
+            context.bot.send_message(
+                chat_id=query.message.chat_id,
+                text=f"❌ Ошибка отправки: {escape_html(str(e))}",
+                parse_mode='HTML'
+            )
+    
     def capture_all_cameras(self, query, context):
         """Последовательный захват со всех камер"""
         cameras = self.camera_manager.cameras
@@ -426,11 +559,12 @@ class BotHandlers:
                 image_data.seek(0)
                 
                 caption = f"📸 {escape_html(camera['name'])} ({format_timestamp()})"
+                prepared = self._prepare_upload(image_data.getvalue())
                 
                 try:
                     context.bot.send_photo(
                         chat_id=query.message.chat_id,
-                        photo=image_data,
+                        photo=BytesIO(prepared) if prepared else image_data,
                         caption=caption,
                         parse_mode='HTML'
                     )
@@ -459,6 +593,297 @@ class BotHandlers:
             parse_mode='HTML'
         )
     
+    def burst_command(self, update: Update, context: CallbackContext):
+        """Команда /burst - серия кадров одним анимированным сообщением"""
+        if not self.check_auth_and_reply(update):
+            return
+        
+        usage = (
+            "❌ Укажите камеру\n\n"
+            "Формат: /burst &lt;камера&gt; [кадров] [интервал, сек]\n"
+            "Пример: /burst 1 10 0.5 - 10 кадров через 0.5 с"
+        )
+        try:
+            camera_id = int(context.args[0])
+            count = int(context.args[1]) if len(context.args) > 1 else 10
+            interval = float(context.args[2].replace(',', '.')) if len(context.args) > 2 else 0.5
+        except (IndexError, ValueError):
+            update.message.reply_text(usage, parse_mode='HTML')
+            return
+        
+        camera = self.camera_manager.cameras.get(camera_id)
+        if not camera:
+            update.message.reply_text(f"❌ Камера {camera_id} не найдена", parse_mode='HTML')
+            return
+        if not 2 <= count <= self.burst_max_frames or not 0.05 <= interval <= 60:
+            update.message.reply_text(
+                f"❌ Кадров: от 2 до {self.burst_max_frames}, интервал: от 0.05 до 60 с", parse_mode='HTML'
+            )
+            return
+        
+        status = update.message.reply_text(
+            f"🎞️ Серия с камеры <b>{escape_html(camera['name'])}</b>: {count} кадров через {interval:g} с...",
+            parse_mode='HTML'
+        )
+        result = self.camera_manager.capture_burst(camera_id, count, interval)
+        frames = result['frames']
+        if len(frames) < 2:
+            status.edit_text(f"❌ Серия не получена: {result['error'] or 'получен только один кадр'}", parse_mode='HTML')
+            return
+        
+        # Кадр показывается до следующего кадра, последний - на интервал серии
+        offsets = [offset for offset, _ in frames]
+        durations = [(b - a) * 1000 for a, b in zip(offsets, offsets[1:])] + [interval * 1000]
+        args = ([content for _, content in frames], durations, self.burst_format, self.burst_max_edge)
+        try:
+            if self.upload_transformer:
+                animation = self.upload_transformer.run(build_animation, *args)
+            else:
+                animation = build_animation(*args)
+        except Exception as e:
+            logger.error(f"Ошибка сборки анимации: {e}")
+            status.edit_text(f"❌ Ошибка сборки анимации: {escape_html(str(e))}", parse_mode='HTML')
+            return
+        
+        fps = f"{result['fps']:g}" if result.get('fps') else '-'
+        caption = (
+            f"<b>🎞️ {escape_html(camera['name'])}</b>\n"
+            f"Кадров: {len(frames)}/{count} за {offsets[-1] - offsets[0]:.1f} с "
+            f"({'MJPEG' if result['source'] == 'mjpeg' else 'снимки'})\n"
+            f"FPS: {fps} (цель {result['target_fps']:g})\n"
+            f"Отклонение от расписания: ср. {result['timing_avg_ms']} мс, макс. {result['timing_max_ms']} мс\n"
+            f"Размер: {humanize_size(len(animation))}"
+        )
+        filename = f"burst_{camera_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{self.burst_format}"
+        try:
+            if self.burst_format == 'gif':
+                context.bot.send_animation(
+                    chat_id=update.message.chat_id,
+                    animation=BytesIO(animation),
+                    filename=filename,
+                    caption=caption,
+                    parse_mode='HTML'
+                )
+            else:
+                # Анимированный WebP Telegram принимает только как документ
+                context.bot.send_document(
+                    chat_id=update.message.chat_id,
+                    document=BytesIO(animation),
+                    filename=filename,
+                    caption=caption,
+                    parse_mode='HTML'
+                )
+        except Exception as e:
+            logger.error(f"Ошибка отправки серии: {e}")
+            status.edit_text(f"❌ Ошибка отправки: {escape_html(str(e))}", parse_mode='HTML')
+            return
+        status.delete()
+    
+    def history_command(self, update: Update, context: CallbackContext):
+        """Команда /history - поиск кадров в архиве"""
+        if not self.check_auth_and_reply(update):
+            return
+        
+        usage = (
+            "❌ Укажите камеру и время\n\n"
+            "Примеры:\n"
+            "/history 1 09:00 - ближайший к 9:00 кадр\n"
+            "/history 1 2024-05-01 09:00 - ближайший кадр к дате\n"
+            "/history 1 08:00 10:00 - кадры за период"
+        )
+        
+        if not context.args or len(context.args) < 2:
+            update.message.reply_text(usage, parse_mode='HTML')
+            return
+        
+        try:
+            camera_id = int(context.args[0])
+            moments = parse_datetime_args(context.args[1:])
+        except ValueError as e:
+            update.message.reply_text(f"{usage}\n\n{escape_html(str(e))}", parse_mode='HTML')
+            return
+        
+        if len(moments) == 1:
+            frame = self.camera_manager.storage.find_nearest(camera_id, moments[0])
+            if not frame:
+                update.message.reply_text(f"❌ Нет сохраненных кадров камеры {camera_id}", parse_mode='HTML')
+                return
+            self._send_stored_frame(context.bot, update.message.chat_id, frame, requested=moments[0])
+        elif len(moments) == 2:
+            start, end = sorted(moments)
+            text, reply_markup = self._build_history_page(camera_id, start, end, 0)
+            update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        else:
+            update.message.reply_text(usage, parse_mode='HTML')
+    
+    def handle_history(self, update: Update, context: CallbackContext):
+        """Обработчик кнопок /history (страницы и выбор кадра)"""
+        if not self.check_auth_and_reply(update):
+            return
+        
+        query = update.callback_query
+        query.answer()
+        parts = query.data.split('_')
+        
+        if parts[1] == 'frame':
+            frame = self.camera_manager.storage.get_frame(int(parts[2]))
+            if not frame:
+                context.bot.send_message(
+                    chat_id=query.message.chat_id,
+                    text="❌ Кадр уже удален из архива",
+                    parse_mode='HTML'
+                )
+                return
+            self._send_stored_frame(context.bot, query.message.chat_id, frame)
+        else:
+            camera_id, start_ts, end_ts, offset = map(int, parts[1:5])
+            text, reply_markup = self._build_history_page(
+                camera_id, datetime.fromtimestamp(start_ts), datetime.fromtimestamp(end_ts), offset
+            )
+            query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    
+    def export_command(self, update: Update, context: CallbackContext):
+        """Команда /export - выгрузка архива за период в ZIP"""
+        if not self.check_auth_and_reply(update):
+            return
+        
+        usage = (
+            "❌ Укажите камеру и период\n\n"
+            "Примеры:\n"
+            "/export 1 2024-05-01_00:00 2024-05-02_00:00 - камера 1 за сутки\n"
+            "/export all 08:00 10:00 - все камеры за период сегодня"
+        )
+        
+        if not context.args or len(context.args) < 3:
+            update.message.reply_text(usage, parse_mode='HTML')
+            return
+        
+        try:
+            camera_id = None if context.args[0].lower() == 'all' else int(context.args[0])
+            moments = parse_datetime_args(context.args[1:])
+            if len(moments) != 2:
+                raise ValueError("Нужно указать начало и конец периода")
+            start, end = sorted(moments)
+        except ValueError as e:
+            update.message.reply_text(f"{usage}\n\n{escape_html(str(e))}", parse_mode='HTML')
+            return
+        
+        status_message = update.message.reply_text(
+            f"<b>📦 Выгрузка архива...</b>\n\n"
+            f"Камера: {camera_id if camera_id is not None else 'все'}\n"
+            f"Период: {format_timestamp(start)} — {format_timestamp(end)}",
+            parse_mode='HTML'
+        )
+        
+        prefix = f"export_{context.args[0]}_{start.strftime('%Y%m%d_%H%M')}_{end.strftime('%Y%m%d_%H%M')}"
+        try:
+            stats = self.exporter.export_to_telegram(
+                context.bot, update.message.chat_id, camera_id, start, end, prefix
+            )
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки архива: {e}")
+            status_message.edit_text(f"❌ Ошибка выгрузки: {escape_html(str(e))}", parse_mode='HTML')
+            return
+        
+        if not stats['frames']:
+            status_message.edit_text("❌ Кадров за этот период нет", parse_mode='HTML')
+            return
+        
+        status_message.edit_text(
+            f"<b>📦 Выгрузка завершена</b>\n\n"
+            f"Кадров: {stats['frames']}\n"
+            f"Частей: {stats['parts']}\n"
+            f"Объем: {humanize_size(stats['bytes'])}\n"
+            f"Скорость: {humanize_size(stats['rate'])}/с",
+            parse_mode='HTML'
+        )
+    
+    def _build_history_page(self, camera_id, start, end, offset):
+        """Формирование страницы списка кадров за период"""
+        # Запрашиваем на один кадр больше, чтобы понять, есть ли следующая страница
+        frames = self.camera_manager.storage.list_range(camera_id, start, end, offset, HISTORY_PAGE_SIZE + 1)
+        has_next = len(frames) > HISTORY_PAGE_SIZE
+        frames = frames[:HISTORY_PAGE_SIZE]
+        
+        camera = self.camera_manager.cameras.get(camera_id)
+        camera_name = camera['name'] if camera else f"Камера {camera_id}"
+        
+        text = (
+            f"<b>🗂 Архив: {escape_html(camera_name)}</b>\n"
+            f"{format_timestamp(start)} — {format_timestamp(end)}\n\n"
+        )
+        if not frames:
+            text += "Кадров за этот период нет"
+            return text, None
+        
+        keyboard = []
+        row = []
+        for i, frame in enumerate(frames):
+            text += f"{offset + i + 1}. {format_timestamp(frame['timestamp'])} ({humanize_size(frame['size'])})\n"
+            row.append(InlineKeyboardButton(
+                f"🖼 {format_timestamp(frame['timestamp'], '%H:%M:%S')}",
+                callback_data=f"history_frame_{frame['frame_id']}"
+            ))
+            if len(row) == 2:
+                keyboard.append(row)
+                row = []
+        if row:
+            keyboard.append(row)
+        
+        navigation = []
+        page_data = f"history_{camera_id}_{int(start.timestamp())}_{int(end.timestamp())}"
+        if offset > 0:
+            navigation.append(InlineKeyboardButton(
+                "◀️ Назад", callback_data=f"{page_data}_{max(0, offset - HISTORY_PAGE_SIZE)}"
+            ))
+        if has_next:
+            navigation.append(InlineKeyboardButton(
+                "Вперед ▶️", callback_data=f"{page_data}_{offset + HISTORY_PAGE_SIZE}"
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
+        return text, InlineKeyboardMarkup(keyboard)
+    
+    def _send_stored_frame(self, bot, chat_id, frame, requested=None):
+        """Отправка кадра из архива (повторно использует file_id, если кадр уже отправлялся)"""
+        camera = self.camera_manager.cameras.get(frame['camera_id'])
+        camera_name = camera['name'] if camera else f"Камера {frame['camera_id']}"
+        
+        caption = (
+            f"<b>🗂 {escape_html(camera_name)}</b>\n"
+            f"🕒 {format_timestamp(frame['timestamp'])}"
+        )
+        if requested:
+            delta = abs((frame['timestamp'] - requested).total_seconds())
+            caption += f"\n↔️ Отклонение от запрошенного: {int(delta)} сек"
+        
+        try:
+            if frame['file_id']:
+                bot.send_photo(chat_id=chat_id, photo=frame['file_id'], caption=caption, parse_mode='HTML')
+                return
+            
+            image_data = self.camera_manager.read_frame(frame['frame_id'])
+            if image_data is None:
+                bot.send_message(chat_id=chat_id, text="❌ Не удалось прочитать кадр из архива", parse_mode='HTML')
+                return
+            
+            if frame['format'] not in ('jpeg', 'jpeg-failed'):
+                # Перекодированный кадр (WebP/AVIF) Telegram как фото не примет
+                extension = FORMAT_EXTENSIONS.get(frame['format'], '.jpg')
+                filename = f"camera{frame['camera_id']}_{frame['timestamp'].strftime('%Y%m%d_%H%M%S')}{extension}"
+                bot.send_document(
+                    chat_id=chat_id, document=image_data, filename=filename, caption=caption, parse_mode='HTML'
+                )
+                return
+            
+            message = bot.send_photo(chat_id=chat_id, photo=image_data, caption=caption, parse_mode='HTML')
+            if message and message.photo:
+                self.camera_manager.storage.set_file_id(frame['frame_id'], message.photo[-1].file_id)
+        except Exception as e:
+            logger.error(f"Ошибка отправки кадра из архива: {e}")
+            bot.send_message(chat_id=chat_id, text=f"❌ Ошибка отправки: {escape_html(str(e))}", parse_mode='HTML')
+    
     def stats_command(self, update: Update, context: CallbackContext):
         """Команда /stats - статистика"""
         if not self.check_auth_and_reply(update):
@@ -486,6 +911,25 @@ class BotHandlers:
 • Путь: <code>{self.camera_manager.screenshots_dir.absolute()}</code>
 """
         
+        storage_stats = self.camera_manager.storage.get_stats()
+        if self.camera_manager.storage.mode == 'cas':
+            stats_text += f"• Дубликатов кадров: {storage_stats['deduplicated_frames']} (сэкономлено {humanize_size(storage_stats['bytes_saved'])})\n"
+        if stats.get('roi_bytes_saved'):
+            stats_text += f"• Обрезка по области интереса: сэкономлено {humanize_size(stats['roi_bytes_saved'])}\n"
+        
+        if self.camera_manager.worker_pool:
+            pool_stats = self.camera_manager.worker_pool.get_stats()
+            stats_text += f"\n<b>⚙️ Процессы захвата:</b> {pool_stats['alive']}/{pool_stats['processes']}, в очереди: {pool_stats['pending']}\n"
+        
+        if self.upload_transformer and self.upload_transformer.enabled:
+            upload_stats = self.upload_transformer.get_stats()
+            if upload_stats['frames']:
+                stats_text += (
+                    f"\n<b>📤 Подготовка к отправке:</b> {upload_stats['frames']} кадров, "
+                    f"{humanize_size(upload_stats['bytes_before'])} → {humanize_size(upload_stats['bytes_after'])}, "
+                    f"{upload_stats['seconds'] / upload_stats['frames'] * 1000:.0f} мс/кадр\n"
+                )
+        
         if self.scheduler:
             schedule_status = "🟢 Активно" if self.scheduler.is_running else "🔴 Остановлено"
             schedule_info = self.scheduler.get_schedule_info()
@@ -524,6 +968,8 @@ class BotHandlers:
         if not self.scheduler:
             update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
             return
+        if not self.check_schedule_leader(update):
+            return
         
         self.scheduler.stop()
         update.message.reply_text("✅ Расписание остановлено", parse_mode='HTML')
@@ -541,18 +987,124 @@ class BotHandlers:
         next_run = self.scheduler.get_next_run_info()
         schedule_info = self.scheduler.get_schedule_info()
         last_execution = format_timestamp(self.scheduler.last_execution) if self.scheduler.last_execution else "никогда"
+        role = ""
+        if self.scheduler.lease:
+            if self.scheduler.is_leader:
+                role = " (лидер)"
+            else:
+                holder = self.scheduler.lease.get_holder()
+                role = f" (резерв, лидер: {escape_html(holder)})" if holder else " (резерв)"
         
         status_text = f"""
 <b>⏰ Статус расписания:</b>
 
-• Статус: {status}
+• Статус: {status}{role}
 • Режим: {schedule_info}
 • Следующий запуск: {next_run}
 • Всего выполнено: {self.scheduler.execution_count} раз
 • Последний запуск: {last_execution}
 """
+        default_job = self.scheduler.default_job
+        if default_job and default_job.last_duration is not None:
+            status_text += f"• Длительность прохода: {default_job.last_duration:.1f} с"
+            if default_job.last_interval:
+                status_text += f" ({default_job.last_duration / default_job.last_interval:.0%} интервала)"
+            status_text += "\n"
+        if self.scheduler.overlap_policy != 'queue_one' or self.scheduler.stagger_seconds or self.scheduler.jitter_seconds:
+            status_text += (
+                f"• Наложение: {self.scheduler.overlap_policy}, разнос: {self.scheduler.stagger_seconds:g} с, "
+                f"jitter: {self.scheduler.jitter_seconds:g} с\n"
+            )
+        skew_info = self.scheduler.get_skew_info()
+        if skew_info:
+            status_text += "\n<b>🎯 Отклонение времени кадра:</b>\n"
+            for entry in skew_info:
+                status_text += (
+                    f"• {escape_html(entry['camera_name'])}: {entry['last']:+.2f} с "
+                    f"(среднее {entry['avg_abs']:.2f} с, макс. {entry['max_abs']:.2f} с, опережение {entry['lead']:.2f} с)\n"
+                )
+        upcoming = self.scheduler.next_n(5)
+        if upcoming:
+            status_text += "\n<b>📅 Ближайшие запуски:</b>\n"
+            status_text += "".join(f"• {format_timestamp(run_time)}\n" for run_time in upcoming)
+        jobs = self.scheduler.get_jobs_info()
+        if len(jobs) > 1 or (jobs and jobs[0]['id'] != 'default'):
+            status_text += "\n<b>📋 Задания:</b>\n"
+            for job in jobs:
+                job_next_run = format_timestamp(job['next_run']) if job['next_run'] else "не определено"
+                status_text += (
+                    f"• <b>{escape_html(job['name'])}</b>: {escape_html(job['schedule'])}\n"
+                    f"   Камеры: {escape_html(job['cameras'])}, следующий запуск: {job_next_run}, "
+                    f"выполнено: {job['execution_count']}\n"
+                )
+                if job['last_duration'] is not None:
+                    status_text += f"   Проход: {job['last_duration']:.1f} с"
+                    if job['last_interval']:
+                        status_text += f" из {job['last_interval']:.0f} с"
+                    status_text += f", пропущено: {job['skipped_count']}, превышений: {job['overrun_count']}\n"
         update.message.reply_text(status_text, parse_mode='HTML')
     
+    def schedule_history(self, update: Update, context: CallbackContext):
+        """Последние запуски расписания и перцентили длительности этапов"""
+        if not self.check_auth_and_reply(update):
+            return
+            
+        if not self.scheduler:
+            update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
+            return
+        
+        if not self.scheduler.journal:
+            update.message.reply_text("❌ Журнал запусков отключен (SCHEDULE_JOURNAL_FILE)", parse_mode='HTML')
+            return
+        
+        limit = 10
+        if context.args:
+            if not context.args[0].isdigit():
+                update.message.reply_text("❌ Использование: /schedule_history [количество]", parse_mode='HTML')
+                return
+            limit = max(1, min(int(context.args[0]), 30))
+        
+        history = self.scheduler.get_history(limit)
+        if not history['runs']:
+            update.message.reply_text("📭 Запусков пока не было", parse_mode='HTML')
+            return
+        
+        text = f"<b>🗂 Последние запуски ({len(history['runs'])}):</b>\n\n"
+        for run in history['runs']:
+            cameras = run.get('cameras', [])
+            failed = len([c for c in cameras if c.get('error')])
+            total_bytes = sum(c.get('bytes') or 0 for c in cameras)
+            retries = sum(c.get('retries') or 0 for c in cameras)
+            started = datetime.fromisoformat(run['started'])
+            text += f"• {format_timestamp(started)} [{escape_html(', '.join(run.get('jobs', [])))}] {run['duration']:.1f} с"
+            if run.get('capture_seconds') is not None:
+                text += f" (захват {run['capture_seconds']:.1f} с, отправка {run.get('upload_seconds', 0):.1f} с)"
+            text += f"\n   ✅ {len(cameras) - failed} ❌ {failed}, {humanize_size(total_bytes)}"
+            if retries:
+                text += f", повторов: {retries}"
+            if run.get('lag') is not None:
+                text += f", сдвиг старта: {run['lag']:+.1f} с"
+            if run.get('error'):
+                text += f"\n   ⚠️ {escape_html(run['error'][:100])}"
+            text += "\n"
+        
+        names = {
+            'duration': 'Проход',
+            'capture': 'Захват',
+            'upload': 'Отправка',
+            'camera_latency': 'Ответ камеры',
+            'lag': 'Сдвиг старта',
+            'skew': 'Отклонение кадра'
+        }
+        if history['summary']:
+            text += "\n<b>📈 Перцентили (p50 / p90 / p99), с:</b>\n"
+            for key, name in names.items():
+                stats = history['summary'].get(key)
+                if stats:
+                    text += f"• {name}: {stats['p50']:.2f} / {stats['p90']:.2f} / {stats['p99']:.2f} (n={stats['count']})\n"
+        
+        update.message.reply_text(text, parse_mode='HTML')
+    
     def schedule_set(self, update: Update, context: CallbackContext):
         """Установка расписания (интервал, cron или время)"""
         if not self.check_auth_and_reply(update):
@@ -561,6 +1113,8 @@ class BotHandlers:
         if not self.scheduler:
             update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
             return
+        if not self.check_schedule_leader(update):
+            return
         
         if not context.args:
             update.message.reply_text(
@@ -624,6 +1178,8 @@ class BotHandlers:
         if not self.scheduler:
             update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
             return
+        if not self.check_schedule_leader(update):
+            return
         
         if not context.args:
             update.message.reply_text(
@@ -669,6 +1225,8 @@ class BotHandlers:
         if not self.scheduler:
             update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
             return
+        if not self.check_schedule_leader(update):
+            return
         
         if not context.args:
             update.message.reply_text(
@@ -719,6 +1277,8 @@ class BotHandlers:
         if not self.scheduler:
             update.message.reply_text("❌ Планировщик не инициализирован", parse_mode='HTML')
             return
+        if not self.check_schedule_leader(update):
+            return
         
         if not context.args:
             update.message.reply_text(
@@ -0,0 +1,225 @@
+# capture_workers.py
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Количество точек каждого процесса на кольце (чем больше, тем равномернее распределение камер)
+RING_REPLICAS = 100
+# Счетчики CameraManager.stats, которые ведутся в процессе захвата (остальные родитель
+# считает сам по результатам)
+WORKER_CAMERA_COUNTERS = ('roi_bytes_saved',)
+
+class HashRing:
+    """
+    Консистентное хэширование камер по процессам
+
+    При изменении числа процессов переезжает только часть камер (примерно 1/N),
+    остальные остаются в своем процессе вместе с его соединениями.
+    """
+
+    def __init__(self, nodes, replicas: int = RING_REPLICAS):
+        points = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.keys = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], 'big')
+
+    def get_node(self, key):
+        """Процесс, обслуживающий ключ"""
+        index = bisect.bisect(self.keys, self._hash(str(key))) % len(self.keys)
+        return self.nodes[index]
+
+def _worker_main(index, config, requests_queue, results_queue):
+    """Цикл процесса захвата: запросы выполняются в пуле потоков процесса"""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s',
+        level=config['log_level']
+    )
+    # Импорт внутри процесса: модуль камер не нужен родителю при старте процессов
+    from camera_manager import CameraManager
+
+    manager = CameraManager(config)
+    executor = ThreadPoolExecutor(max_workers=manager.capture_workers, thread_name_prefix='capture')
+    stats_lock = threading.Lock()
+    sent = {'camera': {}, 'storage': {}}
+
+    def stats_delta():
+        # Прирост счетчиков процесса с прошлой отправки: сумма приростов по всем
+        # результатам равна счетчикам процесса, даже если захваты идут параллельно
+        current = {
+            'camera': {key: manager.stats[key] for key in WORKER_CAMERA_COUNTERS},
+            'storage': manager.storage.get_stats()
+        }
+        with stats_lock:
+            delta = {
+                group: {key: value - sent[group].get(key, 0) for key, value in values.items()}
+                for group, values in current.items()
+            }
+            for group, values in delta.items():
+                for key, value in values.items():
+                    sent[group][key] = sent[group].get(key, 0) + value
+        return delta
+
+    def run(request_id, camera_id, deadline, profile, scheduled):
+        # deadline - по time.monotonic(), эти часы общие для процессов системы
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            result = manager.capture_image(camera_id, profile, scheduled)
+        except Exception as e:
+            result = {'file_path': None, 'image_data': None, 'error': f"Ошибка процесса захвата: {e}"}
+        results_queue.put((request_id, result, stats_delta()))
+
+    logger.info(f"Процесс захвата {index} запущен ({len(manager.cameras)} камер в конфигурации)")
+    while True:
+        item = requests_queue.get()
+        if item is None:
+            break
+        executor.submit(run, *item)
+    executor.shutdown(wait=True)
+
+class CaptureWorkerPool:
+    """
+    Процессы захвата и обработки кадров
+
+    Каждая камера закреплена за процессом консистентным хэшированием. Процесс
+    сам выполняет запрос к камере, хэширование и сохранение кадра, родителю
+    возвращается только результат, поэтому работа с изображениями не
+    конкурирует за GIL процесса бота.
+    """
+
+    def __init__(self, config, processes: int, on_stats=None):
+        """
+        Args:
+            on_stats: вызывается с приростом счетчиков процесса ({'camera': {...},
+                'storage': {...}}) перед передачей каждого результата
+        """
+        # Процессы создают собственный CameraManager без вложенного пула
+        self.config = dict(config, capture_processes=0)
+        self.processes = processes
+        self.context = multiprocessing.get_context('spawn')
+        self.request_queues = [self.context.Queue() for _ in range(processes)]
+        self.results_queue = self.context.Queue()
+        self.workers = [None] * processes
+        self.ring = HashRing(range(processes))
+        self.on_stats = on_stats
+
+        # Ожидание результата: все попытки с таймаутом плюс запас на сохранение
+        self.result_timeout = config['timeout'] * max(1, config['retry_count']) * 2 + 30
+
+        self.futures = {}
+        self.lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self.stop_event = threading.Event()
+        self.collector: threading.Thread = None
+
+    def start(self):
+        """Запуск процессов и потока приема результатов"""
+        for index in range(self.processes):
+            self._start_worker(index)
+        self.stop_event.clear()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        logger.info(f"Запущено процессов захвата: {self.processes}")
+
+    def _start_worker(self, index: int):
+        process = self.context.Process(
+            target=_worker_main,
+            args=(index, self.config, self.request_queues[index], self.results_queue),
+            name=f'capture-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        self.workers[index] = process
+
+    def stop(self):
+        """Остановка процессов"""
+        self.stop_event.set()
+        for request_queue in self.request_queues:
+            request_queue.put(None)
+        for process in self.workers:
+            if process:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+        if self.collector:
+            self.collector.join(timeout=5)
+        logger.info("Процессы захвата остановлены")
+
+    def _collect(self):
+        """Передача результатов из процессов ожидающим Future"""
+        while not self.stop_event.is_set():
+            try:
+                request_id, result, stats = self.results_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self.on_stats:
+                try:
+                    self.on_stats(stats)
+                except Exception as e:
+                    logger.warning(f"Не удалось учесть статистику процесса захвата: {e}")
+            with self.lock:
+                future = self.futures.pop(request_id, None)
+            if future:
+                future.set_result(result)
+
+    def get_worker(self, key) -> int:
+        """Номер процесса, обслуживающего камеру (ключ - ID камеры или ключ распределения)"""
+        return self.ring.get_node(key)
+
+    def submit(self, camera_id, delay: float = 0, shard_key=None, profile: str = 'main',
+               scheduled: bool = False) -> Future:
+        """
+        Постановка захвата в процесс камеры
+
+        Args:
+            delay: задержка запроса в секундах
+            shard_key: ключ распределения (по умолчанию ID камеры)
+            profile: профиль снимка (main или preview)
+            scheduled: плановый кадр (хэши и предыдущие кадры для анализа хранит процесс камеры)
+        """
+        index = self.get_worker(camera_id if shard_key is None else shard_key)
+        process = self.workers[index]
+        if process is None or not process.is_alive():
+            # Процесс упал - перезапускаем, необработанные запросы остались в его очереди
+            logger.warning(f"Процесс захвата {index} не работает, перезапуск")
+            self._start_worker(index)
+
+        future = Future()
+        request_id = next(self._request_ids)
+        with self.lock:
+            self.futures[request_id] = future
+        self.request_queues[index].put((request_id, camera_id, time.monotonic() + delay, profile, scheduled))
+        return future
+
+    def forget(self, future: Future):
+        """Отказ от ожидания результата (после таймаута)"""
+        with self.lock:
+            for request_id, pending in list(self.futures.items()):
+                if pending is future:
+                    del self.futures[request_id]
+
+    def get_stats(self) -> dict:
+        """Состояние процессов"""
+        with self.lock:
+            pending = len(self.futures)
+        return {
+            'processes': self.processes,
+            'alive': len([p for p in self.workers if p and p.is_alive()]),
+            'pending': pending
+        }
@@ -16,20 +16,110 @@ def load_config():
         'admin_chat_id': os.getenv('ADMIN_CHAT_ID'),
         'bot_password': os.getenv('BOT_PASSWORD', ''),
         'allowed_group_id': os.getenv('ALLOWED_GROUP_ID'),
+        'storage_mode': os.getenv('STORAGE_MODE', 'files').lower(),
+        'cold_tier_hours': int(os.getenv('COLD_TIER_HOURS', 0)),
+        'storage_maintenance_interval': int(os.getenv('STORAGE_MAINTENANCE_INTERVAL', 60)),
+        'transcode_age_hours': int(os.getenv('TRANSCODE_AGE_HOURS', 0)),
+        'transcode_format': os.getenv('TRANSCODE_FORMAT', 'webp').lower(),
+        'transcode_quality': int(os.getenv('TRANSCODE_QUALITY', 70)),
+        'transcode_max_kb': int(os.getenv('TRANSCODE_MAX_KB', 0)),
+        'transcode_workers': int(os.getenv('TRANSCODE_WORKERS', 0)),
+        'capture_workers': int(os.getenv('CAPTURE_WORKERS', 4)),
+        'capture_processes': int(os.getenv('CAPTURE_PROCESSES', 0)),
+        'capture_preview_max_edge': int(os.getenv('CAPTURE_PREVIEW_MAX_EDGE', 1280)),
+        'preview_retry_minutes': int(os.getenv('PREVIEW_RETRY_MINUTES', 30)),
+        'frame_cache_size': int(os.getenv('FRAME_CACHE_SIZE', 20)),
+        # Уменьшение кадров перед отправкой в Telegram (0 - отправлять как есть)
+        'upload_max_edge': int(os.getenv('UPLOAD_MAX_EDGE', 0)),
+        'upload_quality': int(os.getenv('UPLOAD_QUALITY', 85)),
+        'upload_max_kb': int(os.getenv('UPLOAD_MAX_KB', 0)),
+        'upload_workers': int(os.getenv('UPLOAD_WORKERS', 2)),
+        # Кадры по расписанию без изменений относительно предыдущего
+        'duplicate_policy': os.getenv('DUPLICATE_POLICY', 'off').strip().lower(),
+        'duplicate_threshold': int(os.getenv('DUPLICATE_THRESHOLD', 4)),
+        # Оценка изменений между плановыми кадрами (процент изменившихся пикселей)
+        'change_detection': os.getenv('CHANGE_DETECTION', 'false').lower() == 'true',
+        'change_alert_threshold': float(os.getenv('CHANGE_ALERT_THRESHOLD', 0)),
+        # Серии кадров (/burst): gif или webp
+        'burst_format': os.getenv('BURST_FORMAT', 'gif').strip().lower(),
+        'burst_max_frames': int(os.getenv('BURST_MAX_FRAMES', 50)),
+        'burst_max_edge': int(os.getenv('BURST_MAX_EDGE', 640)),
+        'burst_pipeline': int(os.getenv('BURST_PIPELINE', 2)),
+        # Проверка качества кадров (темные, однотонные, размытые, зависшие)
+        'quality_check': os.getenv('QUALITY_CHECK', 'false').lower() == 'true',
+        'quality_dark_level': float(os.getenv('QUALITY_DARK_LEVEL', 12)),
+        'quality_blur_threshold': float(os.getenv('QUALITY_BLUR_THRESHOLD', 20)),
+        'quality_frozen_frames': int(os.getenv('QUALITY_FROZEN_FRAMES', 3)),
+        # Таймлапсы за сутки из архива (AVI, MJPEG)
+        'timelapse_enabled': os.getenv('TIMELAPSE_ENABLED', 'false').lower() == 'true',
+        'timelapse_dir': os.getenv('TIMELAPSE_DIR') or None,
+        'timelapse_width': int(os.getenv('TIMELAPSE_WIDTH', 1280)),
+        'timelapse_fps': float(os.getenv('TIMELAPSE_FPS', 24)),
+        'timelapse_quality': int(os.getenv('TIMELAPSE_QUALITY', 80)),
+        'timelapse_workers': int(os.getenv('TIMELAPSE_WORKERS', 2)),
     }
     
     # Загрузка настроек расписания в новом формате
     schedule_enabled = os.getenv('SCHEDULE_ENABLED', 'false').lower() == 'true'
     schedule_config = os.getenv('SCHEDULE_CONFIG')
     
+    # Дополнительные задания: SCHEDULE_JOB_1_SCHEDULE, SCHEDULE_JOB_1_CAMERAS, ...
+    schedule_jobs = []
+    i = 1
+    while os.getenv(f'SCHEDULE_JOB_{i}_SCHEDULE'):
+        cameras = os.getenv(f'SCHEDULE_JOB_{i}_CAMERAS', 'all').strip()
+        chats = os.getenv(f'SCHEDULE_JOB_{i}_CHATS', '')
+        schedule_jobs.append({
+            'id': f'job{i}',
+            'name': os.getenv(f'SCHEDULE_JOB_{i}_NAME') or f'Задание {i}',
+            'schedule': os.getenv(f'SCHEDULE_JOB_{i}_SCHEDULE'),
+            'cameras': None if cameras.lower() in ('', 'all') else [c.strip() for c in cameras.split(',') if c.strip()],
+            'chats': [int(c) for c in chats.split(',') if c.strip()]
+        })
+        i += 1
+    
     # Если не указан новый формат, используем старый для обратной совместимости
     if not schedule_config:
-        interval_minutes = int(os.getenv('SCHEDULE_INTERVAL', '60'))
-        schedule_config = interval_minutes
+        interval_minutes = os.getenv('SCHEDULE_INTERVAL')
+        if interval_minutes or not schedule_jobs:
+            schedule_config = int(interval_minutes or '60')
+    
+    # Ночная сборка таймлапсов за прошедшие сутки (отправляется в ADMIN_CHAT_ID)
+    if config['timelapse_enabled']:
+        cameras = os.getenv('TIMELAPSE_CAMERAS', 'all').strip()
+        schedule_jobs.append({
+            'id': 'timelapse',
+            'name': 'Таймлапс',
+            'schedule': os.getenv('TIMELAPSE_SCHEDULE', '30 0 * * *'),
+            'cameras': None if cameras.lower() in ('', 'all') else [c.strip() for c in cameras.split(',') if c.strip()],
+            'chats': [],
+            'kind': 'timelapse'
+        })
     
     config['schedule'] = {
         'enabled': schedule_enabled,
-        'config': schedule_config
+        'config': schedule_config,
+        'jobs': schedule_jobs,
+        'overlap_policy': os.getenv('SCHEDULE_OVERLAP_POLICY', 'queue_one').strip().lower(),
+        'max_parallel': int(os.getenv('SCHEDULE_MAX_PARALLEL', 2)),
+        'run_workers': int(os.getenv('SCHEDULE_RUN_WORKERS', 8)),
+        'stagger_seconds': float(os.getenv('SCHEDULE_STAGGER_SECONDS', 0)),
+        'jitter_seconds': float(os.getenv('SCHEDULE_JITTER_SECONDS', 0)),
+        'state_file': os.getenv('SCHEDULE_STATE_FILE', 'scheduler_state.json'),
+        'misfire_policy': os.getenv('SCHEDULE_MISFIRE_POLICY', 'run_once').strip().lower(),
+        'misfire_grace_minutes': int(os.getenv('SCHEDULE_MISFIRE_GRACE_MINUTES', 60)),
+        'misfire_max_runs': int(os.getenv('SCHEDULE_MISFIRE_MAX_RUNS', 10)),
+        'misfire_delay_seconds': float(os.getenv('SCHEDULE_MISFIRE_DELAY_SECONDS', 30)),
+        'misfire_cooldown_minutes': int(os.getenv('SCHEDULE_MISFIRE_COOLDOWN_MINUTES', 10)),
+        'prefetch_max_seconds': float(os.getenv('SCHEDULE_PREFETCH_MAX_SECONDS', 10)),
+        'journal_file': os.getenv('SCHEDULE_JOURNAL_FILE', 'scheduler_journal.jsonl') or None,
+        'capture_profile': os.getenv('SCHEDULE_PROFILE', 'preview').strip().lower(),
+        'leader_lease': os.getenv('SCHEDULE_LEADER_LEASE', 'false').lower() == 'true',
+        'lease_ttl': float(os.getenv('SCHEDULE_LEASE_TTL', 15)),
+        'mosaic': os.getenv('SCHEDULE_MOSAIC', 'false').lower() == 'true',
+        'mosaic_tile_width': int(os.getenv('SCHEDULE_MOSAIC_TILE_WIDTH', 480)),
+        'mosaic_max_tiles': int(os.getenv('SCHEDULE_MOSAIC_MAX_TILES', 36)),
+        'skip_suspect': os.getenv('SCHEDULE_SKIP_SUSPECT', 'false').lower() == 'true'
     }
     
     # Настройки отключения команд
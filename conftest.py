@@ -0,0 +1,3 @@
+# conftest.py
+# test_camera.py и test_isapi.py - ручные проверки подключения к камерам, не тесты pytest
+collect_ignore = ['test_camera.py', 'test_isapi.py']
@@ -0,0 +1,198 @@
+# cron.py
+import calendar
+from datetime import datetime
+from typing import List, Optional
+
+MONTH_NAMES = {name.upper(): i for i, name in enumerate(calendar.month_abbr) if name}
+WEEKDAY_NAMES = {'SUN': 0, 'MON': 1, 'TUE': 2, 'WED': 3, 'THU': 4, 'FRI': 5, 'SAT': 6}
+
+# Поля cron: имя, минимум, максимум, имена значений
+FIELDS = [
+    ('minute', 0, 59, {}),
+    ('hour', 0, 23, {}),
+    ('day', 1, 31, {}),
+    ('month', 1, 12, MONTH_NAMES),
+    ('weekday', 0, 7, WEEKDAY_NAMES),
+]
+
+# Сколько лет вперед искать запуск, прежде чем считать выражение невыполнимым (например, 30 февраля)
+MAX_SEARCH_YEARS = 8
+
+def _next_bit(mask: int, start: int) -> Optional[int]:
+    """Номер младшего установленного бита mask, не меньший start"""
+    shifted = mask >> start
+    if not shifted:
+        return None
+    return start + (shifted & -shifted).bit_length() - 1
+
+class CronExpression:
+    """
+    Скомпилированное cron-выражение (минута час день месяц день_недели)
+
+    Каждое поле хранится как битовая маска допустимых значений, поэтому
+    следующий запуск вычисляется поиском ближайшего бита в каждом поле,
+    без перебора минут. Поддерживаются списки, диапазоны, шаги
+    (в том числе для диапазонов: 9-17/2), имена месяцев и дней недели.
+    День недели: 0 или 7 - воскресенье. Если заданы и день месяца,
+    и день недели, запуск происходит при совпадении любого из них (как в cron).
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        parts = self.expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron-выражение должно содержать 5 полей: {expression}")
+
+        masks = {}
+        for part, (name, low, high, names) in zip(parts, FIELDS):
+            masks[name] = self._parse_field(part, name, low, high, names)
+
+        self.minutes = masks['minute']
+        self.hours = masks['hour']
+        self.days = masks['day']
+        self.months = masks['month']
+        # 7 - тоже воскресенье
+        weekdays = masks['weekday']
+        if weekdays & (1 << 7):
+            weekdays = (weekdays | 1) & 0x7F
+        self.weekdays = weekdays
+
+        # Поле считается неограниченным, если начинается с '*' (семантика Vixie cron)
+        self.day_restricted = not parts[2].startswith('*')
+        self.weekday_restricted = not parts[4].startswith('*')
+
+    @staticmethod
+    def _parse_value(value: str, name: str, names: dict) -> int:
+        """Число или имя значения поля"""
+        upper = value.upper()
+        if upper in names:
+            return names[upper]
+        if not value.isdigit():
+            raise ValueError(f"Некорректное значение поля {name}: {value}")
+        return int(value)
+
+    def _parse_field(self, field: str, name: str, low: int, high: int, names: dict) -> int:
+        """Разбор поля в битовую маску"""
+        mask = 0
+        for item in field.split(','):
+            if not item:
+                raise ValueError(f"Пустой элемент в поле {name}: {field}")
+
+            step = 1
+            if '/' in item:
+                item, step_str = item.split('/', 1)
+                if not step_str.isdigit() or int(step_str) == 0:
+                    raise ValueError(f"Некорректный шаг в поле {name}: {step_str}")
+                step = int(step_str)
+
+            if item in ('*', '?'):
+                start, end = low, high
+                if name == 'weekday':
+                    end = 6
+            elif '-' in item:
+                start_str, end_str = item.split('-', 1)
+                start = self._parse_value(start_str, name, names)
+                end = self._parse_value(end_str, name, names)
+            else:
+                start = self._parse_value(item, name, names)
+                # "5/15" - с 5 до конца диапазона с шагом 15
+                end = high if step > 1 else start
+
+            if not (low <= start <= high and low <= end <= high) or start > end:
+                raise ValueError(f"Значение поля {name} вне диапазона {low}-{high}: {item}")
+
+            for value in range(start, end + 1, step):
+                mask |= 1 << value
+
+        return mask
+
+    def _day_mask(self, year: int, month: int) -> int:
+        """Маска подходящих дней месяца (бит d - день d)"""
+        days_in_month = calendar.monthrange(year, month)[1]
+        month_days = ((1 << days_in_month) - 1) << 1
+
+        # Маска дней недели, развернутая на дни месяца: день d имеет день недели (first + d - 1) % 7
+        first_weekday = (calendar.weekday(year, month, 1) + 1) % 7  # cron: воскресенье = 0
+        rotated = ((self.weekdays >> first_weekday) | (self.weekdays << (7 - first_weekday))) & 0x7F
+        weekday_days = 0
+        for week in range(6):
+            weekday_days |= rotated << (1 + week * 7)
+        weekday_days &= month_days
+
+        day_days = self.days & month_days
+
+        if self.day_restricted and self.weekday_restricted:
+            return day_days | weekday_days
+        if self.day_restricted:
+            return day_days
+        if self.weekday_restricted:
+            return weekday_days
+        return month_days
+
+    def matches(self, dt: datetime) -> bool:
+        """Проверяет, соответствует ли время выражению"""
+        return bool(
+            self.minutes >> dt.minute & 1
+            and self.hours >> dt.hour & 1
+            and self.months >> dt.month & 1
+            and self._day_mask(dt.year, dt.month) >> dt.day & 1
+        )
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """Ближайший запуск строго после after (None, если выражение невыполнимо)"""
+        year, month = after.year, after.month
+        day, hour, minute = after.day, after.hour, after.minute + 1
+        if minute > 59:
+            # Переход на следующий час (и дальше) выполняется через поиск ниже
+            minute, hour = 0, hour + 1
+        if hour > 23:
+            hour, day = 0, day + 1
+
+        while year <= after.year + MAX_SEARCH_YEARS:
+            next_month = _next_bit(self.months, month)
+            if next_month is None:
+                year, month, day, hour, minute = year + 1, 1, 1, 0, 0
+                continue
+            if next_month != month:
+                month, day, hour, minute = next_month, 1, 0, 0
+
+            next_day = _next_bit(self._day_mask(year, month), day)
+            if next_day is None:
+                month, day, hour, minute = month + 1, 1, 0, 0
+                if month > 12:
+                    year, month = year + 1, 1
+                continue
+            if next_day != day:
+                day, hour, minute = next_day, 0, 0
+
+            next_hour = _next_bit(self.hours, hour)
+            if next_hour is None:
+                day, hour, minute = day + 1, 0, 0
+                continue
+            if next_hour != hour:
+                hour, minute = next_hour, 0
+
+            next_minute = _next_bit(self.minutes, minute)
+            if next_minute is None:
+                hour, minute = hour + 1, 0
+                if hour > 23:
+                    day, hour = day + 1, 0
+                continue
+
+            return datetime(year, month, day, hour, next_minute)
+
+        return None
+
+    def next_n(self, k: int, after: Optional[datetime] = None) -> List[datetime]:
+        """Ближайшие k запусков"""
+        result = []
+        current = after or datetime.now()
+        for _ in range(k):
+            current = self.next_after(current)
+            if current is None:
+                break
+            result.append(current)
+        return result
+
+    def __str__(self):
+        return self.expression
@@ -0,0 +1,575 @@
+# frame_storage.py
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class FrameStorage:
+    """Хранилище кадров с индексом и опциональной дедупликацией по содержимому"""
+
+    FRAME_COLUMNS = 'id, camera_id, ts, hash, size, path, tier, offset, format, file_id, change_score'
+
+    def __init__(self, config):
+        """
+        Инициализация хранилища
+
+        Режимы (STORAGE_MODE):
+            - files: кадр сохраняется отдельным файлом с меткой времени (как раньше)
+            - cas: кадр сохраняется по хэшу содержимого, одинаковые кадры хранятся один раз
+        """
+        self.root = Path(config['screenshots_dir'])
+        self.root.mkdir(exist_ok=True)
+        self.mode = config.get('storage_mode', 'files')
+        self.objects_dir = self.root / 'objects'
+        self.segments_dir = self.root / 'segments'
+        self.index_path = self.root / 'index.db'
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._init_schema()
+
+        # Открытые отображения сегментов: путь -> (файл, mmap)
+        self._segment_maps = {}
+
+        self.stats = {
+            'stored_frames': 0,
+            'deduplicated_frames': 0,
+            'bytes_written': 0,
+            'bytes_saved': 0
+        }
+
+        logger.info(f"Хранилище кадров: {self.root} (режим '{self.mode}')")
+
+    def _init_schema(self):
+        """Создание таблиц индекса"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS frames (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    camera_id INTEGER NOT NULL,
+                    ts REAL NOT NULL,
+                    hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    path TEXT NOT NULL
+                )
+            """)
+            self._ensure_column('frames', 'tier', "TEXT NOT NULL DEFAULT 'hot'")
+            self._ensure_column('frames', 'offset', 'INTEGER')
+            self._ensure_column('frames', 'format', "TEXT NOT NULL DEFAULT 'jpeg'")
+            self._ensure_column('frames', 'original_size', 'INTEGER')
+            self._ensure_column('frames', 'file_id', 'TEXT')
+            self._ensure_column('frames', 'change_score', 'REAL')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_frames_camera_ts ON frames (camera_id, ts)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_frames_hash ON frames (hash)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_frames_path ON frames (path)')
+
+    def _ensure_column(self, table, column, definition):
+        """Добавление колонки в существующую таблицу индекса"""
+        columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Транзакция с блокировкой записи индекса (BEGIN IMMEDIATE)
+
+        Блокировка SQLite общая для всех процессов, работающих с хранилищем
+        (процессы захвата), поэтому поиск объекта для дедупликации и удаление
+        объектов при упаковке и очистке не пересекаются.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _object_path(self, digest, extension='.jpg'):
+        """Путь к объекту по хэшу (двухуровневая раскладка, чтобы не раздувать каталог)"""
+        return self.objects_dir / digest[:2] / f"{digest}{extension}"
+
+    def _timestamped_path(self, prefix, camera_id, timestamp):
+        """Путь к файлу с меткой времени, без перезаписи кадров в ту же секунду"""
+        stamp = timestamp.strftime('%Y%m%d_%H%M%S')
+        file_path = self.root / f"{prefix}_{camera_id}_{stamp}.jpg"
+        counter = 1
+        while file_path.exists():
+            file_path = self.root / f"{prefix}_{camera_id}_{stamp}_{counter}.jpg"
+            counter += 1
+        return file_path
+
+    def _write_atomic(self, file_path, content):
+        """Атомарная запись файла (через временный файл и переименование)"""
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+
+    def save(self, camera_id, prefix, content, timestamp=None, change_score=None):
+        """
+        Сохранение кадра
+
+        Args:
+            change_score: оценка изменений относительно предыдущего планового кадра (%)
+
+        Returns:
+            dict: frame_id, file_path и признак deduplicated
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        digest = hashlib.sha256(content).hexdigest()
+        deduplicated = False
+        # Размер и формат хранимого файла (после перекодирования отличаются от исходного кадра)
+        size = len(content)
+        image_format = 'jpeg'
+
+        # Поиск объекта, запись и вставка в индекс - одна транзакция: объект не может
+        # быть удален упаковкой или очисткой между проверкой и ссылкой на него
+        with self._write_transaction():
+            if self.mode == 'cas':
+                row = self._conn.execute(
+                    "SELECT path, size, format FROM frames WHERE hash = ? AND tier = 'hot' ORDER BY id DESC LIMIT 1",
+                    (digest,)
+                ).fetchone()
+                if row and Path(row[0]).exists():
+                    # Такое содержимое уже хранится, добавляем только ссылку в индекс
+                    file_path = Path(row[0])
+                    size, image_format = row[1], row[2]
+                    deduplicated = True
+                else:
+                    file_path = self._object_path(digest)
+                    if file_path.exists():
+                        deduplicated = True
+                    else:
+                        self._write_atomic(file_path, content)
+            else:
+                file_path = self._timestamped_path(prefix, camera_id, timestamp)
+                with open(file_path, 'wb') as f:
+                    f.write(content)
+
+            cursor = self._conn.execute(
+                'INSERT INTO frames (camera_id, ts, hash, size, path, format, original_size, change_score) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (camera_id, timestamp.timestamp(), digest, size, str(file_path), image_format,
+                 len(content) if size != len(content) else None, change_score)
+            )
+
+            self.stats['stored_frames'] += 1
+            if deduplicated:
+                self.stats['deduplicated_frames'] += 1
+                self.stats['bytes_saved'] += len(content)
+            else:
+                self.stats['bytes_written'] += len(content)
+
+        return {
+            'frame_id': cursor.lastrowid,
+            'file_path': str(file_path),
+            'deduplicated': deduplicated
+        }
+
+    def get_frame(self, frame_id):
+        """Запись индекса по ID кадра"""
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {self.FRAME_COLUMNS} FROM frames WHERE id = ?', (frame_id,)
+            ).fetchone()
+        return self._row_to_frame(row) if row else None
+
+    def _row_to_frame(self, row):
+        """Преобразование строки индекса в словарь"""
+        return {
+            'frame_id': row[0],
+            'camera_id': row[1],
+            'timestamp': datetime.fromtimestamp(row[2]),
+            'hash': row[3],
+            'size': row[4],
+            'file_path': row[5],
+            'tier': row[6],
+            'offset': row[7],
+            'format': row[8],
+            'file_id': row[9],
+            'change_score': row[10]
+        }
+
+    def find_nearest(self, camera_id, timestamp):
+        """
+        Ближайший к timestamp кадр камеры
+
+        Поиск идет по индексу (camera_id, ts): два спуска по B-дереву,
+        O(log n) независимо от количества кадров.
+        """
+        ts = timestamp.timestamp()
+        with self._lock:
+            before = self._conn.execute(
+                f'SELECT {self.FRAME_COLUMNS} FROM frames WHERE camera_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1',
+                (camera_id, ts)
+            ).fetchone()
+            after = self._conn.execute(
+                f'SELECT {self.FRAME_COLUMNS} FROM frames WHERE camera_id = ? AND ts >= ? ORDER BY ts LIMIT 1',
+                (camera_id, ts)
+            ).fetchone()
+
+        candidates = [row for row in (before, after) if row]
+        if not candidates:
+            return None
+        return self._row_to_frame(min(candidates, key=lambda row: abs(row[2] - ts)))
+
+    def list_range(self, camera_id, start, end, offset=0, limit=10):
+        """
+        Кадры камеры за период, отсортированные по времени
+
+        camera_id=None - кадры всех камер.
+        """
+        query = f'SELECT {self.FRAME_COLUMNS} FROM frames WHERE ts >= ? AND ts <= ?'
+        params = [start.timestamp(), end.timestamp()]
+        if camera_id is not None:
+            query += ' AND camera_id = ?'
+            params.append(camera_id)
+        query += ' ORDER BY ts, id LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_frame(row) for row in rows]
+
+    def iter_range(self, camera_id, start, end, batch_size=500, after=None):
+        """
+        Потоковый обход кадров за период в порядке времени
+
+        Кадры читаются из индекса партиями с продолжением по (ts, id),
+        поэтому память не зависит от количества кадров, а каждая партия
+        начинается с поиска по индексу, а не с пропуска OFFSET строк.
+
+        Args:
+            after: (ts, id) последнего обработанного кадра - продолжение обхода
+        """
+        last_ts, last_id = after if after else (start.timestamp(), -1)
+        end_ts = end.timestamp()
+        camera_filter = ' AND camera_id = ?' if camera_id is not None else ''
+
+        while True:
+            params = [last_ts, last_ts, last_id, end_ts]
+            if camera_id is not None:
+                params.append(camera_id)
+            params.append(batch_size)
+
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT {self.FRAME_COLUMNS} FROM frames '
+                    f'WHERE (ts > ? OR (ts = ? AND id > ?)) AND ts <= ?{camera_filter} '
+                    'ORDER BY ts, id LIMIT ?',
+                    params
+                ).fetchall()
+
+            for row in rows:
+                yield self._row_to_frame(row)
+
+            if len(rows) < batch_size:
+                return
+            last_ts, last_id = rows[-1][2], rows[-1][0]
+
+    def set_file_id(self, frame_id, file_id):
+        """Сохранение Telegram file_id отправленного кадра"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE frames SET file_id = ? WHERE id = ?', (file_id, frame_id))
+
+    def read_frame(self, frame):
+        """
+        Чтение содержимого кадра из горячего или холодного хранилища
+
+        Args:
+            frame: ID кадра или запись индекса (dict)
+        """
+        if not isinstance(frame, dict):
+            frame = self.get_frame(frame)
+            if frame is None:
+                return None
+
+        if frame['tier'] == 'cold':
+            view = self.read_frame_view(frame)
+            try:
+                return bytes(view)
+            finally:
+                view.release()
+
+        with open(frame['file_path'], 'rb') as f:
+            return f.read()
+
+    def read_frame_view(self, frame):
+        """
+        memoryview на кадр холодного хранилища без копирования
+
+        Сегмент отображается в память один раз и переиспользуется
+        для всех последующих чтений.
+        """
+        start = frame['offset']
+        end = start + frame['size']
+
+        with self._lock:
+            mapped = self._segment_maps.get(frame['file_path'])
+            if mapped is None or len(mapped[1]) < end:
+                # Сегмент дописывался после отображения - отображаем заново
+                self._close_segment(frame['file_path'])
+                f = open(frame['file_path'], 'rb')
+                mapped = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self._segment_maps[frame['file_path']] = mapped
+
+        return memoryview(mapped[1])[start:end]
+
+    def _close_segment(self, path):
+        """Закрытие отображения сегмента"""
+        mapped = self._segment_maps.pop(path, None)
+        if mapped:
+            try:
+                mapped[1].close()
+            except BufferError:
+                # На отображение еще есть ссылки - закроется сборщиком мусора
+                pass
+            mapped[0].close()
+
+    def _segment_path(self, camera_id, timestamp):
+        """Путь к сегменту камеры за день"""
+        return self.segments_dir / str(camera_id) / f"{timestamp.strftime('%Y%m%d')}.seg"
+
+    def pack_cold_frames(self, max_age_hours):
+        """
+        Перенос кадров старше max_age_hours в сегменты холодного хранилища
+
+        Кадры дописываются в append-only файл камеры за день, смещение
+        и размер сохраняются в индексе. Одинаковые кадры внутри сегмента
+        хранятся один раз (совпадение хэша исходного кадра и формата файла).
+
+        Returns:
+            int: количество перенесенных кадров
+        """
+        cutoff_time = time.time() - max_age_hours * 60 * 60
+        packed_count = 0
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self.FRAME_COLUMNS} FROM frames WHERE tier = 'hot' AND ts < ? "
+                "ORDER BY camera_id, ts",
+                (cutoff_time,)
+            ).fetchall()
+
+        # Группируем по сегментам, чтобы открыть каждый файл один раз
+        groups = {}
+        for row in rows:
+            frame = self._row_to_frame(row)
+            segment_path = self._segment_path(frame['camera_id'], frame['timestamp'])
+            groups.setdefault(segment_path, []).append(frame)
+
+        for segment_path, frames in groups.items():
+            segment_path.parent.mkdir(parents=True, exist_ok=True)
+            updates = []
+            packed_hashes = {}
+            released_paths = set()
+
+            with self._lock:
+                for row in self._conn.execute(
+                    "SELECT hash, format, offset, size FROM frames WHERE tier = 'cold' AND path = ?", (str(segment_path),)
+                ):
+                    packed_hashes[(row[0], row[1])] = (row[2], row[3])
+
+            with open(segment_path, 'ab') as segment:
+                offset = segment.tell()
+                for frame in frames:
+                    key = (frame['hash'], frame['format'])
+                    if key in packed_hashes:
+                        updates.append((str(segment_path), *packed_hashes[key], frame['frame_id']))
+                        released_paths.add(frame['file_path'])
+                        continue
+                    try:
+                        with open(frame['file_path'], 'rb') as f:
+                            content = f.read()
+                    except FileNotFoundError:
+                        logger.warning(f"Кадр {frame['frame_id']} отсутствует на диске: {frame['file_path']}")
+                        continue
+
+                    segment.write(content)
+                    packed_hashes[key] = (offset, len(content))
+                    updates.append((str(segment_path), offset, len(content), frame['frame_id']))
+                    released_paths.add(frame['file_path'])
+                    offset += len(content)
+
+                segment.flush()
+                os.fsync(segment.fileno())
+
+            # Индекс обновляется только после того, как данные записаны на диск;
+            # горячие объекты удаляются в той же транзакции, что и переключение ссылок
+            with self._write_transaction():
+                self._conn.executemany(
+                    "UPDATE frames SET tier = 'cold', path = ?, offset = ?, size = ? WHERE id = ?", updates
+                )
+                for path in released_paths:
+                    still_used = self._conn.execute(
+                        "SELECT 1 FROM frames WHERE path = ? AND tier = 'hot' LIMIT 1", (path,)
+                    ).fetchone()
+                    if not still_used:
+                        try:
+                            Path(path).unlink()
+                        except FileNotFoundError:
+                            pass
+
+            packed_count += len(updates)
+
+        if packed_count:
+            logger.info(f"В холодное хранилище перенесено {packed_count} кадров ({len(groups)} сегментов)")
+        return packed_count
+
+    def list_transcode_candidates(self, max_age_hours, limit=500):
+        """
+        Горячие исходные JPEG-кадры старше max_age_hours
+
+        Returns:
+            list: пути к файлам (каждый путь один раз, даже если на него ссылаются несколько кадров)
+        """
+        cutoff_time = time.time() - max_age_hours * 60 * 60
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM frames WHERE tier = 'hot' AND format = 'jpeg' AND ts < ? "
+                "GROUP BY path ORDER BY MIN(ts) LIMIT ?",
+                (cutoff_time, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def replace_transcoded(self, old_path, new_path, new_size, target_format):
+        """Переключение всех ссылок индекса на перекодированный файл и удаление исходного"""
+        with self._write_transaction():
+            self._conn.execute(
+                "UPDATE frames SET original_size = COALESCE(original_size, size), size = ?, path = ?, format = ? "
+                "WHERE path = ? AND tier = 'hot'",
+                (new_size, str(new_path), target_format, str(old_path))
+            )
+            if str(new_path) == str(old_path):
+                return
+            try:
+                Path(old_path).unlink()
+            except FileNotFoundError:
+                pass
+
+    def mark_transcode_failed(self, path):
+        """Пометка файла, который не удалось перекодировать, чтобы он не возвращался в кандидаты"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE frames SET format = 'jpeg-failed' WHERE path = ? AND tier = 'hot' AND format = 'jpeg'",
+                (str(path),)
+            )
+
+    def list_files(self):
+        """Все файлы кадров на диске (включая объекты хранилища)"""
+        files = []
+        for pattern in ("*.jpg", "*.png", "*.webp", "*.avif"):
+            files.extend(self.root.glob(pattern))
+        if self.objects_dir.exists():
+            files.extend(f for f in self.objects_dir.rglob("*") if f.is_file() and not f.name.startswith('.'))
+        if self.segments_dir.exists():
+            files.extend(self.segments_dir.rglob("*.seg"))
+        return files
+
+    def cleanup(self, max_age_days=7):
+        """Удаление записей индекса и файлов старше max_age_days"""
+        cutoff_time = time.time() - (max_age_days * 24 * 60 * 60)
+        deleted_count = 0
+
+        with self._write_transaction():
+            paths = [row[0] for row in self._conn.execute(
+                'SELECT DISTINCT path FROM frames WHERE ts < ?', (cutoff_time,)
+            )]
+            self._conn.execute('DELETE FROM frames WHERE ts < ?', (cutoff_time,))
+
+            for path in paths:
+                # Объект удаляется только если на него больше никто не ссылается
+                still_used = self._conn.execute(
+                    'SELECT 1 FROM frames WHERE path = ? LIMIT 1', (path,)
+                ).fetchone()
+                if still_used:
+                    continue
+                self._close_segment(path)
+                try:
+                    Path(path).unlink()
+                    deleted_count += 1
+                except FileNotFoundError:
+                    pass
+
+        # Файлы, которых нет в индексе (сохраненные до его появления)
+        for file in self.root.glob("*.jpg"):
+            if file.stat().st_mtime < cutoff_time:
+                file.unlink()
+                deleted_count += 1
+        for file in self.root.glob("*.png"):
+            if file.stat().st_mtime < cutoff_time:
+                file.unlink()
+                deleted_count += 1
+
+        return deleted_count
+
+    def get_stats(self):
+        """Статистика хранилища"""
+        return self.stats.copy()
+
+    def merge_stats(self, delta):
+        """Добавление счетчиков хранилища другого процесса (процессы захвата)"""
+        with self._lock:
+            for key, value in delta.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+
+class StorageMaintenance:
+    """Фоновое обслуживание хранилища (перекодирование и перенос кадров в холодное хранилище)"""
+
+    def __init__(self, storage, config, transcoder=None):
+        self.storage = storage
+        self.transcoder = transcoder
+        self.cold_tier_hours = config.get('cold_tier_hours', 0)
+        self.interval_minutes = config.get('storage_maintenance_interval', 60)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Запуск фонового обслуживания"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Обслуживание хранилища запущено (каждые {self.interval_minutes} минут)")
+
+    def stop(self):
+        """Остановка фонового обслуживания"""
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+
+    def run_once(self):
+        """Один проход обслуживания"""
+        # Сначала перекодируем, чтобы в сегменты попадали уже сжатые кадры
+        if self.transcoder and self.transcoder.enabled:
+            while self.transcoder.run_once() and not self.stop_event.is_set():
+                pass
+        if self.cold_tier_hours > 0:
+            self.storage.pack_cold_frames(self.cold_tier_hours)
+
+    def _run(self):
+        """Основной цикл обслуживания"""
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания хранилища: {e}")
+            self.stop_event.wait(self.interval_minutes * 60)
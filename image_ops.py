@@ -0,0 +1,250 @@
+# image_ops.py
+import logging
+import os
+import shutil
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from PIL import Image, JpegImagePlugin
+
+logger = logging.getLogger(__name__)
+
+# jpegtran обрезает JPEG без перекодирования (пакет libjpeg-turbo-progs / libjpeg-turbo)
+JPEGTRAN = shutil.which('jpegtran')
+
+# Расширения файлов для поддерживаемых форматов
+FORMAT_EXTENSIONS = {
+    'webp': '.webp',
+    'avif': '.avif',
+    'jpeg': '.jpg'
+}
+
+def lower_priority():
+    """Понижение приоритета рабочего процесса (инициализатор пула)"""
+    try:
+        os.nice(19)
+    except (AttributeError, OSError):
+        pass
+
+def encode_image(image, image_format, quality, max_bytes=0):
+    """
+    Кодирование изображения с заданным качеством
+
+    Если указан max_bytes, качество понижается, пока результат не уложится в бюджет.
+    """
+    min_quality = 30
+    while True:
+        buffer = BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=quality)
+        if not max_bytes or buffer.tell() <= max_bytes or quality <= min_quality:
+            return buffer.getvalue()
+        quality = max(min_quality, quality - 10)
+
+def _downscale(image, max_edge):
+    """
+    Уменьшение кадра до max_edge по длинной стороне
+
+    JPEG декодируется в режиме draft (сразу в 1/2, 1/4 или 1/8 размера через
+    масштабированное DCT), поэтому уменьшение занимает миллисекунды даже для кадров 4K.
+    """
+    image.draft('RGB', (max_edge, max_edge))
+    image = image.convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    return image
+
+def make_preview(content, max_edge, quality=80):
+    """
+    Уменьшенная JPEG-копия кадра
+
+    Returns:
+        bytes: уменьшенный кадр или None, если кадр уже не больше max_edge
+    """
+    with Image.open(BytesIO(content)) as image:
+        if max(image.size) <= max_edge:
+            return None
+        buffer = BytesIO()
+        _downscale(image, max_edge).save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+def prepare_upload(content, max_edge, quality, max_bytes=0):
+    """
+    Подготовка кадра к отправке в Telegram (выполняется в рабочем процессе)
+
+    Returns:
+        bytes: уменьшенный и перекодированный кадр или None, если он не меньше исходного
+    """
+    with Image.open(BytesIO(content)) as image:
+        if max(image.size) > max_edge:
+            image = _downscale(image, max_edge)
+        elif not max_bytes or len(content) <= max_bytes:
+            # Размер и объем уже в пределах - перекодирование только ухудшит качество
+            return None
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        result = encode_image(image, 'jpeg', quality, max_bytes)
+
+    return result if len(result) < len(content) else None
+
+def load_gray(content, size):
+    """
+    Уменьшенный кадр в оттенках серого для анализа
+
+    JPEG декодируется в режиме draft сразу в 1/8 размера, затем сводится к size.
+    """
+    with Image.open(BytesIO(content)) as image:
+        image.draft('L', size)
+        return image.convert('L').resize(size, Image.BILINEAR)
+
+def dhash(gray_image) -> int:
+    """
+    Перцептивный хэш кадра (dHash, 64 бита) по результату load_gray
+
+    Биты - сравнение соседних пикселей строки кадра 9x8. Похожие кадры дают хэши
+    с малым расстоянием Хэмминга.
+    """
+    pixels = list(gray_image.resize((9, 8), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    """Число различающихся битов двух хэшей"""
+    return bin(a ^ b).count('1')
+
+def parse_roi(value):
+    """
+    Разбор области интереса 'x1,y1,x2,y2' в процентах кадра
+
+    Returns:
+        tuple: (x1, y1, x2, y2) в долях кадра или None (кадр целиком)
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        x1, y1, x2, y2 = (min(100.0, max(0.0, float(v))) / 100 for v in value.split(','))
+    except ValueError:
+        logger.warning(f"Неверная область интереса: '{value}' (ожидается x1,y1,x2,y2 в процентах)")
+        return None
+    if x2 <= x1 or y2 <= y1 or (x1, y1, x2, y2) == (0, 0, 1, 1):
+        return None
+    return x1, y1, x2, y2
+
+def crop_jpeg(content, roi):
+    """
+    Обрезка кадра до области интереса
+
+    Если установлен jpegtran, JPEG обрезается без перекодирования (левый верхний
+    угол выравнивается по блокам 8-16 пикселей). Иначе кадр обрезается Pillow и
+    кодируется с таблицами квантования исходного кадра.
+
+    Returns:
+        bytes: обрезанный кадр (исходный, если обрезать не удалось)
+    """
+    with Image.open(BytesIO(content)) as image:
+        width, height = image.size
+        box = (
+            int(roi[0] * width), int(roi[1] * height),
+            max(int(roi[0] * width) + 1, int(roi[2] * width)), max(int(roi[1] * height) + 1, int(roi[3] * height))
+        )
+        if image.format != 'JPEG':
+            buffer = BytesIO()
+            image.crop(box).save(buffer, format=image.format or 'PNG')
+            return buffer.getvalue()
+
+        if JPEGTRAN:
+            crop = f"{box[2] - box[0]}x{box[3] - box[1]}+{box[0]}+{box[1]}"
+            try:
+                completed = subprocess.run(
+                    [JPEGTRAN, '-copy', 'none', '-crop', crop],
+                    input=content, capture_output=True, timeout=10
+                )
+                if completed.returncode == 0 and completed.stdout:
+                    return completed.stdout
+                logger.warning(f"jpegtran: {completed.stderr.decode(errors='replace').strip()}")
+            except (OSError, subprocess.TimeoutExpired) as e:
+                logger.warning(f"jpegtran не выполнен: {e}")
+
+        buffer = BytesIO()
+        image.crop(box).save(
+            buffer, format='JPEG',
+            qtables=image.quantization,
+            subsampling=JpegImagePlugin.get_sampling(image)
+        )
+        return buffer.getvalue()
+
+def build_animation(frames, durations, image_format='gif', max_edge=640):
+    """
+    Анимация из серии кадров (выполняется в рабочем процессе)
+
+    Args:
+        frames: содержимое кадров (JPEG bytes)
+        durations: длительность показа каждого кадра в миллисекундах
+        image_format: gif или webp
+
+    Returns:
+        bytes: анимированный GIF или WebP
+    """
+    images = []
+    for content in frames:
+        with Image.open(BytesIO(content)) as image:
+            images.append(_downscale(image, max_edge) if max(image.size) > max_edge else image.convert('RGB'))
+
+    buffer = BytesIO()
+    options = {'quality': 70} if image_format == 'webp' else {'optimize': False}
+    images[0].save(
+        buffer,
+        format=image_format.upper(),
+        save_all=True,
+        append_images=images[1:],
+        duration=[max(20, int(duration)) for duration in durations],
+        loop=0,
+        **options
+    )
+    return buffer.getvalue()
+
+def render_frame(content, width, height, quality=80):
+    """
+    Кадр видео точного размера width x height (выполняется в рабочем процессе)
+
+    Кадр уменьшается в режиме draft и вписывается в черное поле, поэтому кадры
+    разных разрешений (основной и дополнительный поток) дают одинаковый размер.
+    """
+    with Image.open(BytesIO(content)) as image:
+        image.draft('RGB', (width, height))
+        image = image.convert('RGB')
+        image.thumbnail((width, height), Image.BILINEAR)
+        if image.size != (width, height):
+            canvas = Image.new('RGB', (width, height))
+            canvas.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+            image = canvas
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+def transcode_file(src_path, image_format, quality, max_bytes=0):
+    """
+    Перекодирование файла кадра (выполняется в рабочем процессе)
+
+    Returns:
+        tuple: (исходный путь, новый путь, размер) или (исходный путь, None, 0),
+        если перекодированный файл не меньше исходного
+    """
+    src = Path(src_path)
+    with Image.open(src) as image:
+        image.load()
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        content = encode_image(image, image_format, quality, max_bytes)
+
+    if len(content) >= src.stat().st_size:
+        return src_path, None, 0
+
+    dst = src.with_suffix(FORMAT_EXTENSIONS[image_format])
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, dst)
+    return src_path, str(dst), len(content)
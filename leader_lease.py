@@ -0,0 +1,84 @@
+# leader_lease.py
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class LeaderLease:
+    """
+    Аренда лидерства в общей базе SQLite (таблица leases в index.db)
+
+    Лидер продлевает аренду каждые ttl/3 секунд. Если он перестал продлевать
+    (упал или завис), другой экземпляр захватывает аренду после ее истечения,
+    то есть переключение происходит не позже чем через ttl + ttl/3 секунд.
+    """
+
+    def __init__(self, db_path, name: str = 'scheduler', ttl: float = 15):
+        self.db_path = str(db_path)
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = max(1.0, ttl / 3)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=self.renew_interval)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def acquire(self) -> bool:
+        """
+        Захват или продление аренды
+
+        Returns:
+            bool: True, если этот экземпляр - лидер
+        """
+        with self.lock:
+            now = time.time()
+            try:
+                # BEGIN IMMEDIATE берет блокировку записи до чтения, поэтому два
+                # экземпляра не могут одновременно увидеть аренду свободной
+                self._conn.execute('BEGIN IMMEDIATE')
+                row = self._conn.execute('SELECT holder, expires FROM leases WHERE name = ?', (self.name,)).fetchone()
+                if row and row[0] != self.holder and row[1] > now:
+                    self._conn.rollback()
+                    return False
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO leases (name, holder, expires) VALUES (?, ?, ?)',
+                    (self.name, self.holder, now + self.ttl)
+                )
+                self._conn.commit()
+                return True
+            except sqlite3.Error as e:
+                # База занята или недоступна - считаем, что аренда не получена
+                logger.warning(f"Не удалось обновить аренду лидерства: {e}")
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                return False
+
+    def release(self):
+        """Освобождение аренды (другой экземпляр сможет стать лидером сразу)"""
+        with self.lock:
+            try:
+                self._conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось освободить аренду лидерства: {e}")
+
+    def get_holder(self):
+        """Текущий держатель аренды (None, если аренда свободна или истекла)"""
+        with self.lock:
+            row = self._conn.execute('SELECT holder, expires FROM leases WHERE name = ?', (self.name,)).fetchone()
+        if row and row[1] > time.time():
+            return row[0]
+        return None
@@ -3,12 +3,18 @@ from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageH
 from telegram import BotCommand
 from config import load_config
 from camera_manager import CameraManager
+from frame_storage import StorageMaintenance
+from transcoder import ArchiveTranscoder
 from bot_handlers import BotHandlers
 from scheduler import CameraScheduler
+from leader_lease import LeaderLease
+from upload_transform import UploadTransformer
+from mosaic import MosaicBuilder
+from timelapse import TimelapseBuilder
 
 logger = None  # Глобальная переменная для логгера
 
-def setup_scheduler(config, camera_manager, bot):
+def setup_scheduler(config, camera_manager, bot, upload_transformer=None):
     """Настройка планировщика с проверками"""
     global logger
     
@@ -26,12 +32,46 @@ def setup_scheduler(config, camera_manager, bot):
         logger.error(f"Неверный формат ADMIN_CHAT_ID: {config['admin_chat_id']}")
         return None
          
+    # Несколько экземпляров с общим хранилищем: задания выполняет только лидер
+    lease = None
+    if config['schedule']['leader_lease']:
+        lease = LeaderLease(camera_manager.storage.index_path, ttl=config['schedule']['lease_ttl'])
+    
+    # Мозаика: все кадры прохода одним сообщением
+    mosaic = None
+    if config['schedule']['mosaic']:
+        mosaic = MosaicBuilder(
+            tile_width=config['schedule']['mosaic_tile_width'],
+            max_tiles=config['schedule']['mosaic_max_tiles']
+        )
+    
     # Создаем планировщик с новым форматом
     scheduler = CameraScheduler(
         camera_manager=camera_manager,
         bot=bot,
         chat_id=admin_chat_id,
-        schedule_config=config['schedule']['config']
+        schedule_config=config['schedule']['config'],
+        jobs=config['schedule']['jobs'],
+        overlap_policy=config['schedule']['overlap_policy'],
+        max_parallel=config['schedule']['max_parallel'],
+        run_workers=config['schedule']['run_workers'],
+        stagger_seconds=config['schedule']['stagger_seconds'],
+        jitter_seconds=config['schedule']['jitter_seconds'],
+        state_file=config['schedule']['state_file'],
+        misfire_policy=config['schedule']['misfire_policy'],
+        misfire_grace_minutes=config['schedule']['misfire_grace_minutes'],
+        misfire_max_runs=config['schedule']['misfire_max_runs'],
+        misfire_delay_seconds=config['schedule']['misfire_delay_seconds'],
+        misfire_cooldown_minutes=config['schedule']['misfire_cooldown_minutes'],
+        prefetch_max_seconds=config['schedule']['prefetch_max_seconds'],
+        journal_file=config['schedule']['journal_file'],
+        lease=lease,
+        capture_profile=config['schedule']['capture_profile'],
+        upload_transformer=upload_transformer,
+        mosaic=mosaic,
+        timelapse=TimelapseBuilder(camera_manager.storage, config) if config['timelapse_enabled'] else None,
+        change_threshold=config['change_alert_threshold'] if config['change_detection'] else 0,
+        skip_suspect=config['schedule']['skip_suspect'] and config['quality_check']
     )
     if scheduler and config['schedule']['enabled']:
         scheduler.start()
@@ -52,6 +92,9 @@ def setup_bot_commands(updater, scheduler, disabled_commands):
             BotCommand("capture", "Сделать снимок"),
             BotCommand("stats", "Статистика работы"),
             BotCommand("chat_id", "Получить ID чата"),
+            BotCommand("history", "Кадры из архива"),
+            BotCommand("export", "Выгрузить архив в ZIP"),
+            BotCommand("burst", "Серия кадров анимацией"),
         ]
         
         # Добавляем команды планировщика если он есть
@@ -60,6 +103,7 @@ def setup_bot_commands(updater, scheduler, disabled_commands):
                 BotCommand("schedule_start", "Запустить автосбор"),
                 BotCommand("schedule_stop", "Остановить автосбор"),
                 BotCommand("schedule_status", "Статус расписания"),
+                BotCommand("schedule_history", "Журнал запусков"),
                 BotCommand("schedule_set", "Установить расписание"),
                 BotCommand("schedule_cron", "Установить cron-расписание"),
                 BotCommand("schedule_times", "Установить время (ЧЧ:ММ,ЧЧ:ММ)"),
@@ -97,6 +141,15 @@ def register_handlers(dp, bot_handlers, scheduler, disabled_commands):
         handlers.append(CommandHandler("capture", bot_handlers.capture_menu))
     if "stats" not in disabled_commands:
         handlers.append(CommandHandler("stats", bot_handlers.stats_command))
+    if "history" not in disabled_commands:
+        handlers.append(CommandHandler("history", bot_handlers.history_command))
+        handlers.append(CallbackQueryHandler(bot_handlers.handle_history, pattern='^history_'))
+    if "export" not in disabled_commands:
+        # Выгрузка может занимать минуты, поэтому не блокирует остальные обработчики
+        handlers.append(CommandHandler("export", bot_handlers.export_command, run_async=True))
+    if "burst" not in disabled_commands:
+        # Серия длится секунды, остальные команды в это время обрабатываются
+        handlers.append(CommandHandler("burst", bot_handlers.burst_command, run_async=True))
     
     # Команды расписания (только если есть планировщик и команды не отключены)
     if scheduler and "schedule" not in disabled_commands:
@@ -106,6 +159,8 @@ def register_handlers(dp, bot_handlers, scheduler, disabled_commands):
             handlers.append(CommandHandler("schedule_stop", bot_handlers.schedule_stop))
         if "schedule_status" not in disabled_commands:
             handlers.append(CommandHandler("schedule_status", bot_handlers.schedule_status))
+        if "schedule_history" not in disabled_commands:
+            handlers.append(CommandHandler("schedule_history", bot_handlers.schedule_history))
         if "schedule_set" not in disabled_commands:
             handlers.append(CommandHandler("schedule_set", bot_handlers.schedule_set))
         if "schedule_cron" not in disabled_commands:
@@ -154,6 +209,19 @@ def main():
     
     # Инициализация менеджера камер
     camera_manager = CameraManager(config)
+    if config['capture_processes'] > 0:
+        # Захват и обработка кадров в отдельных процессах, процесс бота только принимает команды
+        camera_manager.start_workers(config['capture_processes'])
+    
+    # Фоновое обслуживание хранилища (перекодирование и холодный уровень)
+    storage_maintenance = None
+    if config['cold_tier_hours'] > 0 or config['transcode_age_hours'] > 0:
+        transcoder = ArchiveTranscoder(camera_manager.storage, config)
+        storage_maintenance = StorageMaintenance(camera_manager.storage, config, transcoder)
+        storage_maintenance.start()
+    
+    # Уменьшение кадров перед отправкой, общее для команд и планировщика
+    upload_transformer = UploadTransformer(config)
     
     # Инициализация бота
     request_kwargs = {
@@ -166,10 +234,10 @@ def main():
     # Инициализация планировщика
     scheduler = None
     if not config.get('disabled_commands') or "schedule" not in config['disabled_commands']:
-        scheduler = setup_scheduler(config, camera_manager, updater.bot)
+        scheduler = setup_scheduler(config, camera_manager, updater.bot, upload_transformer)
     
     # Инициализация обработчиков бота
-    bot_handlers = BotHandlers(camera_manager, config, scheduler)
+    bot_handlers = BotHandlers(camera_manager, config, scheduler, upload_transformer)
     
     # Регистрация обработчиков с учетом отключенных команд
     disabled_commands = config.get('disabled_commands', [])
@@ -215,9 +283,9 @@ def main():
     
     # Вывод доступных команд
     print("\n📋 Доступные команды:")
-    available_commands = ["start", "help", "chat_id", "cameras", "capture", "stats"]
+    available_commands = ["start", "help", "chat_id", "cameras", "capture", "stats", "history", "export", "burst"]
     if scheduler and "schedule" not in disabled_commands:
-        available_commands.extend(["schedule_start", "schedule_stop", "schedule_status", "schedule_set", "schedule_cron", "schedule_times"])
+        available_commands.extend(["schedule_start", "schedule_stop", "schedule_status", "schedule_history", "schedule_set", "schedule_cron", "schedule_times"])
     
     for cmd in available_commands:
         if cmd not in disabled_commands:
@@ -237,6 +305,10 @@ def main():
     # При остановке бота останавливаем планировщик
     if scheduler:
         scheduler.stop()
+    if storage_maintenance:
+        storage_maintenance.stop()
+    camera_manager.stop_workers()
+    upload_transformer.shutdown()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,139 @@
+# mosaic.py
+import logging
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Пропорции плитки (кадры камер обычно 16:9)
+TILE_ASPECT = 9 / 16
+# Сколько раскладок хранить (ключ - набор камер прохода)
+LAYOUT_CACHE_SIZE = 32
+BACKGROUND = (24, 24, 24)
+LABEL_COLOR = (235, 235, 235)
+FONT_NAMES = ('DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+def _load_font(size):
+    """Шрифт с кириллицей для подписей (встроенный шрифт Pillow, если DejaVu не найден)"""
+    for name in FONT_NAMES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+class MosaicBuilder:
+    """
+    Сборка кадров прохода в сетку (мозаику) с подписями камер
+
+    Кадры декодируются сразу в размер плитки (режим draft для JPEG) и
+    вставляются в общий массив срезами numpy. Раскладка (сетка и координаты
+    плиток) вычисляется один раз для набора камер и берется из кэша.
+    """
+
+    def __init__(self, tile_width: int = 480, max_tiles: int = 36, quality: int = 85, workers: int = 4):
+        self.tile_width = max(64, tile_width)
+        self.tile_height = int(self.tile_width * TILE_ASPECT)
+        self.label_height = max(14, self.tile_width // 20)
+        self.max_tiles = max(1, max_tiles)
+        self.quality = quality
+        self.workers = max(1, workers)
+        self.font = _load_font(self.label_height - 4)
+        self.layouts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_layout(self, camera_ids) -> list:
+        """
+        Раскладка кадров по листам мозаики
+
+        Returns:
+            list: листы вида {'size': (ширина, высота), 'tiles': [(camera_id, x, y), ...]}
+        """
+        key = tuple(camera_ids)
+        with self.lock:
+            if key in self.layouts:
+                self.layouts.move_to_end(key)
+                return self.layouts[key]
+
+        sheets = []
+        cell_height = self.tile_height + self.label_height
+        for start in range(0, len(key), self.max_tiles):
+            sheet_ids = key[start:start + self.max_tiles]
+            columns = math.ceil(math.sqrt(len(sheet_ids)))
+            rows = math.ceil(len(sheet_ids) / columns)
+            sheets.append({
+                'size': (columns * self.tile_width, rows * cell_height),
+                'tiles': [
+                    (camera_id, (i % columns) * self.tile_width, (i // columns) * cell_height)
+                    for i, camera_id in enumerate(sheet_ids)
+                ]
+            })
+
+        with self.lock:
+            self.layouts[key] = sheets
+            while len(self.layouts) > LAYOUT_CACHE_SIZE:
+                self.layouts.popitem(last=False)
+        return sheets
+
+    def _load_tile(self, path):
+        """Кадр, уменьшенный до размера плитки, как массив (None, если кадр не читается)"""
+        try:
+            with Image.open(path) as image:
+                image.draft('RGB', (self.tile_width, self.tile_height))
+                image = image.convert('RGB')
+                image.thumbnail((self.tile_width, self.tile_height), Image.BILINEAR)
+                return np.asarray(image)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Мозаика: не удалось прочитать кадр {path}: {e}")
+            return None
+
+    def build(self, results) -> list:
+        """
+        Сборка мозаики из успешных результатов захвата
+
+        Returns:
+            list: листы вида {'data': JPEG bytes, 'camera_ids': [...]}
+        """
+        results = [result for result in results if not result.get('error') and result.get('file_path')]
+        if not results:
+            return []
+
+        by_camera = {result['camera_id']: result for result in results}
+        # Pillow отпускает GIL при декодировании, поэтому кадры читаются параллельно
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(results))) as executor:
+            tiles = dict(zip(by_camera, executor.map(self._load_tile, [r['file_path'] for r in results])))
+
+        sheets = []
+        for layout in self.get_layout([camera_id for camera_id in by_camera if tiles[camera_id] is not None]):
+            width, height = layout['size']
+            canvas = np.empty((height, width, 3), dtype=np.uint8)
+            canvas[:] = BACKGROUND
+            for camera_id, x, y in layout['tiles']:
+                tile = tiles[camera_id]
+                # Кадр другой пропорции выравнивается по центру плитки
+                dx = (self.tile_width - tile.shape[1]) // 2
+                dy = (self.tile_height - tile.shape[0]) // 2
+                canvas[y + dy:y + dy + tile.shape[0], x + dx:x + dx + tile.shape[1]] = tile
+
+            image = Image.fromarray(canvas)
+            draw = ImageDraw.Draw(image)
+            for camera_id, x, y in layout['tiles']:
+                result = by_camera[camera_id]
+                frame_time = result.get('frame_time') or result.get('timestamp')
+                label = result.get('camera_name') or str(camera_id)
+                if frame_time:
+                    label += f"  {frame_time.strftime('%H:%M:%S')}"
+                draw.text((x + 4, y + self.tile_height + 2), label, fill=LABEL_COLOR, font=self.font)
+
+            buffer = BytesIO()
+            image.save(buffer, format='JPEG', quality=self.quality)
+            sheets.append({
+                'data': buffer.getvalue(),
+                'camera_ids': [camera_id for camera_id, _, _ in layout['tiles']]
+            })
+        return sheets
@@ -0,0 +1,78 @@
+# quality.py
+import threading
+import numpy as np
+
+# Размер полутонового кадра для проверки качества
+QUALITY_SIZE = (160, 90)
+# Разброс яркости, ниже которого кадр считается однотонным (закрытый объектив, засветка)
+UNIFORM_STD = 6.0
+
+# Описания признаков для сообщений
+QUALITY_REASONS = {
+    'dark': 'темный кадр',
+    'uniform': 'однотонный кадр',
+    'blurred': 'размытый кадр',
+    'frozen': 'кадр не меняется'
+}
+
+class QualityAnalyzer:
+    """
+    Проверка качества кадра по уменьшенной полутоновой копии
+
+    - dark: средняя яркость ниже dark_level (не работает ИК-подсветка, крышка объектива)
+    - uniform: почти нет разброса яркости (объектив закрыт или засвечен)
+    - blurred: низкая дисперсия лапласиана (расфокус, запотевшее стекло)
+    - frozen: кадр точно совпадает с предыдущими frozen_frames кадрами (зависший
+      кодер отдает один и тот же кадр, у живой камеры всегда есть шум матрицы)
+    """
+
+    def __init__(self, dark_level: float = 12, blur_threshold: float = 20, frozen_frames: int = 3):
+        self.dark_level = dark_level
+        self.blur_threshold = blur_threshold
+        self.frozen_frames = max(1, frozen_frames)
+        # camera_id -> (последний кадр, число совпадений подряд)
+        self.last_frames = {}
+        # Только для учета зависания: яркость и резкость считаются без блокировки
+        self.lock = threading.Lock()
+
+    def analyze(self, camera_id, gray_image) -> list:
+        """
+        Признаки подозрительного кадра
+
+        Args:
+            gray_image: кадр в оттенках серого размера QUALITY_SIZE (PIL 'L')
+
+        Returns:
+            list: коды признаков из QUALITY_REASONS (пустой - кадр в порядке)
+        """
+        pixels = np.asarray(gray_image, dtype=np.float32)
+        reasons = []
+
+        mean = float(pixels.mean())
+        std = float(pixels.std())
+        if mean < self.dark_level:
+            reasons.append('dark')
+        elif std < UNIFORM_STD:
+            reasons.append('uniform')
+        else:
+            # Лапласиан срезами массива: 4 * центр - соседи по вертикали и горизонтали
+            laplacian = (
+                4 * pixels[1:-1, 1:-1]
+                - pixels[:-2, 1:-1] - pixels[2:, 1:-1]
+                - pixels[1:-1, :-2] - pixels[1:-1, 2:]
+            )
+            if float(laplacian.var()) < self.blur_threshold:
+                reasons.append('blurred')
+
+        with self.lock:
+            previous, repeats = self.last_frames.get(camera_id, (None, 0))
+            repeats = repeats + 1 if previous is not None and np.array_equal(previous, pixels) else 0
+            self.last_frames[camera_id] = (pixels, repeats)
+        if repeats >= self.frozen_frames:
+            reasons.append('frozen')
+
+        return reasons
+
+def describe_reasons(reasons) -> str:
+    """Описание признаков для сообщений"""
+    return ', '.join(QUALITY_REASONS.get(reason, reason) for reason in reasons)
@@ -0,0 +1,119 @@
+# run_journal.py
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних записей держать в памяти для /schedule_history
+RECENT_RUNS = 1000
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Перцентиль p (0-100) с линейной интерполяцией"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class RunJournal:
+    """
+    Журнал запусков планировщика (JSON Lines)
+
+    record() только кладет запись в очередь; запись на диск выполняет фоновый
+    поток пачками раз в flush_interval секунд, поэтому журнал не добавляет
+    задержки в проход. Последние записи хранятся в памяти для быстрых отчетов.
+    """
+
+    def __init__(self, path, flush_interval: float = 2.0, max_bytes: int = 10 * 1024 * 1024):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue()
+        self.recent = deque(maxlen=RECENT_RUNS)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self._load_recent()
+
+    def _load_recent(self):
+        """Загрузка последних записей из файла (и ротированной копии)"""
+        for path in (self.path.with_name(self.path.name + '.1'), self.path):
+            if not path.exists():
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self.recent.append(json.loads(line))
+            except (OSError, ValueError) as e:
+                logger.error(f"Ошибка чтения журнала {path}: {e}")
+
+    def start(self):
+        """Запуск фоновой записи"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Остановка с записью накопленных записей"""
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self._flush()
+
+    def record(self, entry: dict):
+        """Добавление записи о запуске"""
+        with self.lock:
+            self.recent.append(entry)
+        self.queue.put(entry)
+
+    def get_recent(self, limit: int) -> List[dict]:
+        """Последние limit записей (от новых к старым)"""
+        with self.lock:
+            entries = list(self.recent)
+        return entries[-limit:][::-1]
+
+    def get_all_recent(self) -> List[dict]:
+        """Все записи в памяти (от старых к новым)"""
+        with self.lock:
+            return list(self.recent)
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        """Запись накопленной пачки одним вызовом write"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._rotate()
+            data = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in batch)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+        except OSError as e:
+            logger.error(f"Ошибка записи журнала запусков: {e}")
+
+    def _rotate(self):
+        """Переименование файла журнала при превышении max_bytes (хранится одна копия .1)"""
+        if self.max_bytes and self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            os.replace(self.path, self.path.with_name(self.path.name + '.1'))
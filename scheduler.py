@@ -1,320 +1,1255 @@
 # scheduler.py
+import heapq
+import itertools
+import json
 import logging
+import tempfile
 import threading
 import time
-import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from pathlib import Path
+from io import BytesIO
 from typing import Optional, List, Union
 import os
 from telegram import InputMediaPhoto
+from cron import CronExpression
+from run_journal import RunJournal, percentile
+from quality import describe_reasons
+from archive_export import TELEGRAM_DOCUMENT_LIMIT
+from utils import humanize_size
 
 logger = logging.getLogger(__name__)
 
-class CameraScheduler:
-    """Планировщик с поддержкой cron-расписаний"""
-    
-    def __init__(self, camera_manager, bot, chat_id, schedule_config: Union[str, List[str], int] = 60):
+# Максимальный интервал ожидания одним вызовом Event.wait (сек).
+# После каждого такого интервала оставшееся время пересчитывается по системным
+# часам, что компенсирует их перевод (NTP, переход на летнее время).
+MAX_WAIT_SLICE = 300
+
+# Задания, время запуска которых отличается не больше чем на это значение (сек),
+# выполняются одним проходом с общими снимками
+COALESCE_WINDOW = 1.0
+
+# ID основного задания (SCHEDULE_CONFIG, команды /schedule_*)
+DEFAULT_JOB_ID = 'default'
+
+# Политики запуска, когда предыдущий проход задания еще не завершен:
+# skip - пропустить запуск, queue_one - выполнить один отложенный запуск после
+# завершения текущего, parallel - выполнять параллельно (не больше max_parallel)
+OVERLAP_POLICIES = ('skip', 'queue_one', 'parallel')
+
+# Политики пропущенных запусков (бот был остановлен в момент запуска):
+# run_once - один догоняющий запуск, run_all - по запуску на каждый пропущенный,
+# skip - не догонять
+MISFIRE_POLICIES = ('run_once', 'run_all', 'skip')
+
+# Версия формата файла состояния
+STATE_VERSION = 1
+
+def _format_time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class ScheduleTrigger:
+    """Расписание: интервал, cron-выражение или список времени"""
+
+    def __init__(self, schedule_config: Union[str, List[str], int]):
         """
-        Инициализация планировщика
-        
         Args:
             schedule_config: Конфигурация расписания:
                 - int: интервал в минутах (режим интервала)
                 - str: cron-выражение (например, "0 9-18 * * *")
                 - List[str]: список конкретных времени (например, ["09:00", "13:30", "18:00"])
         """
-        self.camera_manager = camera_manager
-        self.bot = bot
-        self.chat_id = chat_id
-        
-        # Режимы работы
-        self.mode = "interval"  # По умолчанию интервальный режим
         self.schedule_config = schedule_config
-        
-        # Для интервального режима
+        self.mode = "interval"
         self.interval_minutes = 60
-        
-        # Для cron-режима
         self.cron_expression = None
-        self.cron_parts = None
-        
-        # Для режима списка времени
+        self.cron: Optional[CronExpression] = None
         self.time_list = None
-        
-        # Инициализация в зависимости от типа конфига
+        self.times = []
         self._parse_schedule_config(schedule_config)
-        
-        self.is_running = False
-        self.thread: Optional[threading.Thread] = None
-        self.stop_event = threading.Event()
-        
-        self.execution_count = 0
-        self.last_execution: Optional[datetime] = None
-        self.next_run: Optional[datetime] = None
-        
-        logger.info(f"Планировщик инициализирован в режиме '{self.mode}'")
-    
+
     def _parse_schedule_config(self, config):
         """Парсинг конфигурации расписания"""
+        if isinstance(config, str) and config.strip().isdigit():
+            # SCHEDULE_CONFIG=60 из .env приходит строкой
+            config = int(config.strip())
+
         if isinstance(config, int):
+            if config < 1:
+                raise ValueError("Интервал должен быть больше 0 минут")
             self.mode = "interval"
             self.interval_minutes = config
-            logger.info(f"Интервальный режим: {self.interval_minutes} минут")
-        
+
         elif isinstance(config, str):
             # Проверяем, является ли строкой cron-выражением
             if self._is_cron_expression(config):
                 self.mode = "cron"
                 self.cron_expression = config
-                self.cron_parts = self._parse_cron_expression(config)
-                logger.info(f"Cron-режим: {config}")
+                self.cron = CronExpression(config)
             else:
                 # Если не cron, проверяем, есть ли запятые или пробелы
                 if ',' in config:
                     # Разбиваем по запятым
-                    self.mode = "time_list"
-                    self.time_list = [t.strip() for t in config.split(',') if t.strip()]
-                    logger.info(f"Режим списка времени (через запятые): {self.time_list}")
+                    time_list = [t.strip() for t in config.split(',') if t.strip()]
                 else:
                     # Разбиваем по пробелам
-                    self.mode = "time_list"
-                    self.time_list = [t.strip() for t in config.split() if t.strip()]
-                    logger.info(f"Режим списка времени (через пробелы): {self.time_list}")
-                
+                    time_list = [t.strip() for t in config.split() if t.strip()]
+                self._set_time_list(time_list)
+
         elif isinstance(config, list):
-            self.mode = "time_list"
-            self.time_list = config
-            logger.info(f"Режим списка времени: {self.time_list}")
-        
-                         
-    def _is_cron_expression(self, expression: str) -> bool:
+            self._set_time_list(config)
+
+        else:
+            raise ValueError(f"Неподдерживаемый формат расписания: {config}")
+
+    def _set_time_list(self, time_list: List[str]):
+        """Установка режима списка времени с проверкой формата"""
+        times = []
+        for time_str in time_list:
+            try:
+                hour, minute = map(int, time_str.split(':'))
+            except (ValueError, AttributeError):
+                raise ValueError(f"Некорректный формат времени: {time_str}")
+            if not (0 <= hour <= 23 and 0 <= minute <= 59):
+                raise ValueError(f"Некорректное время: {time_str}")
+            times.append((hour, minute))
+
+        if not times:
+            raise ValueError("Список времени пуст")
+
+        self.mode = "time_list"
+        self.time_list = time_list
+        self.times = sorted(set(times))
+
+    @staticmethod
+    def _is_cron_expression(expression: str) -> bool:
         """Проверяет, является ли строка cron-выражением"""
         # Простая проверка - cron обычно имеет 5 частей, разделенных пробелами
         parts = expression.strip().split()
         return len(parts) == 5
-    
-    def _parse_cron_expression(self, expression: str) -> dict:
-        """Парсит cron-выражение на составляющие"""
-        parts = expression.strip().split()
-        
-        # Базовый парсинг cron (упрощенный)
-        return {
-            'minute': parts[0],  # минуты (0-59)
-            'hour': parts[1],    # часы (0-23)
-            'day': parts[2],     # день месяца (1-31)
-            'month': parts[3],   # месяц (1-12)
-            'weekday': parts[4]  # день недели (0-6, 0=воскресенье)
-        }
-    
-    def _cron_matches_time(self, dt: datetime) -> bool:
-        """Проверяет, соответствует ли время cron-выражению"""
-        if not self.cron_parts:
-            return False
-        
-        def match_field(value: int, field: str) -> bool:
-            """Проверяет соответствие значения полю cron"""
-            if field == '*':
-                return True
-            elif ',' in field:
-                # Список значений (например, "0,15,30,45")
-                return str(value) in field.split(',')
-            elif '-' in field:
-                # Диапазон (например, "9-18")
-                start, end = map(int, field.split('-'))
-                return start <= value <= end
-            elif '/' in field:
-                # Шаг (например, "*/15" - каждые 15 минут)
-                step = int(field.split('/')[1])
-                return value % step == 0
-            else:
-                # Конкретное значение
-                return value == int(field)
-        
-        # Проверяем все поля
-        checks = [
-            match_field(dt.minute, self.cron_parts['minute']),
-            match_field(dt.hour, self.cron_parts['hour']),
-            match_field(dt.day, self.cron_parts['day']),
-            match_field(dt.month, self.cron_parts['month']),
-            match_field(dt.weekday(), self.cron_parts['weekday'])  # weekday() возвращает 0-6
-        ]
-        
-        return all(checks)
-    
-    def _calculate_next_run_time(self) -> Optional[datetime]:
-        """Вычисляет время следующего запуска"""
-        now = datetime.now()
-    
+
+    def next_after(self, after: datetime, anchor: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Время первого запуска строго после after
+
+        Args:
+            anchor: запланированное время последнего запуска (опорная точка интервального режима)
+        """
+        if self.mode == "cron":
+            return self.cron.next_after(after)
+
         if self.mode == "time_list":
-            if not self.time_list:
-                logger.error("time_list пустой")
-                return None
-        
-        logger.info(f"time_list: {self.time_list}")
-        logger.info(f"Текущее время: {now.strftime('%H:%M:%S')}")
-        
-        # Преобразуем строки времени в объекты datetime
-        times_today = []
-        for time_str in self.time_list:
+            # Ближайшее время сегодня, иначе первое время завтра
+            for hour, minute in self.times:
+                candidate = datetime.combine(after.date(), datetime.min.time()).replace(hour=hour, minute=minute)
+                if candidate > after:
+                    return candidate
+            hour, minute = self.times[0]
+            tomorrow = after.date() + timedelta(days=1)
+            return datetime.combine(tomorrow, datetime.min.time()).replace(hour=hour, minute=minute)
+
+        if self.mode == "interval":
+            # Сетка интервалов отсчитывается от последнего запланированного запуска,
+            # поэтому длительность самого захвата не сдвигает расписание
+            interval = timedelta(minutes=self.interval_minutes)
+            if anchor is None or anchor > after:
+                return after + interval
+            missed = (after - anchor) // interval
+            return anchor + (missed + 1) * interval
+
+        return None
+
+    def describe(self) -> str:
+        """Описание расписания"""
+        if self.mode == "interval":
+            return f"Интервальный режим: каждые {self.interval_minutes} минут"
+        elif self.mode == "cron":
+            return f"Cron-режим: {self.cron_expression}"
+        elif self.mode == "time_list":
+            return f"Режим списка времени: {', '.join(self.time_list)}"
+        else:
+            return "Режим не определен"
+
+class ScheduleJob:
+    """Задание расписания: когда снимать, какие камеры и куда отправлять"""
+
+    def __init__(self, job_id: str, schedule_config, camera_ids=None, chat_ids=None, name=None, kind: str = 'capture'):
+        """
+        Args:
+            camera_ids: ID камер и/или имена групп (CAMERA_x_GROUP); None - все камеры
+            chat_ids: чаты для отправки снимков
+            kind: capture - снимки камер, timelapse - таймлапсы за прошедшие сутки из архива
+        """
+        self.job_id = job_id
+        self.name = name or job_id
+        self.kind = kind
+        self.trigger = ScheduleTrigger(schedule_config)
+        self.camera_ids = camera_ids
+        self.chat_ids = list(chat_ids or [])
+
+        self.execution_count = 0
+        self.last_execution: Optional[datetime] = None
+        self.last_scheduled: Optional[datetime] = None
+        self.next_run: Optional[datetime] = None
+        # Версия записи в куче: устаревшие записи (после изменения расписания) пропускаются
+        self.version = 0
+
+        # Состояние выполнения и статистика длительности проходов
+        self.active_runs = 0
+        self.pending = False
+        self.skipped_count = 0
+        self.overrun_count = 0
+        self.last_duration: Optional[float] = None
+        self.last_interval: Optional[float] = None
+
+    def resolve_cameras(self, cameras: dict) -> List[int]:
+        """ID камер задания среди настроенных камер"""
+        if not self.camera_ids:
+            return list(cameras)
+
+        result = []
+        for item in self.camera_ids:
+            item = str(item).strip()
+            if item.isdigit():
+                if int(item) in cameras:
+                    result.append(int(item))
+            else:
+                result.extend(cam_id for cam_id, camera in cameras.items() if camera.get('group') == item)
+        return list(dict.fromkeys(result))
+
+    def update_next_run(self, now: Optional[datetime] = None):
+        """Пересчет времени следующего запуска"""
+        self.next_run = self.trigger.next_after(now or datetime.now(), self.last_scheduled)
+        self.version += 1
+
+class CameraScheduler:
+    """
+    Планировщик заданий захвата
+
+    Все задания обслуживаются одним потоком-таймером по куче, упорядоченной
+    по времени следующего запуска, поэтому количество заданий не влияет на
+    нагрузку в простое. Основное задание (schedule_config) снимает все камеры
+    и отправляет их в chat_id; его параметры доступны через прежние атрибуты
+    (mode, next_run, execution_count и т.д.).
+    """
+
+    def __init__(self, camera_manager, bot, chat_id, schedule_config: Union[str, List[str], int, None] = 60, jobs=None,
+                 overlap_policy: str = 'queue_one', max_parallel: int = 1, stagger_seconds: float = 0, jitter_seconds: float = 0,
+                 run_workers: int = 8,
+                 state_file=None, misfire_policy: str = 'run_once', misfire_grace_minutes: int = 60,
+                 misfire_max_runs: int = 10, misfire_delay_seconds: float = 30, misfire_cooldown_minutes: int = 10,
+                 prefetch_max_seconds: float = 10, journal_file=None, lease=None, capture_profile: str = 'preview',
+                 upload_transformer=None, mosaic=None, change_threshold: float = 0, skip_suspect: bool = False,
+                 timelapse=None):
+        """
+        Инициализация планировщика
+
+        Args:
+            schedule_config: Конфигурация основного расписания:
+                - int: интервал в минутах (режим интервала)
+                - str: cron-выражение (например, "0 9-18 * * *")
+                - List[str]: список конкретных времени (например, ["09:00", "13:30", "18:00"])
+                - None: без основного задания (только jobs)
+            jobs: дополнительные задания (список dict с ключами id, name, schedule, cameras, chats, kind)
+            overlap_policy: поведение при наложении проходов (skip, queue_one, parallel)
+            max_parallel: максимум одновременных проходов задания в режиме parallel
+            run_workers: потоков в пуле проходов (не зависит от числа заданий: задания
+                с одним временем выполняются одним проходом)
+            stagger_seconds: окно, на которое равномерно разносятся запросы к камерам
+            jitter_seconds: дополнительный детерминированный сдвиг запроса каждой камеры
+            state_file: JSON-файл состояния (счетчики, время запусков, расписание из /schedule_set)
+            misfire_policy: обработка запусков, пропущенных пока бот не работал (run_once, run_all, skip)
+            misfire_grace_minutes: догоняются только запуски не старше этого значения
+            misfire_max_runs: максимум догоняющих запусков задания в режиме run_all
+            misfire_delay_seconds: задержка догоняющих запусков после старта
+            misfire_cooldown_minutes: после догоняющего запуска повторные догоняющие запуски
+                (например, при серии перезапусков после сбоя) не выполняются в течение этого времени
+            prefetch_max_seconds: максимальное опережение запроса к камере на ее задержку (0 - без опережения)
+            journal_file: JSONL-журнал запусков с длительностью этапов (None - без журнала)
+            lease: LeaderLease для работы нескольких экземпляров бота - задания выполняет
+                только лидер (None - экземпляр всегда считается лидером)
+            capture_profile: профиль снимков по расписанию (preview - уменьшенные кадры
+                дополнительного потока, main - полное разрешение)
+            upload_transformer: UploadTransformer для уменьшения кадров перед отправкой
+                (None - кадры отправляются как есть)
+            mosaic: MosaicBuilder - кадры прохода отправляются одной сеткой вместо альбомов
+                (None - альбомами по 10 фото)
+            change_threshold: отправлять только кадры с оценкой изменений (%) не ниже этого
+                значения (0 - отправлять все; требует CHANGE_DETECTION)
+            skip_suspect: не отправлять подозрительные кадры (result['suspect'], требует QUALITY_CHECK)
+            timelapse: TimelapseBuilder для заданий kind='timelapse' (None - такие задания не выполняются)
+        """
+        self.camera_manager = camera_manager
+        self.bot = bot
+        self.chat_id = chat_id
+
+        if overlap_policy not in OVERLAP_POLICIES:
+            logger.warning(f"Неизвестная политика наложения '{overlap_policy}', используется queue_one")
+            overlap_policy = 'queue_one'
+        self.overlap_policy = overlap_policy
+        self.max_parallel = max(1, max_parallel)
+        self.stagger_seconds = max(0, stagger_seconds)
+        self.jitter_seconds = max(0, jitter_seconds)
+        # Проходы выполняются в пуле, поток-таймер только отсчитывает время
+        self.executor: Optional[ThreadPoolExecutor] = None
+        # Не меньше max_parallel проходов одного задания и догоняющего запуска
+        self.run_workers = max(run_workers, self.max_parallel + 1)
+
+        self.state_file = Path(state_file) if state_file else None
+        if misfire_policy not in MISFIRE_POLICIES:
+            logger.warning(f"Неизвестная политика пропущенных запусков '{misfire_policy}', используется run_once")
+            misfire_policy = 'run_once'
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = timedelta(minutes=max(0, misfire_grace_minutes))
+        self.misfire_max_runs = max(1, misfire_max_runs)
+        self.misfire_delay_seconds = max(0, misfire_delay_seconds)
+        self.misfire_cooldown = timedelta(minutes=max(0, misfire_cooldown_minutes))
+        self.last_catchup: Optional[datetime] = None
+        # Сохраненное время запусков проверяется на пропуски только при первом старте
+        self._misfire_check_pending = False
+
+        self.prefetch_max_seconds = max(0, prefetch_max_seconds)
+        # Отклонение времени кадра от запланированного по камерам (сек)
+        self.camera_skew = {}
+
+        self.journal = RunJournal(journal_file) if journal_file else None
+
+        self.capture_profile = capture_profile
+        self.upload_transformer = upload_transformer
+        self.mosaic = mosaic
+        self.change_threshold = max(0, change_threshold)
+        self.skip_suspect = skip_suspect
+        self.timelapse = timelapse
+
+        self.lease = lease
+        self.is_leader = lease is None
+        self.lease_thread: Optional[threading.Thread] = None
+
+        self.jobs = {}
+        self.heap = []
+        self._sequence = itertools.count()
+
+        self.is_running = False
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        # Событие пробуждения таймера: остановка или изменение расписания
+        self.wakeup_event = threading.Event()
+        self.lock = threading.RLock()
+
+        if schedule_config is not None:
+            self.add_job(ScheduleJob(DEFAULT_JOB_ID, schedule_config, None, [chat_id], name="Основное"))
+
+        for job_config in jobs or []:
             try:
-                hour, minute = map(int, time_str.split(':'))
-                time_dt = datetime.combine(now.date(), datetime.min.time()).replace(hour=hour, minute=minute)
-                times_today.append(time_dt)
-                logger.info(f"Добавлено время: {time_dt.strftime('%H:%M')}")
-            except (ValueError, AttributeError) as e:
-                logger.error(f"Некорректный формат времени '{time_str}': {e}")
-                continue
-        
-        if not times_today:
-            logger.error("Нет корректных времен в times_today")
+                self.add_job(ScheduleJob(
+                    job_config['id'],
+                    job_config['schedule'],
+                    job_config.get('cameras'),
+                    job_config.get('chats') or [chat_id],
+                    name=job_config.get('name'),
+                    kind=job_config.get('kind', 'capture')
+                ))
+            except ValueError as e:
+                logger.error(f"Задание '{job_config.get('id')}' пропущено: {e}")
+
+        self._load_state()
+
+        logger.info(f"Планировщик инициализирован: {len(self.jobs)} заданий")
+
+    # Атрибуты основного задания (для команд /schedule_* и обратной совместимости)
+
+    @property
+    def default_job(self) -> Optional[ScheduleJob]:
+        return self.jobs.get(DEFAULT_JOB_ID)
+
+    @property
+    def mode(self) -> Optional[str]:
+        return self.default_job.trigger.mode if self.default_job else None
+
+    @property
+    def schedule_config(self):
+        return self.default_job.trigger.schedule_config if self.default_job else None
+
+    @property
+    def interval_minutes(self):
+        return self.default_job.trigger.interval_minutes if self.default_job else None
+
+    @property
+    def cron_expression(self):
+        return self.default_job.trigger.cron_expression if self.default_job else None
+
+    @property
+    def time_list(self):
+        return self.default_job.trigger.time_list if self.default_job else None
+
+    @property
+    def execution_count(self) -> int:
+        return sum(job.execution_count for job in self.jobs.values())
+
+    @property
+    def last_execution(self) -> Optional[datetime]:
+        executions = [job.last_execution for job in self.jobs.values() if job.last_execution]
+        return max(executions, default=None)
+
+    @property
+    def next_run(self) -> Optional[datetime]:
+        runs = [job.next_run for job in self.jobs.values() if job.next_run]
+        return min(runs, default=None)
+
+    def get_other_leader(self) -> Optional[str]:
+        """
+        Другой экземпляр, который сейчас держит аренду лидерства
+
+        Файл состояния ведет он, изменения расписания здесь не сохранятся. None - этот
+        экземпляр лидер или аренда свободна (например, единственный экземпляр с
+        остановленным планировщиком).
+        """
+        if self.lease is None or self.is_leader:
             return None
-        
-        # Сортируем времена
-        times_today.sort()
-        
-        # Ищем ближайшее время, которое еще не наступило сегодня
-        for t in times_today:
-            logger.info(f"Проверяем время: {t.strftime('%H:%M')} > {now.strftime('%H:%M')}? {t > now}")
-            if t > now:
-                logger.info(f"Найдено следующее время: {t.strftime('%Y-%m-%d %H:%M')}")
-                return t
-        
-        # Если все времена сегодня прошли
-        logger.info(f"Все времена прошли, берем первое на завтра: {times_today[0].strftime('%H:%M')}")
-        tomorrow = now.date() + timedelta(days=1)
-        first_time = datetime.combine(tomorrow, datetime.min.time()).replace(
-            hour=times_today[0].hour,
-            minute=times_today[0].minute
-        )
-        return first_time
-    
-    # ... остальной код для других режимов
-    
-    
-    
-    
+        holder = self.lease.get_holder()
+        return holder if holder != self.lease.holder else None
+
+    def add_job(self, job: ScheduleJob):
+        """Добавление или замена задания"""
+        with self.lock:
+            old_job = self.jobs.get(job.job_id)
+            if old_job:
+                job.version = old_job.version + 1
+            self.jobs[job.job_id] = job
+            if self.is_running:
+                self._schedule_job(job)
+        self.wakeup_event.set()
+        logger.info(f"Задание '{job.name}': {job.trigger.describe()}")
+
+    def remove_job(self, job_id: str):
+        """Удаление задания (запись в куче станет устаревшей и будет пропущена)"""
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job:
+                job.version += 1
+        self.wakeup_event.set()
+
+    def _schedule_job(self, job: ScheduleJob, now: Optional[datetime] = None):
+        """Расчет следующего запуска задания и добавление его в кучу"""
+        job.update_next_run(now)
+        if job.next_run:
+            heapq.heappush(self.heap, (job.next_run, next(self._sequence), job.job_id, job.version))
+
+    def next_n(self, k: int) -> List[datetime]:
+        """Ближайшие k запусков основного задания"""
+        job = self.default_job
+        if not job:
+            return []
+        result = []
+        current = job.next_run or job.trigger.next_after(datetime.now(), job.last_scheduled)
+        while current is not None and len(result) < k:
+            result.append(current)
+            current = job.trigger.next_after(current, current)
+        return result
+
     def start(self):
         """Запуск планировщика"""
         if self.is_running:
             logger.warning("Планировщик уже запущен")
             return
-        
-        self.is_running = True
-        self.stop_event.clear()
+
+        with self.lock:
+            self.is_running = True
+            self.stop_event.clear()
+            self.wakeup_event.clear()
+            self.executor = ThreadPoolExecutor(max_workers=self.run_workers, thread_name_prefix='schedule-run')
+            if self.lease:
+                self.is_leader = self.lease.acquire()
+                logger.info("Экземпляр - лидер расписания" if self.is_leader else "Экземпляр - резервный, задания выполняет лидер")
+            self._arm()
+
+        if self.journal:
+            self.journal.start()
+        if self.lease:
+            self.lease_thread = threading.Thread(target=self._lease_loop, daemon=True)
+            self.lease_thread.start()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
-        
+
         logger.info("Планировщик запущен")
-        self._update_next_run_time()
-    
+        if self.next_run:
+            logger.info(f"Следующий запуск: {self.next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+
     def stop(self):
         """Остановка планировщика"""
         if not self.is_running:
             logger.warning("Планировщик уже остановлен")
             return
-        
+
         self.is_running = False
         self.stop_event.set()
-        
+        self.wakeup_event.set()
+
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5)
-        
+        if self.lease_thread and self.lease_thread.is_alive():
+            self.lease_thread.join(timeout=5)
+
+        if self.executor:
+            # Текущие проходы дорабатывают сами, отложенные запуски отменяются
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        for job in self.jobs.values():
+            job.pending = False
+        self._save_state()
+        if self.journal:
+            self.journal.stop()
+        if self.lease and self.is_leader:
+            self.lease.release()
+            self.is_leader = False
+
         logger.info("Планировщик остановлен")
-    
+
+    def _arm(self):
+        """Расчет запусков всех заданий и выполнение пропущенных (только лидером)"""
+        with self.lock:
+            self.heap = []
+            now = datetime.now()
+            missed = {}
+            if self.is_leader:
+                missed = self._collect_misfires(now) if self._misfire_check_pending else {}
+                self._misfire_check_pending = False
+            for job in self.jobs.values():
+                self._schedule_job(job, now)
+            if missed:
+                self.last_catchup = now
+                for job in missed:
+                    job.active_runs += 1
+                self.executor.submit(self._run_catchup, missed)
+        self._save_state()
+        self.wakeup_event.set()
+
+    def _lease_loop(self):
+        """Продление аренды лидером и попытки захвата резервным экземпляром"""
+        while not self.stop_event.wait(self.lease.renew_interval):
+            was_leader = self.is_leader
+            self.is_leader = self.lease.acquire()
+
+            if self.is_leader and not was_leader:
+                logger.warning("Экземпляр стал лидером расписания, состояние загружается из файла")
+                # Состояние сохранял прежний лидер: подхватываем его счетчики и
+                # догоняем запуски, пропущенные во время переключения
+                with self.lock:
+                    self._load_state()
+                    self._arm()
+            elif was_leader and not self.is_leader:
+                logger.warning("Аренда лидерства потеряна, задания будет выполнять другой экземпляр")
+
     def set_schedule(self, schedule_config: Union[str, List[str], int]):
-        """Изменение расписания"""
-        was_running = self.is_running
-        
-        if was_running:
-            self.stop()
-        
-        self._parse_schedule_config(schedule_config)
-        
-        # Обновляем конфиг
-        self.schedule_config = schedule_config
-        logger.info(f"Расписание изменено: {schedule_config}")
-        
-        if was_running:
-            self.start()
-    
+        """Изменение расписания основного задания (работающий таймер перевзводится сразу)"""
+        trigger = ScheduleTrigger(schedule_config)
+
+        with self.lock:
+            job = self.default_job
+            if job is None:
+                self.add_job(ScheduleJob(DEFAULT_JOB_ID, schedule_config, None, [self.chat_id], name="Основное"))
+            else:
+                job.trigger = trigger
+                if self.is_running:
+                    self._schedule_job(job)
+            logger.info(f"Расписание изменено: {schedule_config}")
+
+        self.wakeup_event.set()
+        self._save_state()
+
+    def _load_state(self):
+        """Восстановление состояния заданий из файла"""
+        if not self.state_file or not self.state_file.exists():
+            return
+
+        try:
+            state = json.loads(self.state_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать состояние планировщика {self.state_file}: {e}")
+            return
+
+        self.last_catchup = _parse_time(state.get('last_catchup'))
+        default_schedule = state.get('default_schedule')
+        if default_schedule is not None and self.default_job:
+            try:
+                self.default_job.trigger = ScheduleTrigger(default_schedule)
+            except ValueError as e:
+                logger.error(f"Сохраненное расписание не применено: {e}")
+
+        for job_id, job_state in state.get('jobs', {}).items():
+            job = self.jobs.get(job_id)
+            if not job:
+                continue
+            job.execution_count = job_state.get('execution_count', 0)
+            job.last_execution = _parse_time(job_state.get('last_execution'))
+            job.last_scheduled = _parse_time(job_state.get('last_scheduled'))
+            job.next_run = _parse_time(job_state.get('next_run'))
+
+        self._misfire_check_pending = True
+        logger.info(f"Состояние планировщика восстановлено из {self.state_file}")
+
+    def _save_state(self):
+        """Атомарное сохранение состояния (запись во временный файл и замена)"""
+        # Файл состояния общий для экземпляров, его ведет лидер (или любой экземпляр, пока лидера нет)
+        if not self.state_file or self.get_other_leader():
+            return
+
+        with self.lock:
+            default_job = self.default_job
+            state = {
+                'version': STATE_VERSION,
+                'saved_at': datetime.now().isoformat(),
+                'last_catchup': _format_time(self.last_catchup),
+                'default_schedule': default_job.trigger.schedule_config if default_job else None,
+                'jobs': {
+                    job.job_id: {
+                        'execution_count': job.execution_count,
+                        'last_execution': _format_time(job.last_execution),
+                        'last_scheduled': _format_time(job.last_scheduled),
+                        'next_run': _format_time(job.next_run)
+                    }
+                    for job in self.jobs.values()
+                }
+            }
+
+            try:
+                self.state_file.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.state_file.parent, prefix='.scheduler_state.')
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(state, f, ensure_ascii=False, indent=2)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.state_file)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+            except OSError as e:
+                logger.error(f"Не удалось сохранить состояние планировщика: {e}")
+
+    def _collect_misfires(self, now: datetime) -> dict:
+        """
+        Пропущенные запуски по сохраненному состоянию
+
+        Returns:
+            dict: задание -> список пропущенных запусков, которые нужно выполнить
+        """
+        if self.last_catchup and now - self.last_catchup < self.misfire_cooldown:
+            logger.warning(
+                f"Догоняющий запуск уже выполнялся в {self.last_catchup.strftime('%H:%M:%S')}, "
+                f"пропущенные запуски не выполняются"
+            )
+            return {}
+
+        missed = {}
+        for job in self.jobs.values():
+            run_time = job.next_run
+            times = []
+            # Перебор ограничен: при частом расписании и долгом простое пропусков может быть много
+            for _ in range(10000):
+                if run_time is None or run_time > now:
+                    break
+                if now - run_time <= self.misfire_grace:
+                    times.append(run_time)
+                run_time = job.trigger.next_after(run_time, run_time)
+
+            if not times:
+                continue
+            # Пропущенные запуски становятся опорой интервальной сетки
+            job.last_scheduled = times[-1]
+            if self.misfire_policy == 'skip':
+                logger.info(f"Задание '{job.name}': пропущено запусков: {len(times)}, не выполняются")
+                continue
+            if self.misfire_policy == 'run_once':
+                times = times[-1:]
+            else:
+                times = times[-self.misfire_max_runs:]
+            missed[job] = times
+            logger.info(f"Задание '{job.name}': пропущено запусков в пределах окна: {len(times)}")
+        return missed
+
+    def _run_catchup(self, missed: dict):
+        """Выполнение пропущенных запусков после задержки"""
+        try:
+            if self.stop_event.wait(self.misfire_delay_seconds):
+                return
+            rounds = max(len(times) for times in missed.values())
+            for index in range(rounds):
+                # Каждый пропущенный запуск выполняется со своим временем: от него зависят
+                # сдвиги камер, запись в журнале и сутки таймлапса
+                by_time = {}
+                for job, times in missed.items():
+                    if index < len(times):
+                        by_time.setdefault(times[index], []).append(job)
+                for scheduled_time, jobs in sorted(by_time.items()):
+                    if self.stop_event.is_set():
+                        return
+                    logger.info(
+                        f"Догоняющий запуск {index + 1}/{rounds} за {scheduled_time.strftime('%Y-%m-%d %H:%M')}"
+                    )
+                    self._execute_jobs(jobs, scheduled_time, catchup=True)
+        except Exception as e:
+            logger.error(f"Ошибка догоняющего запуска: {e}")
+        finally:
+            with self.lock:
+                for job in missed:
+                    job.active_runs -= 1
+
     def _run(self):
         """Основной цикл планировщика"""
-        logger.info(f"Планировщик начал работу в режиме '{self.mode}'")
-    
+        logger.info("Планировщик начал работу")
+
         while self.is_running and not self.stop_event.is_set():
             try:
-                # Вычисляем время до следующего запуска
-                wait_seconds = self._calculate_wait_time()
-            
-                if wait_seconds > 0:
-                    # Ждем до следующего запуска с проверкой остановки
-                    logger.info(f"До следующего запуска: {wait_seconds} секунд")
-                    for _ in range(wait_seconds):
-                        if self.stop_event.is_set():
-                            return
-                        time.sleep(1)
-            
-                # Выполняем захват (внутри него обновляется next_run)
-                self._execute_capture()
-            
-                # УБРАЛИ ЭТУ СТРОКУ: self._update_next_run_time()
-            
+                self.wakeup_event.clear()
+
+                with self.lock:
+                    target = self._peek_next_time()
+                    due_jobs = self._jobs_at(target) if target else []
+
+                if target is None:
+                    # Заданий нет - ждем изменения расписания
+                    self.wakeup_event.wait(MAX_WAIT_SLICE)
+                    continue
+
+                # Проход начинается заранее, чтобы запросы к медленным камерам успели к target
+                lead = self._prefetch_lead(due_jobs)
+                logger.info(f"До следующего запуска: {(target - datetime.now()).total_seconds():.0f} секунд")
+                if not self._wait_until(target - timedelta(seconds=lead)):
+                    # Остановка или изменение расписания - пересчитываем время запуска
+                    continue
+
+                due_jobs = self._pop_due_jobs(target)
+                if due_jobs:
+                    self._dispatch(due_jobs, target)
+
             except Exception as e:
                 logger.error(f"Ошибка в планировщике: {e}")
-                time.sleep(60)
-    
-    
-    
-    def _calculate_wait_time(self) -> int:
-        """Вычисление времени до следующего запуска"""
-        if self.next_run is None:
-            self._update_next_run_time()
-        
-        if self.next_run is None:
-            logger.warning("Не удалось определить время следующего запуска")
-            return 300  # Ждем 5 минут и пробуем снова
-        
-        wait_seconds = max(0, int((self.next_run - datetime.now()).total_seconds()))
-        return wait_seconds
-    
-    def _update_next_run_time(self):
-        """Обновление времени следующего запуска"""
-        self.next_run = self._calculate_next_run_time()
-        if self.next_run:
-            logger.info(f"Следующий запуск: {self.next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+                self.stop_event.wait(60)
+
+    def _peek_next_time(self) -> Optional[datetime]:
+        """Время ближайшего запуска (устаревшие записи кучи отбрасываются)"""
+        while self.heap:
+            run_time, _, job_id, version = self.heap[0]
+            job = self.jobs.get(job_id)
+            if job and job.version == version:
+                return run_time
+            heapq.heappop(self.heap)
+        return None
+
+    def _jobs_at(self, target: datetime) -> List[ScheduleJob]:
+        """
+        Задания, которые будут выполнены одним проходом в target
+
+        Записи извлекаются из вершины кучи и возвращаются обратно: стоимость зависит
+        от числа наступающих заданий, а не от общего числа заданий.
+        """
+        limit = target + timedelta(seconds=COALESCE_WINDOW)
+        entries = []
+        while self._peek_next_time() is not None and self.heap[0][0] <= limit:
+            entries.append(heapq.heappop(self.heap))
+        for entry in entries:
+            heapq.heappush(self.heap, entry)
+        return [self.jobs[job_id] for _, _, job_id, _ in entries]
 
-    def _execute_capture(self):
-        """Выполнение захвата изображений и отправка в чат"""
-        logger.info("Планировщик: запуск автоматического захвата")
+    def _pop_due_jobs(self, target: datetime) -> List[ScheduleJob]:
+        """Извлечение из кучи всех заданий, запланированных на target"""
+        limit = max(datetime.now(), target) + timedelta(seconds=COALESCE_WINDOW)
+        due_jobs = []
+        with self.lock:
+            while self._peek_next_time() is not None and self.heap[0][0] <= limit:
+                run_time, _, job_id, _ = heapq.heappop(self.heap)
+                job = self.jobs[job_id]
+                job.last_scheduled = run_time
+                due_jobs.append(job)
+        return due_jobs
 
-        start_message = None  # Инициализируем переменную
+    def _dispatch(self, jobs: List[ScheduleJob], scheduled_time: datetime):
+        """Передача наступивших заданий в пул с учетом политики наложения"""
+        run_jobs = []
+        with self.lock:
+            # При опережающем старте текущее время еще меньше scheduled_time
+            now = max(datetime.now(), scheduled_time)
+            for job in jobs:
+                # Следующий запуск планируется сразу, не дожидаясь завершения прохода
+                self._schedule_job(job, now)
+                if job.next_run:
+                    job.last_interval = (job.next_run - scheduled_time).total_seconds()
+
+                if not self.is_leader:
+                    # Резервный экземпляр только отслеживает расписание
+                    continue
+
+                if job.active_runs == 0 or (self.overlap_policy == 'parallel' and job.active_runs < self.max_parallel):
+                    job.active_runs += 1
+                    run_jobs.append(job)
+                elif self.overlap_policy == 'queue_one' and not job.pending:
+                    job.pending = True
+                    logger.warning(f"Задание '{job.name}': предыдущий проход не завершен, запуск отложен")
+                else:
+                    job.skipped_count += 1
+                    logger.warning(f"Задание '{job.name}': предыдущий проход не завершен, запуск пропущен")
+
+        if run_jobs and self.executor:
+            self.executor.submit(self._run_jobs, run_jobs, scheduled_time)
+        self._save_state()
+
+    def _run_jobs(self, jobs: List[ScheduleJob], scheduled_time: datetime):
+        """Выполнение прохода в пуле и учет его длительности"""
+        started = time.monotonic()
         try:
-            # Отправляем сообщение о начале
-            try:
-                start_message = self.bot.send_message(
-                    chat_id=self.chat_id,
-                    text=f"<b>⏰ Автоматический захват запущен</b>\n"
-                         f"Время: {datetime.now().strftime('%H:%M:%S')}",
-                    parse_mode='HTML'
+            self._execute_jobs(jobs, scheduled_time)
+        except Exception as e:
+            logger.error(f"Ошибка выполнения заданий: {e}")
+        finally:
+            duration = time.monotonic() - started
+            queued = []
+            with self.lock:
+                for job in jobs:
+                    job.active_runs -= 1
+                    job.last_duration = duration
+                    if job.last_interval and duration > job.last_interval:
+                        job.overrun_count += 1
+                        logger.warning(
+                            f"Задание '{job.name}': проход занял {duration:.1f} с при интервале {job.last_interval:.0f} с"
+                        )
+                    else:
+                        logger.info(f"Задание '{job.name}': проход занял {duration:.1f} с")
+                    if job.pending and self.is_running:
+                        job.pending = False
+                        job.active_runs += 1
+                        queued.append(job)
+
+            if queued:
+                try:
+                    self.executor.submit(self._run_jobs, queued, datetime.now())
+                except (RuntimeError, AttributeError):
+                    # Планировщик остановлен, пул закрыт
+                    for job in queued:
+                        job.active_runs -= 1
+
+    def _camera_offsets(self, camera_ids: List[int], scheduled_time: datetime) -> dict:
+        """
+        Сдвиг запроса каждой камеры относительно начала прохода (сек)
+
+        Камеры равномерно распределяются по окну stagger_seconds в порядке ID,
+        к сдвигу добавляется jitter, вычисляемый из ID камеры и времени запуска:
+        между запусками он меняется, но повторяется при одинаковых входных данных.
+        """
+        if not camera_ids or (not self.stagger_seconds and not self.jitter_seconds):
+            return {}
+
+        ordered = sorted(camera_ids)
+        offsets = {}
+        for index, camera_id in enumerate(ordered):
+            offset = self.stagger_seconds * index / len(ordered)
+            if self.jitter_seconds:
+                seed = zlib.crc32(f"{camera_id}:{scheduled_time:%Y%m%d%H%M%S}".encode())
+                offset += self.jitter_seconds * (seed % 1000) / 1000
+            offsets[camera_id] = offset
+        return offsets
+
+    def _camera_lead(self, camera_id: int) -> float:
+        """Опережение запроса к камере: ее сглаженная задержка, ограниченная prefetch_max_seconds"""
+        latency = self.camera_manager.get_capture_latency(camera_id)
+        if not latency:
+            return 0.0
+        return min(latency, self.prefetch_max_seconds)
+
+    def _prefetch_lead(self, jobs: List[ScheduleJob]) -> float:
+        """Насколько раньше запланированного времени начинать проход (по камерам его заданий)"""
+        if not self.prefetch_max_seconds:
+            return 0.0
+        camera_ids = {
+            camera_id
+            for job in jobs if job.kind == 'capture'
+            for camera_id in job.resolve_cameras(self.camera_manager.cameras)
+        }
+        return max((self._camera_lead(camera_id) for camera_id in camera_ids), default=0.0)
+
+    def _launch_offsets(self, camera_ids: List[int], scheduled_time: datetime, offsets: dict) -> dict:
+        """
+        Задержки запросов от текущего момента (сек)
+
+        Каждая камера запрашивается раньше своего времени (scheduled_time + сдвиг
+        разноса) на собственную задержку, чтобы кадр был сформирован к этому времени.
+        """
+        until_start = (scheduled_time - datetime.now()).total_seconds()
+        return {
+            camera_id: max(0.0, until_start + offsets.get(camera_id, 0) - self._camera_lead(camera_id))
+            for camera_id in camera_ids
+        }
+
+    def _record_skew(self, results: List[dict], scheduled_time: datetime, offsets: dict):
+        """Учет отклонения времени кадра от запланированного по камерам"""
+        with self.lock:
+            for result in results:
+                if result.get('error') or not result.get('frame_time'):
+                    continue
+                camera_id = result['camera_id']
+                planned = scheduled_time + timedelta(seconds=offsets.get(camera_id, 0))
+                skew = (result['frame_time'] - planned).total_seconds()
+                result['skew'] = skew
+
+                entry = self.camera_skew.setdefault(camera_id, {'count': 0, 'avg_abs': 0.0, 'max_abs': 0.0})
+                entry['count'] += 1
+                entry['last'] = skew
+                entry['avg_abs'] += (abs(skew) - entry['avg_abs']) / entry['count']
+                entry['max_abs'] = max(entry['max_abs'], abs(skew))
+
+    def get_skew_info(self) -> List[dict]:
+        """Отклонение времени кадра от запланированного по камерам"""
+        with self.lock:
+            return [
+                {
+                    'camera_id': camera_id,
+                    'camera_name': self.camera_manager.cameras.get(camera_id, {}).get('name', f'Камера {camera_id}'),
+                    'lead': self._camera_lead(camera_id),
+                    **entry
+                }
+                for camera_id, entry in sorted(self.camera_skew.items())
+            ]
+
+    def _wait_until(self, target: datetime) -> bool:
+        """
+        Ожидание момента target
+
+        Таймер спит на Event.wait (монотонные часы), не просыпаясь каждую секунду.
+        Оставшееся время пересчитывается по системным часам после каждого интервала
+        ожидания, поэтому запуск не накапливает дрейф.
+
+        Returns:
+            bool: True - время наступило, False - таймер прерван (остановка или новое расписание)
+        """
+        while True:
+            remaining = (target - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return True
+
+            if self.wakeup_event.wait(min(remaining, MAX_WAIT_SLICE)):
+                return False
+
+    def _execute_jobs(self, jobs: List[ScheduleJob], scheduled_time: datetime, catchup: bool = False):
+        """Выполнение прохода: таймлапсы по отдельности, захват - одним проходом для всех заданий"""
+        capture_jobs = [job for job in jobs if job.kind == 'capture']
+        if capture_jobs:
+            self._execute_capture(capture_jobs, scheduled_time=scheduled_time, catchup=catchup)
+        for job in jobs:
+            if job.kind == 'timelapse':
+                self._execute_timelapse(job, scheduled_time)
+
+    def _execute_timelapse(self, job: ScheduleJob, scheduled_time: datetime):
+        """
+        Сборка таймлапсов камер задания за сутки до scheduled_time и отправка в чаты
+
+        Период определяется датой запуска, поэтому догоняющий запуск после
+        перезапуска продолжает прерванную сборку с контрольной точки.
+        """
+        if not self.timelapse:
+            logger.warning(f"Задание '{job.name}': сборка таймлапсов не настроена")
+            return
+
+        day = (scheduled_time - timedelta(days=1)).date()
+        logger.info(f"Планировщик: таймлапсы за {day:%d.%m.%Y} ({job.name})")
+        for camera_id in job.resolve_cameras(self.camera_manager.cameras):
+            if self.stop_event.is_set():
+                break
+            camera_name = self.camera_manager.cameras[camera_id].get('name', f'Камера {camera_id}')
+            result = self.timelapse.build_day(camera_id, day)
+            if result['error'] and not result['path']:
+                logger.warning(f"Таймлапс камеры {camera_id} за {day}: {result['error']}")
+                continue
+
+            path = Path(result['path'])
+            size = path.stat().st_size
+            caption = f"🎞️ {camera_name} за {day:%d.%m.%Y}"
+            if result['frames']:
+                caption += f"\nКадров: {result['frames']}, сборка {result['seconds']:.0f} с"
+            for chat_id in job.chat_ids:
+                try:
+                    if size > TELEGRAM_DOCUMENT_LIMIT:
+                        self.bot.send_message(
+                            chat_id=chat_id,
+                            text=f"{caption}\nФайл {humanize_size(size)} больше лимита Telegram: {path}"
+                        )
+                        continue
+                    with open(path, 'rb') as f:
+                        self.bot.send_document(chat_id=chat_id, document=f, filename=path.name, caption=caption, timeout=300)
+                except Exception as e:
+                    logger.error(f"Не удалось отправить таймлапс камеры {camera_id} в чат {chat_id}: {e}")
+
+        with self.lock:
+            job.execution_count += 1
+            job.last_execution = datetime.now()
+        self._save_state()
+
+    def _execute_capture(self, jobs: Optional[List[ScheduleJob]] = None, scheduled_time: Optional[datetime] = None,
+                         catchup: bool = False):
+        """
+        Выполнение захвата для заданий и отправка в их чаты
+
+        Камеры, общие для нескольких заданий, снимаются один раз.
+
+        Args:
+            catchup: догоняющий запуск за прошедшее время scheduled_time - снимки
+                делаются сразу, отклонение времени кадра не учитывается
+        """
+        if jobs is None:
+            jobs = [self.default_job] if self.default_job else [job for job in self.jobs.values() if job.kind == 'capture']
+        logger.info(f"Планировщик: запуск автоматического захвата ({', '.join(job.name for job in jobs)})")
+        started = datetime.now()
+        started_monotonic = time.monotonic()
+        capture_seconds = None
+        capture_error = None
+        results = []
+
+        # Отправляем сообщения о начале
+        start_messages = {}
+        for job in jobs:
+            for chat_id in job.chat_ids:
+                try:
+                    start_messages[(job.job_id, chat_id)] = self.bot.send_message(
+                        chat_id=chat_id,
+                        text=f"<b>⏰ Автоматический захват запущен</b>\n"
+                             f"{self._job_title(job)}"
+                             f"Время: {datetime.now().strftime('%H:%M:%S')}",
+                        parse_mode='HTML'
+                    )
+                    logger.info("Начальное сообщение отправлено")
+                except Exception as e:
+                    logger.warning(f"Не удалось отправить начальное сообщение: {e}")
+
+        try:
+            capture_started = time.monotonic()
+            # Выполняем захват со всех камер заданий (каждая камера - один раз)
+            job_cameras = {job.job_id: job.resolve_cameras(self.camera_manager.cameras) for job in jobs}
+            camera_ids = list(dict.fromkeys(cam_id for ids in job_cameras.values() for cam_id in ids))
+            offsets = self._camera_offsets(camera_ids, scheduled_time or datetime.now())
+            if scheduled_time:
+                # Кадры без изменений пропускаются только в плановых запусках, не в ручном
+                results = self.camera_manager.capture_cameras(
+                    camera_ids, self._launch_offsets(camera_ids, scheduled_time, offsets), self.capture_profile,
+                    scheduled=True
                 )
-                logger.info("Начальное сообщение отправлено")
-            except Exception as e:
-                logger.warning(f"Не удалось отправить начальное сообщение: {e}")
-                start_message = None
+                if not catchup:
+                    self._record_skew(results, scheduled_time, offsets)
+            else:
+                results = self.camera_manager.capture_cameras(camera_ids, offsets, self.capture_profile)
+            capture_seconds = time.monotonic() - capture_started
+            results_by_camera = {result['camera_id']: result for result in results}
+        except Exception as e:
+            capture_error = str(e)
+            logger.error(f"Ошибка при автоматическом захвате: {e}")
+            for job in jobs:
+                for chat_id in job.chat_ids:
+                    try:
+                        self.bot.send_message(
+                            chat_id=chat_id,
+                            text=f"❌ <b>Ошибка при автоматическом захвате:</b>\n{str(e)[:100]}",
+                            parse_mode='HTML'
+                        )
+                    except Exception as send_err:
+                        logger.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
+            results_by_camera = None
+
+        # Обновляем статистику (следующий запуск уже запланирован при постановке в пул)
+        now = datetime.now()
+        with self.lock:
+            for job in jobs:
+                job.execution_count += 1
+                job.last_execution = now
+        self._save_state()
+
+        uploads = []
+        upload_bytes = None
+        if results_by_camera is not None:
+            # Кадр, общий для нескольких заданий и чатов, подготавливается один раз
+            # В режиме мозаики кадры уменьшаются при ее сборке
+            if not self.mosaic:
+                upload_bytes = self._prepare_uploads(results)
+            # Мозаика собирается один раз на набор камер (задания с одинаковыми камерами ее разделяют)
+            mosaics = {}
+            for job in jobs:
+                job_results = [results_by_camera[cam_id] for cam_id in job_cameras[job.job_id] if cam_id in results_by_camera]
+                sheets = None
+                changed = [result for result in job_results if self._should_send(result)]
+                if self.mosaic:
+                    key = tuple(job_cameras[job.job_id])
+                    if key not in mosaics:
+                        mosaics[key] = self._build_mosaic(changed)
+                    sheets = mosaics[key]
+                for chat_id in job.chat_ids:
+                    upload_started = time.monotonic()
+                    self._deliver(job, chat_id, job_results, start_messages.get((job.job_id, chat_id)), sheets)
+                    uploads.append({
+                        'job_id': job.job_id,
+                        'chat_id': chat_id,
+                        'seconds': round(time.monotonic() - upload_started, 3)
+                    })
+
+        if self.journal:
+            self.journal.record({
+                'scheduled': _format_time(scheduled_time),
+                'started': started.isoformat(),
+                'lag': round((started - scheduled_time).total_seconds(), 3) if scheduled_time else None,
+                'catchup': catchup,
+                'jobs': [job.job_id for job in jobs],
+                'capture_seconds': round(capture_seconds, 3) if capture_seconds is not None else None,
+                'upload_seconds': round(sum(upload['seconds'] for upload in uploads), 3),
+                'upload_bytes': upload_bytes,
+                'duration': round(time.monotonic() - started_monotonic, 3),
+                'error': capture_error,
+                'cameras': [
+                    {
+                        'camera_id': result['camera_id'],
+                        'latency': result.get('capture_latency'),
+                        'bytes': result.get('bytes', 0),
+                        'retries': result.get('retries', 0),
+                        'skew': round(result['skew'], 3) if result.get('skew') is not None else None,
+                        'error': result.get('error'),
+                        'duplicate': result.get('duplicate', False),
+                        'change_score': result.get('change_score'),
+                        'suspect': result.get('suspect') or None
+                    }
+                    for result in results
+                ],
+                'uploads': uploads
+            })
+
+    def _is_unchanged(self, result) -> bool:
+        """Кадр не нужно отправлять: повтор предыдущего или изменения ниже порога"""
+        if result.get('duplicate'):
+            return True
+        score = result.get('change_score')
+        return bool(self.change_threshold) and score is not None and score < self.change_threshold
+
+    def _is_suspect(self, result) -> bool:
+        """Кадр подозрительный и не отправляется (SCHEDULE_SKIP_SUSPECT)"""
+        return self.skip_suspect and bool(result.get('suspect'))
+
+    def _should_send(self, result) -> bool:
+        """Успешный кадр нужно отправить в чат"""
+        return not self._is_unchanged(result) and not self._is_suspect(result)
+
+    def _build_mosaic(self, results) -> Optional[list]:
+        """Листы мозаики для результатов задания (None - отправить кадры альбомом)"""
+        try:
+            started = time.monotonic()
+            sheets = self.mosaic.build(results)
+            logger.info(f"Мозаика из {len(results)} кадров собрана за {time.monotonic() - started:.2f} с")
+            return sheets or None
+        except Exception as e:
+            logger.error(f"Ошибка сборки мозаики: {e}")
+            return None
+
+    def _prepare_uploads(self, results) -> Optional[int]:
+        """
+        Уменьшение успешных кадров перед отправкой (result['upload_data'])
+
+        Returns:
+            int: объем подготовленных кадров в байтах или None, если подготовка отключена
+        """
+        if not self.upload_transformer or not self.upload_transformer.enabled:
+            return None
+
+        prepared = []
+        contents = []
+        for result in results:
+            if result['error'] or not self._should_send(result) or not result.get('file_path'):
+                continue
+            try:
+                with open(result['file_path'], 'rb') as f:
+                    contents.append(f.read())
+                prepared.append(result)
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать кадр {result['file_path']}: {e}")
+
+        for result, data in zip(prepared, self.upload_transformer.transform_many(contents)):
+            result['upload_data'] = data
+        return sum(len(result['upload_data']) for result in prepared)
 
-            # Выполняем захват со всех камер
-            results = self.camera_manager.capture_all()
+    def _job_title(self, job: ScheduleJob) -> str:
+        """Строка с названием задания для сообщений (для основного задания не выводится)"""
+        if job.job_id == DEFAULT_JOB_ID:
+            return ""
+        return f"Задание: {job.name}\n"
 
+    @staticmethod
+    def _open_upload(result):
+        """Файл для отправки: подготовленный кадр или исходный файл"""
+        if result.get('upload_data'):
+            return BytesIO(result['upload_data'])
+        return open(result['file_path'], 'rb')
+
+    def _send_photos(self, chat_id, results):
+        """Отправка кадров по одному"""
+        for result in results:
+            try:
+                with self._open_upload(result) as photo:
+                    self.bot.send_photo(
+                        chat_id=chat_id,
+                        photo=photo,
+                        caption=result.get('camera_name', ''),
+                        parse_mode='HTML'
+                    )
+                time.sleep(0.5)  # Небольшая задержка между отправками
+            except Exception as single_err:
+                logger.error(f"Ошибка при отправке одного фото: {single_err}")
+
+    def _send_mosaic(self, job: ScheduleJob, chat_id, sheets) -> bool:
+        """
+        Отправка листов мозаики (один лист - одно фото, несколько - один альбом)
+
+        Returns:
+            bool: True, если мозаика отправлена
+        """
+        caption = f"{job.name if job.job_id != DEFAULT_JOB_ID else 'Все камеры'}: {sum(len(sheet['camera_ids']) for sheet in sheets)} камер"
+        try:
+            if len(sheets) == 1:
+                self.bot.send_photo(chat_id=chat_id, photo=BytesIO(sheets[0]['data']), caption=caption)
+            else:
+                for i in range(0, len(sheets), 10):
+                    self.bot.send_media_group(
+                        chat_id=chat_id,
+                        media=[
+                            InputMediaPhoto(media=sheet['data'], caption=caption if i + n == 0 else None)
+                            for n, sheet in enumerate(sheets[i:i+10])
+                        ]
+                    )
+            logger.info(f"Отправлена мозаика: {len(sheets)} лист(ов)")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при отправке мозаики: {e}")
+            return False
+
+    def _deliver(self, job: ScheduleJob, chat_id, results, start_message=None, sheets=None):
+        """Отправка снимков задания в чат (sheets - готовые листы мозаики вместо альбома)"""
+        try:
             # Подсчитываем результаты и собираем успешные файлы
             successful = []
             failed = []
+            unchanged = []
+            suspect = []
             media_group = []
 
             for i, result in enumerate(results):
-                if not result['error'] and os.path.exists(result.get('file_path', '')):
+                if not result['error'] and self._is_unchanged(result):
+                    # Кадр не изменился с прошлой отправки (DUPLICATE_POLICY, CHANGE_ALERT_THRESHOLD)
+                    unchanged.append(result)
+                elif not result['error'] and self._is_suspect(result):
+                    # Темный, однотонный, размытый или зависший кадр (QUALITY_CHECK)
+                    suspect.append(result)
+                elif not result['error'] and (result.get('upload_data') or os.path.exists(result.get('file_path') or '')):
                     successful.append(result)
+                    if sheets:
+                        continue
                     # Добавляем в медиа-группу
-                    with open(result['file_path'], 'rb') as photo:
+                    with self._open_upload(result) as photo:
                         # Для python-telegram-bot используем InputMediaPhoto
                         media_group.append(
                             InputMediaPhoto(
@@ -325,44 +1260,51 @@ class CameraScheduler:
                 else:
                     failed.append(result)
 
+            if sheets:
+                if not self._send_mosaic(job, chat_id, sheets):
+                    # Мозаику отправить не удалось - отправляем кадры по одному
+                    self._send_photos(chat_id, successful)
+
             # Отправляем скриншоты одним сообщением (альбомом)
-            if media_group:
+            elif media_group:
                 try:
                     # Разбиваем на части по 10 фото (ограничение Telegram)
                     for i in range(0, len(media_group), 10):
                         self.bot.send_media_group(
-                            chat_id=self.chat_id,
+                            chat_id=chat_id,
                             media=media_group[i:i+10]
                         )
                     logger.info(f"Отправлен альбом из {len(media_group)} изображений")
                 except Exception as e:
                     logger.error(f"Ошибка при отправке альбома: {e}")
                     # Если не удалось отправить альбом, отправляем по одному
-                    for result in successful:
-                        try:
-                            with open(result['file_path'], 'rb') as photo:
-                                self.bot.send_photo(
-                                    chat_id=self.chat_id,
-                                    photo=photo,
-                                    caption=result.get('camera_name', ''),
-                                    parse_mode='HTML'
-                                )
-                            time.sleep(0.5)  # Небольшая задержка между отправками
-                        except Exception as single_err:
-                            logger.error(f"Ошибка при отправке одного фото: {single_err}")
-
-            # Обновляем статистику
-            self.execution_count += 1
-            self.last_execution = datetime.now()
-
-            # Обновляем время следующего запуска
-            self._update_next_run_time()
+                    self._send_photos(chat_id, successful)
 
             # Отправляем итоговое сообщение
-            result_text = f"<b>📊 Автозахват завершен</b>\n\n"
+            result_text = f"<b>📊 Автозахват завершен</b>\n{self._job_title(job)}\n"
 
             if successful:
                 result_text += f"✅ Успешно: {len(successful)} камер\n"
+                scored = sorted(
+                    (result for result in successful if result.get('change_score') is not None),
+                    key=lambda result: result['change_score'], reverse=True
+                )
+                if scored:
+                    result_text += "📈 Изменения: " + ', '.join(
+                        f"{result.get('camera_name', result.get('camera_id'))} {result['change_score']:.0f}%"
+                        for result in scored[:5]
+                    ) + "\n"
+            if unchanged:
+                names = ', '.join(result.get('camera_name', str(result.get('camera_id'))) for result in unchanged[:10])
+                if len(unchanged) > 10:
+                    names += f" и еще {len(unchanged) - 10}"
+                result_text += f"⏸️ Без изменений: {len(unchanged)} камер ({names})\n"
+            if suspect:
+                result_text += f"⚠️ Подозрительные кадры: {len(suspect)} камер\n"
+                for result in suspect[:5]:
+                    result_text += f"   • {result.get('camera_name', result.get('camera_id'))}: {describe_reasons(result['suspect'])}\n"
+                if len(suspect) > 5:
+                    result_text += f"   ... и еще {len(suspect) - 5}\n"
             if failed:
                 result_text += f"❌ Ошибки: {len(failed)} камер\n"
                 # Добавляем информацию об ошибках
@@ -374,8 +1316,8 @@ class CameraScheduler:
             result_text += f"\n⏱️ Время: {datetime.now().strftime('%H:%M:%S')}\n"
 
             # Добавляем информацию о следующем запуске
-            if self.next_run:
-                next_run_str = self.next_run.strftime('%Y-%m-%d %H:%M:%S')
+            if job.next_run:
+                next_run_str = job.next_run.strftime('%Y-%m-%d %H:%M:%S')
                 result_text += f"📅 Следующий запуск: {next_run_str}"
             else:
                 result_text += f"📅 Следующий запуск: не определено"
@@ -384,14 +1326,14 @@ class CameraScheduler:
             try:
                 if start_message:
                     self.bot.send_message(
-                        chat_id=self.chat_id,
+                        chat_id=chat_id,
                         text=result_text,
                         parse_mode='HTML',
                         reply_to_message_id=start_message.message_id
                     )
                 else:
                     self.bot.send_message(
-                        chat_id=self.chat_id,
+                        chat_id=chat_id,
                         text=result_text,
                         parse_mode='HTML'
                     )
@@ -401,10 +1343,10 @@ class CameraScheduler:
             logger.info(f"Планировщик: захват завершен ({len(successful)} успешно, {len(failed)} ошибок)")
 
         except Exception as e:
-            logger.error(f"Ошибка при автоматическом захвате: {e}")
+            logger.error(f"Ошибка при отправке результатов захвата: {e}")
             try:
                 self.bot.send_message(
-                    chat_id=self.chat_id,
+                    chat_id=chat_id,
                     text=f"❌ <b>Ошибка при автоматическом захвате:</b>\n{str(e)[:100]}",
                     parse_mode='HTML'
                 )
@@ -418,22 +1360,70 @@ class CameraScheduler:
             self._execute_capture()
         else:
             logger.warning("Планировщик не запущен, принудительный запуск невозможен")
-    
+
     def get_schedule_info(self) -> str:
         """Возвращает информацию о текущем расписании"""
-        if self.mode == "interval":
-            return f"Интервальный режим: каждые {self.interval_minutes} минут"
-        elif self.mode == "cron":
-            return f"Cron-режим: {self.cron_expression}"
-        elif self.mode == "time_list":
-            return f"Режим списка времени: {', '.join(self.time_list)}"
-        else:
-            return "Режим не определен"
-    
+        job = self.default_job
+        info = job.trigger.describe() if job else "Основное расписание не задано"
+        extra_jobs = len(self.jobs) - (1 if job else 0)
+        if extra_jobs:
+            info += f" (+ заданий: {extra_jobs})"
+        return info
+
+    def get_jobs_info(self) -> List[dict]:
+        """Информация о всех заданиях"""
+        with self.lock:
+            return [
+                {
+                    'id': job.job_id,
+                    'name': job.name,
+                    'schedule': job.trigger.describe(),
+                    'cameras': ', '.join(map(str, job.camera_ids)) if job.camera_ids else 'все',
+                    'next_run': job.next_run,
+                    'execution_count': job.execution_count,
+                    'active_runs': job.active_runs,
+                    'skipped_count': job.skipped_count,
+                    'overrun_count': job.overrun_count,
+                    'last_duration': job.last_duration,
+                    'last_interval': job.last_interval
+                }
+                for job in sorted(self.jobs.values(), key=lambda j: j.next_run or datetime.max)
+            ]
+
+    def get_history(self, limit: int = 10) -> dict:
+        """
+        Последние запуски из журнала и перцентили длительности этапов
+
+        Returns:
+            dict: runs - последние limit запусков (от новых к старым),
+                  summary - этап -> {p50, p90, p99, count} по всем запускам в памяти журнала
+        """
+        if not self.journal:
+            return {'runs': [], 'summary': {}}
+
+        entries = self.journal.get_all_recent()
+        series = {
+            'duration': [e['duration'] for e in entries if e.get('duration') is not None],
+            # Задержка догоняющих запусков - время простоя бота, а не планировщика
+            'lag': [e['lag'] for e in entries if e.get('lag') is not None and not e.get('catchup')],
+            'capture': [e['capture_seconds'] for e in entries if e.get('capture_seconds') is not None],
+            'upload': [e['upload_seconds'] for e in entries if e.get('upload_seconds')],
+            'camera_latency': [c['latency'] for e in entries for c in e.get('cameras', []) if c.get('latency') is not None],
+            'skew': [abs(c['skew']) for e in entries for c in e.get('cameras', []) if c.get('skew') is not None],
+        }
+        summary = {
+            name: {
+                'p50': percentile(values, 50),
+                'p90': percentile(values, 90),
+                'p99': percentile(values, 99),
+                'count': len(values)
+            }
+            for name, values in series.items() if values
+        }
+        return {'runs': self.journal.get_recent(limit), 'summary': summary}
+
     def get_next_run_info(self) -> str:
         """Возвращает информацию о следующем запуске"""
         if self.next_run:
             return self.next_run.strftime('%Y-%m-%d %H:%M:%S')
         return "Не определено"
-
-
@@ -0,0 +1,35 @@
+# tests/test_archive_export.py
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO
+from archive_export import ArchiveExporter
+from frame_storage import FrameStorage
+
+class FakeBot:
+    def __init__(self):
+        self.documents = {}
+
+    def send_document(self, chat_id, document, filename, caption, timeout):
+        # Часть сформирована во временном файле, а не в BytesIO
+        assert not isinstance(document, BytesIO)
+        self.documents[filename] = document.read()
+
+def test_export_to_telegram_splits_into_valid_parts(tmp_path):
+    storage = FrameStorage({'screenshots_dir': tmp_path, 'storage_mode': 'cas'})
+    start = datetime.now() - timedelta(hours=1)
+    frames = [bytes([index]) * 400_000 for index in range(12)]
+    for index, content in enumerate(frames):
+        storage.save(1, 'camera', content, timestamp=start + timedelta(minutes=index))
+
+    bot = FakeBot()
+    exporter = ArchiveExporter(storage, part_limit=2 * 1024 * 1024)
+    stats = exporter.export_to_telegram(bot, 1, 1, start, datetime.now(), 'export')
+
+    assert stats['frames'] == len(frames)
+    assert stats['parts'] == len(bot.documents) > 1
+    exported = []
+    for name in sorted(bot.documents, key=lambda name: int(name.rsplit('part', 1)[1][:-4])):
+        assert len(bot.documents[name]) <= 2 * 1024 * 1024
+        with zipfile.ZipFile(BytesIO(bot.documents[name])) as archive:
+            exported.extend(archive.read(entry) for entry in archive.namelist())
+    assert exported == frames
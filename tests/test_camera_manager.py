@@ -0,0 +1,42 @@
+# tests/test_camera_manager.py
+import pytest
+from camera_manager import CameraManager
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv('CAMERA_1_NAME', 'Двор')
+    monkeypatch.setenv('CAMERA_1_URL', 'http://camera.local/snapshot.jpg')
+    monkeypatch.setenv('CAMERA_1_PREVIEW_URL', 'http://camera.local/preview.jpg')
+    monkeypatch.delenv('CAMERA_2_NAME', raising=False)
+    monkeypatch.delenv('NVR_1_URL', raising=False)
+    manager = CameraManager({
+        'screenshots_dir': tmp_path,
+        'timeout': 1,
+        'retry_count': 1,
+        'preview_retry_minutes': 30
+    })
+    manager.requested = []
+
+    def capture(camera, profile='main', scheduled=False):
+        manager.requested.append(profile)
+        if profile == 'preview':
+            return {'file_path': None, 'image_data': None, 'error': "Таймаут"}
+        return {'file_path': 'main.jpg', 'image_data': b'', 'error': None}
+
+    monkeypatch.setattr(manager, 'capture_from_http', capture)
+    return manager
+
+def test_preview_falls_back_to_main(manager):
+    result = manager.capture_image(1, profile='preview')
+    assert result['error'] is None
+    assert manager.requested == ['preview', 'main']
+
+def test_failed_preview_is_not_retried_until_expired(manager, monkeypatch):
+    manager.capture_image(1, profile='preview')
+    manager.capture_image(1, profile='preview')
+    assert manager.requested == ['preview', 'main', 'main']
+
+    # После PREVIEW_RETRY_MINUTES дополнительный поток пробуется снова
+    monkeypatch.setitem(manager.preview_unavailable, 1, 0)
+    manager.capture_image(1, profile='preview')
+    assert manager.requested[-2:] == ['preview', 'main']
@@ -0,0 +1,21 @@
+# tests/test_capture_workers.py
+from collections import Counter
+from capture_workers import HashRing
+
+CAMERAS = range(1, 1001)
+
+def test_ring_is_deterministic():
+    first, second = HashRing(range(4)), HashRing(range(4))
+    assert [first.get_node(camera_id) for camera_id in CAMERAS] == [second.get_node(camera_id) for camera_id in CAMERAS]
+
+def test_ring_spreads_cameras_evenly():
+    counts = Counter(HashRing(range(4)).get_node(camera_id) for camera_id in CAMERAS)
+    assert set(counts) == {0, 1, 2, 3}
+    assert max(counts.values()) < 1.5 * len(CAMERAS) / 4
+
+def test_adding_process_moves_only_its_share():
+    before, after = HashRing(range(4)), HashRing(range(5))
+    moved = [camera_id for camera_id in CAMERAS if before.get_node(camera_id) != after.get_node(camera_id)]
+    # Переезжают только камеры нового процесса (около 1/5)
+    assert all(after.get_node(camera_id) == 4 for camera_id in moved)
+    assert len(moved) < 0.3 * len(CAMERAS)
@@ -0,0 +1,98 @@
+# tests/test_cron.py
+import calendar
+import random
+from datetime import datetime, timedelta
+import pytest
+from cron import CronExpression
+
+EXPRESSIONS = [
+    '* * * * *',
+    '*/15 * * * *',
+    '0 9-18 * * *',
+    '30 8 * * 1-5',
+    '0 0 1 * *',
+    '0 12 13 * 5',
+    '5/20 */3 * JAN,JUL SUN',
+    '0 0 29 2 *',
+    '59 23 31 * *',
+    '0 22 * * 7',
+    '*/7 9-17/2 1-7 * MON',
+    '15,45 6,18 10-20/5 3-11 *',
+]
+
+NAMES = {name.upper(): i for i, name in enumerate(calendar.month_abbr) if name}
+NAMES.update({'SUN': 0, 'MON': 1, 'TUE': 2, 'WED': 3, 'THU': 4, 'FRI': 5, 'SAT': 6})
+
+def expand(field, low, high):
+    """Эталонный разбор поля в множество значений"""
+    values = set()
+    for item in field.split(','):
+        item, _, step = item.partition('/')
+        step = int(step or 1)
+        if item == '*':
+            start, end = low, high
+        elif '-' in item:
+            start, end = (int(NAMES.get(v, v)) for v in item.split('-'))
+        else:
+            start = int(NAMES.get(item, item))
+            end = high if step > 1 else start
+        values.update(range(start, end + 1, step))
+    return values
+
+def reference_next(expression, after):
+    """Эталон: перебор минут (дни и часы без совпадений пропускаются целиком)"""
+    fields = expression.split()
+    minutes, hours = expand(fields[0], 0, 59), expand(fields[1], 0, 23)
+    days, months = expand(fields[2], 1, 31), expand(fields[3], 1, 12)
+    weekdays = {day % 7 for day in expand(fields[4], 0, 6 if fields[4].startswith('*') else 7)}
+    day_restricted, weekday_restricted = not fields[2].startswith('*'), not fields[4].startswith('*')
+
+    def day_matches(t):
+        by_day = t.day in days
+        by_weekday = (t.weekday() + 1) % 7 in weekdays
+        if day_restricted and weekday_restricted:
+            return by_day or by_weekday
+        return (by_day or not day_restricted) and (by_weekday or not weekday_restricted)
+
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = after + timedelta(days=366 * 9)
+    while t < limit:
+        if t.month not in months or not day_matches(t):
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute in minutes:
+            return t
+        else:
+            t += timedelta(minutes=1)
+    return None
+
+def start_points():
+    fixed = [
+        datetime(2024, 1, 1, 0, 0), datetime(2024, 2, 28, 23, 59, 30), datetime(2023, 12, 31, 23, 59),
+        datetime(2024, 7, 14, 12, 13), datetime(2025, 3, 31, 17, 59, 59)
+    ]
+    rng = random.Random(2024)
+    return fixed + [datetime(2020, 1, 1) + timedelta(minutes=rng.randrange(8 * 365 * 24 * 60), seconds=rng.randrange(60))
+                    for _ in range(15)]
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_next_after_matches_brute_force(expression):
+    cron = CronExpression(expression)
+    for after in start_points():
+        expected = reference_next(expression, after)
+        assert cron.next_after(after) == expected, after
+        assert cron.matches(expected)
+
+def test_next_n_is_strictly_increasing():
+    runs = CronExpression('*/20 9 * * *').next_n(5, datetime(2024, 5, 1, 9, 20))
+    assert runs == [datetime(2024, 5, 1, 9, 40), datetime(2024, 5, 2, 9, 0), datetime(2024, 5, 2, 9, 20),
+                    datetime(2024, 5, 2, 9, 40), datetime(2024, 5, 3, 9, 0)]
+
+def test_impossible_expression_has_no_runs():
+    assert CronExpression('0 0 30 2 *').next_after(datetime(2024, 1, 1)) is None
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '*/0 * * * *', '0 0 32 * *', '5-1 * * * *', '0 0 * * FOO'])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
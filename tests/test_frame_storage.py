@@ -0,0 +1,95 @@
+# tests/test_frame_storage.py
+import threading
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+import pytest
+from PIL import Image, ImageDraw, features
+from frame_storage import FrameStorage
+from transcoder import ArchiveTranscoder
+
+def make_jpeg(shade=0):
+    image = Image.new('RGB', (320, 240), (40, 90, 140))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 320, 8):
+        draw.line([(x, 0), (320 - x, 240)], fill=(x % 255, shade, 200 - x % 200))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+@pytest.fixture
+def storage(tmp_path):
+    return FrameStorage({'screenshots_dir': tmp_path, 'storage_mode': 'cas'})
+
+@pytest.mark.skipif(not features.check('webp'), reason="Pillow без WebP")
+def test_save_transcode_pack_round_trip(storage):
+    old = datetime.now() - timedelta(days=2)
+    content = make_jpeg()
+    first = storage.save(1, 'camera', content, timestamp=old)
+
+    transcoder = ArchiveTranscoder(storage, {'transcode_age_hours': 1, 'transcode_workers': 1})
+    assert transcoder.run_once() == 1
+    transcoded = storage.get_frame(first['frame_id'])
+    assert transcoded['format'] == 'webp'
+    webp = storage.read_frame(transcoded)
+    assert len(webp) == transcoded['size']
+
+    # Тот же кадр после перекодирования ссылается на WebP с его размером и форматом
+    second = storage.save(1, 'camera', content, timestamp=old + timedelta(minutes=1))
+    assert second['deduplicated']
+    duplicate = storage.get_frame(second['frame_id'])
+    assert (duplicate['file_path'], duplicate['format'], duplicate['size']) == (
+        transcoded['file_path'], 'webp', len(webp))
+    # WebP не попадает в повторное перекодирование
+    assert transcoder.run_once() == 0
+
+    other = storage.save(1, 'camera', make_jpeg(shade=120), timestamp=old + timedelta(minutes=2))
+    assert storage.pack_cold_frames(1) == 3
+
+    for frame_id in (first['frame_id'], second['frame_id']):
+        frame = storage.get_frame(frame_id)
+        assert frame['tier'] == 'cold'
+        assert storage.read_frame(frame) == webp
+    cold_jpeg = storage.get_frame(other['frame_id'])
+    assert cold_jpeg['format'] == 'jpeg'
+    assert storage.read_frame(cold_jpeg) == make_jpeg(shade=120)
+
+    frames = list(storage.iter_range(1, old - timedelta(hours=1), old + timedelta(hours=1)))
+    assert [frame['frame_id'] for frame in frames] == [first['frame_id'], second['frame_id'], other['frame_id']]
+
+def test_transcode_failure_is_not_retried(storage):
+    old = datetime.now() - timedelta(days=2)
+    broken = storage.save(1, 'camera', b'not a jpeg', timestamp=old)
+
+    transcoder = ArchiveTranscoder(storage, {'transcode_age_hours': 1, 'transcode_workers': 1})
+    assert transcoder.run_once() == 1
+    assert storage.get_frame(broken['frame_id'])['format'] == 'jpeg-failed'
+    assert transcoder.get_stats()['failed_frames'] == 1
+    assert transcoder.run_once() == 0
+
+def test_dedup_waits_for_packing_in_other_process(tmp_path, storage, monkeypatch):
+    old = datetime.now() - timedelta(days=2)
+    content = make_jpeg()
+    storage.save(1, 'camera', content, timestamp=old)
+    # Процесс захвата работает с тем же индексом через свое соединение
+    worker = FrameStorage({'screenshots_dir': tmp_path, 'storage_mode': 'cas'})
+
+    saved = {}
+    thread = threading.Thread(target=lambda: saved.update(worker.save(1, 'camera', content, timestamp=old)))
+    unlink = Path.unlink
+
+    def unlink_while_saving(path, *args, **kwargs):
+        # Сохранение того же кадра начинается в момент удаления горячего объекта упаковкой
+        thread.start()
+        thread.join(0.3)
+        assert thread.is_alive()
+        unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(Path, 'unlink', unlink_while_saving)
+    assert storage.pack_cold_frames(1) == 1
+    monkeypatch.setattr(Path, 'unlink', unlink)
+    thread.join()
+
+    # Объект удален упаковкой до дедупликации - кадр записан заново
+    frame = worker.get_frame(saved['frame_id'])
+    assert worker.read_frame(frame) == content
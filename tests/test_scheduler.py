@@ -0,0 +1,70 @@
+# tests/test_scheduler.py
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from leader_lease import LeaderLease
+from scheduler import CameraScheduler, ScheduleJob
+
+@pytest.fixture
+def scheduler():
+    camera_manager = SimpleNamespace(cameras={1: {'name': 'Двор'}}, get_capture_latency=lambda camera_id: None)
+    return CameraScheduler(camera_manager, None, 1, schedule_config=None, max_parallel=2, run_workers=4)
+
+def test_jobs_at_returns_only_due_jobs(scheduler):
+    now = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    for index in range(1000):
+        # Каждое десятое задание - раз в минуту, остальные реже
+        job = ScheduleJob(f"job{index}", 1 if index % 10 == 0 else 5 + index % 50)
+        scheduler.jobs[job.job_id] = job
+        scheduler._schedule_job(job, now)
+
+    target = scheduler._peek_next_time()
+    due = scheduler._jobs_at(target)
+    assert sorted(job.job_id for job in due) == sorted(f"job{index}" for index in range(0, 1000, 10))
+    # Записи возвращены в кучу и извлекаются проходом
+    assert len(scheduler.heap) == 1000
+    assert sorted(job.job_id for job in scheduler._pop_due_jobs(target)) == sorted(job.job_id for job in due)
+
+def test_jobs_at_skips_removed_jobs(scheduler):
+    now = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    for job_id in ('first', 'second'):
+        job = ScheduleJob(job_id, 1)
+        scheduler.jobs[job_id] = job
+        scheduler._schedule_job(job, now)
+    scheduler.remove_job('first')
+
+    assert [job.job_id for job in scheduler._jobs_at(now + timedelta(minutes=1))] == ['second']
+
+def test_run_pool_does_not_grow_with_jobs(scheduler):
+    scheduler.start()
+    try:
+        for index in range(100):
+            scheduler.add_job(ScheduleJob(f"job{index}", 60))
+        assert scheduler.executor._max_workers == 4
+    finally:
+        scheduler.stop()
+
+def test_stopped_instance_without_leader_persists_schedule(tmp_path):
+    camera_manager = SimpleNamespace(cameras={}, get_capture_latency=lambda camera_id: None)
+    lease = LeaderLease(tmp_path / 'index.db')
+    state_file = tmp_path / 'state.json'
+    scheduler = CameraScheduler(camera_manager, None, 1, schedule_config=60, state_file=state_file, lease=lease)
+
+    assert scheduler.get_other_leader() is None
+    scheduler.set_schedule(15)
+    assert json.loads(state_file.read_text(encoding='utf-8'))['default_schedule'] == 15
+
+def test_standby_does_not_overwrite_leader_state(tmp_path):
+    camera_manager = SimpleNamespace(cameras={}, get_capture_latency=lambda camera_id: None)
+    leader = LeaderLease(tmp_path / 'index.db')
+    leader.holder = 'other-host:1'
+    assert leader.acquire()
+    state_file = tmp_path / 'state.json'
+    scheduler = CameraScheduler(
+        camera_manager, None, 1, schedule_config=60, state_file=state_file, lease=LeaderLease(tmp_path / 'index.db')
+    )
+
+    assert scheduler.get_other_leader() == 'other-host:1'
+    scheduler.set_schedule(15)
+    assert not state_file.exists()
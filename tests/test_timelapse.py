@@ -0,0 +1,104 @@
+# tests/test_timelapse.py
+import struct
+from datetime import datetime, timedelta
+from io import BytesIO
+import pytest
+from PIL import Image, ImageStat
+import timelapse
+from frame_storage import FrameStorage
+from timelapse import AviMjpegWriter, TimelapseBuilder
+
+DAY = datetime(2024, 5, 1)
+FRAMES = 45
+
+def read_avi(path):
+    """Кадры AVI по индексу idx1 с проверкой размеров RIFF и LIST"""
+    data = path.read_bytes()
+    assert data[:4] == b'RIFF' and data[8:12] == b'AVI '
+    assert struct.unpack('<I', data[4:8])[0] == len(data) - 8
+
+    chunks = {}
+    position = 12
+    while position < len(data):
+        chunk_id, size = struct.unpack('<4sI', data[position:position + 8])
+        key = data[position + 8:position + 12] if chunk_id == b'LIST' else chunk_id
+        chunks[key] = (position, size)
+        position += 8 + size + (size & 1)
+    assert position == len(data)
+
+    movi_start = chunks[b'movi'][0] + 8
+    idx_position, idx_size = chunks[b'idx1']
+    frames = []
+    for offset in range(idx_position + 8, idx_position + 8 + idx_size, 16):
+        chunk_id, flags, frame_offset, size = struct.unpack('<4sIII', data[offset:offset + 16])
+        frame_position = movi_start + frame_offset
+        assert chunk_id == b'00dc' and data[frame_position:frame_position + 4] == b'00dc'
+        assert struct.unpack('<I', data[frame_position + 4:frame_position + 8])[0] == size
+        frames.append(data[frame_position + 8:frame_position + 8 + size])
+
+    total_frames = struct.unpack('<I', data[48:52])[0]
+    width, height = struct.unpack('<II', data[64:72])
+    return frames, total_frames, (width, height)
+
+def frame_level(content):
+    with Image.open(BytesIO(content)) as image:
+        return round(ImageStat.Stat(image.convert('L')).mean[0])
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FrameStorage({'screenshots_dir': tmp_path / 'shots'})
+    for i in range(FRAMES):
+        image = Image.new('L', (320, 180), i * 5).convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=95)
+        storage.save(1, 'camera', buffer.getvalue(), timestamp=DAY + timedelta(minutes=10 * i))
+    # Кадр другой камеры и кадр следующих суток в таймлапс не попадают
+    storage.save(2, 'camera', buffer.getvalue(), timestamp=DAY + timedelta(hours=1))
+    storage.save(1, 'camera', buffer.getvalue(), timestamp=DAY + timedelta(days=1, minutes=1))
+    return storage
+
+@pytest.fixture
+def builder(storage, tmp_path):
+    return TimelapseBuilder(storage, {
+        'screenshots_dir': tmp_path / 'shots', 'timelapse_width': 160, 'timelapse_fps': 10, 'timelapse_workers': 2
+    })
+
+def test_build_day(builder):
+    result = builder.build_day(1, DAY.date())
+    assert result['error'] is None and result['frames'] == FRAMES and not result['resumed']
+
+    frames, total_frames, size = read_avi(builder.output_path(1, DAY))
+    assert total_frames == FRAMES and size == (160, 90)
+    assert [frame_level(frame) for frame in frames] == pytest.approx([i * 5 for i in range(FRAMES)], abs=2)
+
+    # Готовый файл не пересобирается
+    assert builder.build_day(1, DAY.date())['frames'] == 0
+
+def test_resume_after_interruption(builder, monkeypatch):
+    monkeypatch.setattr(timelapse, 'CHECKPOINT_FRAMES', 10)
+    add_frame = AviMjpegWriter.add_frame
+
+    def interrupted(writer, data):
+        if writer.frames == 27:
+            raise OSError("диск отключен")
+        add_frame(writer, data)
+
+    monkeypatch.setattr(AviMjpegWriter, 'add_frame', interrupted)
+    result = builder.build_day(1, DAY.date())
+    path = builder.output_path(1, DAY)
+    assert result['error'] and result['path'] is None and not path.exists()
+    assert path.with_name(path.name + '.checkpoint').exists()
+
+    monkeypatch.setattr(AviMjpegWriter, 'add_frame', add_frame)
+    result = builder.build_day(1, DAY.date())
+    assert result['resumed'] and result['error'] is None and result['frames'] == FRAMES
+
+    # Кадры после контрольной точки (20-26) не дублируются и не теряются
+    frames, total_frames, _ = read_avi(path)
+    assert total_frames == len(frames) == FRAMES
+    assert [frame_level(frame) for frame in frames] == pytest.approx([i * 5 for i in range(FRAMES)], abs=2)
+    assert sorted(p.name for p in path.parent.iterdir()) == [path.name]
+
+def test_no_frames(builder):
+    result = builder.build_day(3, DAY.date())
+    assert result['path'] is None and result['error']
@@ -0,0 +1,32 @@
+# tests/test_utils.py
+from datetime import datetime
+import pytest
+from utils import parse_datetime, parse_datetime_args
+
+NOW = datetime(2024, 5, 10, 12, 30)
+
+@pytest.mark.parametrize('value, expected', [
+    ('09:15', datetime(2024, 5, 10, 9, 15)),
+    ('09:15:30', datetime(2024, 5, 10, 9, 15, 30)),
+    ('2024-05-01', datetime(2024, 5, 1)),
+    ('2024-05-01_09:00', datetime(2024, 5, 1, 9, 0)),
+    ('2024-05-01T09:00:05', datetime(2024, 5, 1, 9, 0, 5)),
+    ('01.05.2024', datetime(2024, 5, 1)),
+    ('01.05.2024_18:20', datetime(2024, 5, 1, 18, 20)),
+    ('01.05', datetime(2024, 5, 1)),
+    ('01.05_18:20', datetime(2024, 5, 1, 18, 20)),
+    ('29.02', datetime(2024, 2, 29)),
+    ('29.02_07:45', datetime(2024, 2, 29, 7, 45)),
+])
+def test_parse_datetime(value, expected):
+    assert parse_datetime(value, NOW) == expected
+
+@pytest.mark.parametrize('value', ['29.02', '31.04', '25:00', '2024-13-01', 'вчера'])
+def test_parse_datetime_invalid(value):
+    with pytest.raises(ValueError):
+        parse_datetime(value, datetime(2023, 5, 10) if value == '29.02' else NOW)
+
+def test_parse_datetime_args_joins_date_and_time():
+    assert parse_datetime_args(['2024-05-01', '09:00', '10.05', '18:00'], NOW) == [
+        datetime(2024, 5, 1, 9, 0), datetime(2024, 5, 10, 18, 0)
+    ]
@@ -0,0 +1,305 @@
+# timelapse.py
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from image_ops import lower_priority, render_frame
+
+logger = logging.getLogger(__name__)
+
+# Запись индекса idx1: код потока, флаги (ключевой кадр), смещение, размер
+INDEX_ENTRY = struct.Struct('<4sIII')
+AVIIF_KEYFRAME = 0x10
+AVIF_HASINDEX = 0x10
+# Контрольная точка сохраняется после каждой такой партии кадров
+CHECKPOINT_FRAMES = 100
+
+class AviMjpegWriter:
+    """
+    Запись MJPEG в контейнер AVI по одному кадру
+
+    Кадры дописываются в список movi, записи индекса - в отдельный файл .idx,
+    поэтому память не зависит от числа кадров. Размеры и число кадров в
+    заголовке, а также индекс idx1 записываются при закрытии (finish).
+    """
+
+    def __init__(self, path, width: int, height: int, fps: float, resume: dict = None):
+        """
+        Args:
+            resume: состояние из checkpoint() - продолжение прерванной записи
+        """
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + '.idx')
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        if resume:
+            # Все, что записано после контрольной точки, отбрасывается
+            self.frames = resume['frames']
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(resume['movi_end'])
+            self.file.seek(resume['movi_end'])
+            self.index = open(self.index_path, 'r+b')
+            self.index.truncate(self.frames * INDEX_ENTRY.size)
+            self.index.seek(self.frames * INDEX_ENTRY.size)
+            self.positions = resume['positions']
+        else:
+            self.frames = 0
+            self.file = open(self.path, 'wb')
+            self.index = open(self.index_path, 'w+b')
+            self.positions = self._write_header()
+
+    def _write_header(self) -> dict:
+        """Заголовок AVI; возвращает позиции полей, которые заполняются при закрытии"""
+        f = self.file
+        positions = {}
+        f.write(b'RIFF\0\0\0\0AVI ')
+        f.write(b'LIST')
+        hdrl_size_pos = f.tell()
+        f.write(b'\0\0\0\0hdrl')
+
+        f.write(b'avih' + struct.pack('<I', 56))
+        positions['avih_frames'] = f.tell() + 16
+        f.write(struct.pack(
+            '<IIIIIIIIII16x',
+            int(1_000_000 / self.fps), 0, 0, AVIF_HASINDEX,
+            0, 0, 1, 0, self.width, self.height
+        ))
+
+        f.write(b'LIST')
+        strl_size_pos = f.tell()
+        f.write(b'\0\0\0\0strl')
+        f.write(b'strh' + struct.pack('<I', 56))
+        positions['strh_length'] = f.tell() + 32
+        f.write(struct.pack(
+            '<4s4sIHHIIIIIIIIhhhh',
+            b'vids', b'MJPG', 0, 0, 0, 0,
+            1000, int(self.fps * 1000), 0, 0, 0, 0xFFFFFFFF, 0,
+            0, 0, self.width, self.height
+        ))
+        f.write(b'strf' + struct.pack('<I', 40))
+        f.write(struct.pack(
+            '<IiiHH4sIiiII',
+            40, self.width, self.height, 1, 24, b'MJPG', self.width * self.height * 3, 0, 0, 0, 0
+        ))
+        end = f.tell()
+        self._patch(strl_size_pos, end - strl_size_pos - 4)
+        self._patch(hdrl_size_pos, end - hdrl_size_pos - 4)
+
+        f.write(b'LIST')
+        positions['movi_size'] = f.tell()
+        f.write(b'\0\0\0\0movi')
+        # Смещения в idx1 отсчитываются от кода 'movi'
+        positions['movi_start'] = f.tell() - 4
+        return positions
+
+    def _patch(self, position: int, value: int):
+        current = self.file.tell()
+        self.file.seek(position)
+        self.file.write(struct.pack('<I', value))
+        self.file.seek(current)
+
+    def add_frame(self, data: bytes):
+        """Добавление JPEG-кадра"""
+        offset = self.file.tell() - self.positions['movi_start']
+        self.file.write(b'00dc' + struct.pack('<I', len(data)) + data)
+        if len(data) % 2:
+            self.file.write(b'\0')
+        self.index.write(INDEX_ENTRY.pack(b'00dc', AVIIF_KEYFRAME, offset, len(data)))
+        self.frames += 1
+
+    def checkpoint(self) -> dict:
+        """Сброс записанного на диск и состояние для продолжения записи"""
+        for f in (self.file, self.index):
+            f.flush()
+            os.fsync(f.fileno())
+        return {'frames': self.frames, 'movi_end': self.file.tell(), 'positions': self.positions}
+
+    def finish(self):
+        """Запись индекса и заголовка, удаление временного индекса"""
+        movi_end = self.file.tell()
+        self.index.flush()
+        self.index.seek(0)
+        self.file.write(b'idx1' + struct.pack('<I', self.frames * INDEX_ENTRY.size))
+        while True:
+            chunk = self.index.read(1024 * 1024)
+            if not chunk:
+                break
+            self.file.write(chunk)
+
+        end = self.file.tell()
+        self._patch(4, end - 8)
+        self._patch(self.positions['movi_size'], movi_end - self.positions['movi_size'] - 4)
+        self._patch(self.positions['avih_frames'], self.frames)
+        self._patch(self.positions['strh_length'], self.frames)
+        self.close()
+        self.index_path.unlink(missing_ok=True)
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+class TimelapseBuilder:
+    """
+    Сборка таймлапсов камер из архива
+
+    Кадры за период читаются из индекса по порядку, уменьшаются в пуле
+    процессов и сразу дописываются в AVI (MJPEG). Одновременно в обработке
+    находится не больше нескольких партий кадров, поэтому память не зависит от
+    длины периода. После каждых CHECKPOINT_FRAMES кадров сохраняется
+    контрольная точка: прерванная сборка продолжается с последнего кадра.
+    """
+
+    def __init__(self, storage, config):
+        self.storage = storage
+        self.output_dir = Path(config.get('timelapse_dir') or Path(config['screenshots_dir']) / 'timelapse')
+        self.width = config.get('timelapse_width', 1280)
+        self.fps = config.get('timelapse_fps', 24)
+        self.quality = config.get('timelapse_quality', 80)
+        self.workers = config.get('timelapse_workers') or max(1, (os.cpu_count() or 2) - 1)
+
+    def output_path(self, camera_id, start: datetime) -> Path:
+        """Файл таймлапса камеры за период, начинающийся в start"""
+        return self.output_dir / f"camera{camera_id}_{start.strftime('%Y%m%d_%H%M')}.avi"
+
+    def build_day(self, camera_id, day) -> dict:
+        """Таймлапс камеры за сутки (day - date)"""
+        start = datetime.combine(day, datetime.min.time())
+        return self.build(camera_id, start, start + timedelta(days=1))
+
+    def build(self, camera_id, start: datetime, end: datetime) -> dict:
+        """
+        Сборка таймлапса камеры за период
+
+        Returns:
+            dict: path (None, если кадров нет), frames, seconds, resumed, error
+        """
+        path = self.output_path(camera_id, start)
+        part_path = path.with_name(path.name + '.part')
+        checkpoint_path = path.with_name(path.name + '.checkpoint')
+        result = {'path': None, 'frames': 0, 'seconds': 0.0, 'resumed': False, 'error': None}
+
+        if path.exists() and not checkpoint_path.exists():
+            # Уже собран (например, повторный запуск после перезапуска бота)
+            result['path'] = str(path)
+            return result
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        started = time.monotonic()
+        checkpoint = self._load_checkpoint(checkpoint_path, camera_id, start, end)
+        after = None
+        writer = None
+        try:
+            if checkpoint and part_path.exists():
+                writer = AviMjpegWriter(part_path, checkpoint['width'], checkpoint['height'], checkpoint['fps'], checkpoint)
+                after = tuple(checkpoint['after'])
+                result['resumed'] = True
+                logger.info(f"Таймлапс камеры {camera_id}: продолжение с кадра {writer.frames}")
+
+            frames = self.storage.iter_range(camera_id, start, end, after=after)
+            with ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=lower_priority
+            ) as pool:
+                pending = deque()
+                for frame in frames:
+                    try:
+                        content = self.storage.read_frame(frame)
+                    except OSError as e:
+                        logger.warning(f"Таймлапс: кадр {frame['frame_id']} не прочитан: {e}")
+                        continue
+                    if writer is None:
+                        width, height = self._frame_size(content)
+                        writer = AviMjpegWriter(part_path, width, height, self.fps)
+
+                    pending.append((frame, pool.submit(render_frame, content, writer.width, writer.height, self.quality)))
+                    # Ограничение числа кадров в обработке - память не растет с длиной периода
+                    if len(pending) >= self.workers * 4:
+                        self._write_ready(writer, pending, checkpoint_path, camera_id, start, end, keep=self.workers * 2)
+                self._write_ready(writer, pending, checkpoint_path, camera_id, start, end, keep=0)
+
+            if writer is None:
+                result['error'] = "Нет кадров за период"
+                return result
+
+            result['frames'] = writer.frames
+            writer.finish()
+            writer = None
+            os.replace(part_path, path)
+            checkpoint_path.unlink(missing_ok=True)
+            result['path'] = str(path)
+        except Exception as e:
+            logger.error(f"Ошибка сборки таймлапса камеры {camera_id}: {e}")
+            result['error'] = str(e)
+        finally:
+            if writer:
+                writer.close()
+            result['seconds'] = round(time.monotonic() - started, 1)
+        return result
+
+    def _write_ready(self, writer, pending, checkpoint_path, camera_id, start, end, keep):
+        """Запись обработанных кадров по порядку, пока в очереди больше keep кадров"""
+        while len(pending) > keep:
+            frame, future = pending.popleft()
+            try:
+                data = future.result()
+            except Exception as e:
+                logger.warning(f"Таймлапс: кадр {frame['frame_id']} пропущен: {e}")
+                continue
+            writer.add_frame(data)
+            if writer.frames % CHECKPOINT_FRAMES == 0:
+                self._save_checkpoint(checkpoint_path, writer, camera_id, start, end, frame)
+
+    def _frame_size(self, content):
+        """Размер кадров видео по пропорциям первого кадра (четные стороны)"""
+        with Image.open(BytesIO(content)) as image:
+            width, height = image.size
+        out_width = min(self.width, width) // 2 * 2
+        return out_width, max(2, round(out_width * height / width / 2) * 2)
+
+    def _save_checkpoint(self, path, writer, camera_id, start, end, frame):
+        """Атомарное сохранение контрольной точки"""
+        state = dict(
+            writer.checkpoint(),
+            camera_id=camera_id,
+            start=start.isoformat(),
+            end=end.isoformat(),
+            width=writer.width,
+            height=writer.height,
+            fps=writer.fps,
+            after=[frame['timestamp'].timestamp(), frame['frame_id']]
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.timelapse.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить контрольную точку таймлапса: {e}")
+            Path(tmp_path).unlink(missing_ok=True)
+
+    @staticmethod
+    def _load_checkpoint(path, camera_id, start, end):
+        """Контрольная точка для того же периода (None, если ее нет или она от другой сборки)"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Контрольная точка таймлапса повреждена, сборка заново: {e}")
+            return None
+        if state.get('camera_id') != camera_id or state.get('start') != start.isoformat() or state.get('end') != end.isoformat():
+            return None
+        return state
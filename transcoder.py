@@ -0,0 +1,99 @@
+# transcoder.py
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import features
+from image_ops import lower_priority, transcode_file
+
+logger = logging.getLogger(__name__)
+
+class ArchiveTranscoder:
+    """Фоновое перекодирование архивных кадров в WebP/AVIF"""
+
+    def __init__(self, storage, config):
+        self.storage = storage
+        self.age_hours = config.get('transcode_age_hours', 0)
+        self.quality = config.get('transcode_quality', 70)
+        self.max_bytes = config.get('transcode_max_kb', 0) * 1024
+        self.workers = config.get('transcode_workers') or max(1, (os.cpu_count() or 2) - 1)
+        self.batch_size = config.get('transcode_batch', 500)
+
+        self.image_format = config.get('transcode_format', 'webp')
+        if not features.check(self.image_format):
+            logger.warning(f"Pillow не поддерживает формат '{self.image_format}', используется webp")
+            self.image_format = 'webp'
+
+        self.stats = {
+            'transcoded_frames': 0,
+            'skipped_frames': 0,
+            'failed_frames': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'last_rate': 0.0
+        }
+
+    @property
+    def enabled(self):
+        return self.age_hours > 0
+
+    def run_once(self):
+        """
+        Перекодирование очередной партии кадров
+
+        Returns:
+            int: количество обработанных файлов (перекодированных, оставленных и с ошибкой)
+        """
+        paths = self.storage.list_transcode_candidates(self.age_hours, self.batch_size)
+        if not paths:
+            return 0
+
+        started = time.monotonic()
+        transcoded = 0
+
+        # spawn: процесс бота многопоточный, fork мог бы унести в дочерний захваченную блокировку
+        # или соединение SQLite посреди транзакции (как в capture_workers.py)
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=lower_priority
+        ) as pool:
+            futures = {
+                pool.submit(transcode_file, path, self.image_format, self.quality, self.max_bytes): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                try:
+                    src_path, dst_path, new_size = future.result()
+                except Exception as e:
+                    # Помечаем файл, иначе он будет возвращаться в начале каждой партии
+                    logger.warning(f"Ошибка перекодирования кадра {futures[future]}: {e}")
+                    self.storage.mark_transcode_failed(futures[future])
+                    self.stats['failed_frames'] += 1
+                    continue
+
+                if dst_path is None:
+                    # Перекодирование не уменьшило файл - помечаем, чтобы не пытаться снова
+                    self.storage.replace_transcoded(src_path, src_path, os.path.getsize(src_path), 'jpeg-kept')
+                    self.stats['skipped_frames'] += 1
+                    continue
+
+                old_size = os.path.getsize(src_path)
+                self.storage.replace_transcoded(src_path, dst_path, new_size, self.image_format)
+                self.stats['bytes_before'] += old_size
+                self.stats['bytes_after'] += new_size
+                transcoded += 1
+
+        elapsed = time.monotonic() - started
+        rate = len(paths) / elapsed if elapsed > 0 else 0.0
+        self.stats['transcoded_frames'] += transcoded
+        self.stats['last_rate'] = rate
+
+        logger.info(
+            f"Перекодировано {transcoded} из {len(paths)} кадров в {self.image_format} "
+            f"за {elapsed:.1f} сек ({rate:.1f} кадров/с)"
+        )
+        return len(paths)
+
+    def get_stats(self):
+        """Статистика перекодирования"""
+        return self.stats.copy()
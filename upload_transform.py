@@ -0,0 +1,90 @@
+# upload_transform.py
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from image_ops import prepare_upload
+
+logger = logging.getLogger(__name__)
+
+class UploadTransformer:
+    """
+    Уменьшение кадров перед отправкой в Telegram
+
+    Telegram все равно пережимает фото на сервере, поэтому отправка кадра,
+    уменьшенного до UPLOAD_MAX_EDGE и уложенного в UPLOAD_MAX_KB, сокращает
+    объем и время загрузки без видимой потери. Декодирование и кодирование
+    выполняются в пуле процессов.
+    """
+
+    def __init__(self, config):
+        self.max_edge = config.get('upload_max_edge', 0)
+        self.quality = config.get('upload_quality', 85)
+        self.max_bytes = config.get('upload_max_kb', 0) * 1024
+        self.workers = max(1, config.get('upload_workers', 2))
+        self.pool = None
+        self.lock = threading.Lock()
+        self.stats = {
+            'frames': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'seconds': 0.0
+        }
+
+    @property
+    def enabled(self):
+        return self.max_edge > 0
+
+    def _get_pool(self):
+        """Пул процессов создается при первом использовании"""
+        with self.lock:
+            if self.pool is None:
+                # spawn, как в capture_workers.py: fork многопоточного процесса бота может
+                # унести в дочерний процесс захваченную блокировку или соединение SQLite
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def transform(self, content: bytes) -> bytes:
+        """Кадр для отправки (исходный, если уменьшение не дает выигрыша или не удалось)"""
+        return self.transform_many([content])[0]
+
+    def transform_many(self, contents: list) -> list:
+        """Параллельная подготовка нескольких кадров (порядок сохраняется)"""
+        if not self.enabled or not contents:
+            return contents
+
+        started = time.monotonic()
+        futures = [
+            self._get_pool().submit(prepare_upload, content, self.max_edge, self.quality, self.max_bytes)
+            for content in contents
+        ]
+        results = []
+        for content, future in zip(contents, futures):
+            try:
+                transformed = future.result()
+            except Exception as e:
+                logger.warning(f"Не удалось подготовить кадр к отправке: {e}")
+                transformed = None
+            results.append(transformed if transformed is not None else content)
+
+        with self.lock:
+            self.stats['frames'] += len(contents)
+            self.stats['bytes_before'] += sum(len(content) for content in contents)
+            self.stats['bytes_after'] += sum(len(result) for result in results)
+            self.stats['seconds'] += time.monotonic() - started
+        return results
+
+    def run(self, func, *args):
+        """Выполнение тяжелой обработки изображений (например, сборки анимации) в пуле процессов"""
+        return self._get_pool().submit(func, *args).result()
+
+    def get_stats(self):
+        with self.lock:
+            return self.stats.copy()
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool:
+                self.pool.shutdown(wait=False)
+                self.pool = None
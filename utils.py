@@ -28,4 +28,59 @@ def parse_time(time_str):
     try:
         return datetime.strptime(time_str, "%H:%M").time()
     except ValueError:
-        return datetime.strptime("08:00", "%H:%M").time()
\ No newline at end of file
+        return datetime.strptime("08:00", "%H:%M").time()
+
+def parse_datetime(value, now=None):
+    """
+    Парсинг даты и времени из аргумента команды
+
+    Поддерживаемые форматы: ЧЧ:ММ[:СС] (сегодня), ГГГГ-ММ-ДД,
+    ГГГГ-ММ-ДД_ЧЧ:ММ[:СС], ГГГГ-ММ-ДДTЧЧ:ММ[:СС], ДД.ММ[.ГГГГ][_ЧЧ:ММ]
+    """
+    if now is None:
+        now = datetime.now()
+    value = value.strip().replace('T', '_')
+
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            parsed = datetime.strptime(value, fmt).time()
+            return datetime.combine(now.date(), parsed)
+        except ValueError:
+            pass
+
+    for fmt in ("%Y-%m-%d_%H:%M:%S", "%Y-%m-%d_%H:%M", "%Y-%m-%d",
+                "%d.%m.%Y_%H:%M", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+
+    # Год подставляется до разбора: 29.02 без года разбирается как 1900 год (не високосный)
+    day, _, clock = value.partition('_')
+    with_year = f"{day}.{now.year}" + (f"_{clock}" if clock else '')
+    for fmt in ("%d.%m.%Y_%H:%M", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(with_year, fmt)
+        except ValueError:
+            pass
+
+    raise ValueError(f"Некорректный формат времени: {value}")
+
+def parse_datetime_args(args, now=None):
+    """
+    Парсинг списка аргументов в моменты времени
+
+    Дата и время, переданные отдельными аргументами ("2024-05-01 09:00"),
+    объединяются в один момент.
+    """
+    result = []
+    i = 0
+    while i < len(args):
+        token = args[i]
+        if i + 1 < len(args) and re.match(r'^\d{4}-\d{2}-\d{2}$|^\d{1,2}\.\d{1,2}(\.\d{4})?$', token) \
+                and re.match(r'^\d{1,2}:\d{2}(:\d{2})?$', args[i + 1]):
+            token = f"{token}_{args[i + 1]}"
+            i += 1
+        result.append(parse_datetime(token, now))
+        i += 1
+    return result